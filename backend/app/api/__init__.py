@@ -8,6 +8,7 @@ from app.api.dmt import router as dmt_router
 from app.api.entities import router as entities_router
 from app.api.audit import router as audit_router
 from app.api.dashboard import router as dashboard_router
+from app.api.jobs import router as jobs_router
 
 api_router = APIRouter()
 
@@ -18,5 +19,6 @@ api_router.include_router(dmt_router, prefix="/dmt", tags=["DMT"])
 api_router.include_router(entities_router, prefix="/entities", tags=["Entities"])
 api_router.include_router(audit_router, prefix="/audit", tags=["Audit"])
 api_router.include_router(dashboard_router, prefix="/dashboard", tags=["Dashboard"])
+api_router.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
 
 __all__ = ["api_router"]
\ No newline at end of file
@@ -1,26 +1,61 @@
 """
 Audit API endpoints (REST)
 """
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Request
+from config import Config
 from database import get_db
 from auth.auth import get_current_user
+from repositories import AuditRepository
+from utils.json_response import FastJSONResponse
+from utils.pagination import InvalidCursorError, clamp_limit
+from utils.typed_columns import parse_date
 
 router = APIRouter()
 
 
 @router.get("")
-async def list_audit_logs(request: Request, limit: int = 100):
-    """List audit logs"""
+async def list_audit_logs(
+    request: Request,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Config.AUDIT_PAGE_SIZE,
+):
+    """
+    List audit logs, newest first, one page at a time.
+
+    - entity_type / entity_id: history of one table or one record.
+    - user_id, action (CREATE, UPDATE, DELETE, ...): exact matches.
+    - date_from / date_to: YYYY-MM-DD, inclusive.
+    - cursor: next_cursor from the previous page.
+    """
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT ?", (limit,))
-    logs = [dict(row) for row in c.fetchall()]
-    conn.close()
-    
-    return {"logs": logs}
\ No newline at end of file
+
+    try:
+        date_from, date_to = parse_date(date_from), parse_date(date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        logs, next_cursor = await get_db().run(
+            AuditRepository().query,
+            entity_type=entity_type,
+            entity_id=entity_id,
+            user_id=user_id,
+            action=action,
+            date_from=date_from,
+            date_to=date_to,
+            cursor=cursor,
+            limit=clamp_limit(limit, Config.AUDIT_PAGE_SIZE, Config.AUDIT_MAX_PAGE_SIZE),
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return FastJSONResponse({"logs": logs, "next_cursor": next_cursor})
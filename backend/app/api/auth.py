@@ -3,6 +3,7 @@ Authentication API endpoints (REST)
 """
 from fastapi import APIRouter, HTTPException, Request, status
 from pydantic import BaseModel
+from database import get_db
 from auth.auth import authenticate_user, get_current_user
 
 router = APIRouter()
@@ -21,7 +22,7 @@ class LoginResponse(BaseModel):
 @router.post("/login", response_model=LoginResponse)
 async def login(request: Request, credentials: LoginRequest):
     """Login endpoint - Returns user data"""
-    user = authenticate_user(credentials.username, credentials.password)
+    user = await get_db().run(authenticate_user, credentials.username, credentials.password)
     
     if not user:
         raise HTTPException(
@@ -29,8 +30,8 @@ async def login(request: Request, credentials: LoginRequest):
             detail="Invalid credentials"
         )
     
-    # Store user in session
-    request.session["user"] = user
+    # Sólo el id: get_current_user() lee el usuario actual en cada solicitud
+    request.session["user_id"] = user["id"]
     
     return {
         "user": user,
@@ -4,6 +4,7 @@ Dashboard API endpoints (REST)
 from fastapi import APIRouter, HTTPException, Request
 from database import get_db 
 from auth.auth import get_current_user
+from services.dashboard_stats import dashboard_stats
 router = APIRouter()
 
 
@@ -11,24 +12,13 @@ router = APIRouter()
 async def get_dashboard_stats(request: Request):
     """
     Returns key statistics and charts data for the dashboard.
-    This corrects the 404 error by defining the missing /stats path.
+    Served from an in-process snapshot of trigger-maintained aggregates.
     """
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
 
-    stats = {
-        "total_dmt": 150,
-        "open_dmt": 25,
-        "closed_dmt": 125,
-        "avg_rework_hours": 3.5,
-        "cost_of_non_conformance": 15000.00,
-        "dmt_by_failure_code": [
-            {"name": "Code A", "value": 50},
-            {"name": "Code B", "value": 30},
-            {"name": "Code C", "value": 20},
-        ],
-    }
-    
-    return stats
+    # Instantánea en memoria; solo se reconstruye cuando supera DASHBOARD_STATS_MAX_AGE.
+    # Comprobar si sigue vigente consulta SQLite, así que todo va al hilo de base de datos
+    return await get_db().run(dashboard_stats.get)
@@ -2,14 +2,21 @@
 DMT API endpoints (REST)
 """
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Request, status, Response
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
-from database import get_db
-from auth.auth import get_current_user
-from services import ExportService
+from config import Config, EntityType
+from database import fetch_dict, get_db
+from auth.auth import get_current_user, filter_assignable_users
+from repositories import DMTRepository, get_audit_writer, get_reference_cache, get_reference_codes
+from repositories.dmt_repository import dmt_changes, dmt_columns
+from repositories.reference_cache import USERS
+from utils.etag import make_etag, not_modified, set_etag
+from utils.json_response import FastJSONResponse
+from utils.pagination import InvalidCursorError, clamp_limit
+from utils.typed_columns import parse_date, typed_dmt_values
+from services import ExportService, get_report_number_allocator
+import itertools
 import uuid
-import io
 
 router = APIRouter()
 
@@ -69,52 +76,216 @@ class DMTRecordUpdate(DMTRecordBase):
 
 
 @router.get("")
-async def list_dmt_records(request: Request, search: str = ""):
-    """List all DMT records"""
+async def list_dmt_records(
+    request: Request,
+    search: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Config.PAGE_SIZE,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+):
+    """
+    List the DMT records visible to the user, one page at a time.
+
+    - fields: comma-separated columns to return (e.g. "report_number,part_num,status");
+      id and the sort column are always included. Default: every column.
+    - sort: report_number, created_at, status, part_num or shop_order, prefixed
+      with "-" for descending (default "-report_number").
+    - cursor: next_cursor from the previous page.
+
+    Send the ETag back in If-None-Match to get a 304 while nothing has changed.
+    """
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    query = "SELECT * FROM dmt_records WHERE is_active = 1"
-    params = []
-    
-    if search:
-        query += " AND (description LIKE ? OR part_num LIKE ?)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param])
-        
-    query += " ORDER BY created_at DESC"
-    
-    c.execute(query, params)
-    records = [dict(row) for row in c.fetchall()]
-    conn.close()
-    
-    return {"items": records, "total": len(records)}
+
+    # Versión de dmt_records leída antes de la consulta: un 304 no toca la base de datos.
+    # La visibilidad depende del usuario, así que id y rol forman parte del ETag.
+    # Los nombres de las columnas de referencia salen de las tablas de entidades
+    # (migración 0011), así que sus versiones también cuentan.
+    # Leer las versiones consulta SQLite: fuera del bucle de eventos, como los datos.
+    def _etag():
+        return make_etag(
+            "dmt_records",
+            db.table_versions.current("dmt_records"),
+            *get_reference_codes().versions(),
+            user["id"],
+            user["role"],
+            request.url.query,
+        )
+
+    etag = await db.run(_etag)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    repo = DMTRepository()
+    search = search if search else None
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+    def _load():
+        total, exact = repo.count(user, search=search)
+        items, next_cursor = repo.get_page(
+            user,
+            search=search,
+            cursor=cursor,
+            limit=clamp_limit(limit, Config.PAGE_SIZE, Config.MAX_PAGE_SIZE),
+            fields=field_list,
+            sort=sort,
+        )
+        return items, total, exact, next_cursor
+
+    try:
+        items, total, exact, next_cursor = await db.run(_load)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    except ValueError as e:
+        # Campo o columna de orden desconocidos
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response = FastJSONResponse({"items": items, "total": total, "total_exact": exact, "next_cursor": next_cursor})
+    set_etag(response, etag)
+    return response
+
+
+@router.get("/search")
+async def search_dmt_records(
+    request: Request,
+    q: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Config.PAGE_SIZE,
+):
+    """
+    Full-text search over description, analysis, process description,
+    engineering remarks and repair process. Best matches first, each with
+    a highlighted snippet; follow next_cursor for more results.
+    """
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    repo = DMTRepository()
+    try:
+        items, next_cursor = await get_db().run(
+            repo.search,
+            user,
+            q,
+            cursor=cursor,
+            limit=clamp_limit(limit, Config.PAGE_SIZE, Config.MAX_PAGE_SIZE),
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@router.get("/form-bootstrap")
+async def get_form_bootstrap(request: Request):
+    """
+    Everything the DMT create/edit forms need in one payload: the active
+    rows of every entity table plus the users the caller may assign to.
+    Served from the reference cache; send the ETag back in If-None-Match
+    to get a 304 while nothing has changed.
+    """
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    cache = get_reference_cache()
+    tables = [entity.value for entity in EntityType] + [USERS]
+    # Incluso con la caché cargada, comprobar si sigue vigente consulta SQLite
+    data, version = await get_db().run(cache.snapshot, tables)
+
+    # Los usuarios asignables dependen del rol, así que el rol forma parte del ETag
+    etag = make_etag(version, user["role"])
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    payload = {
+        "version": version,
+        "selectors": {entity.value: data[entity.value] for entity in EntityType},
+        "assignable_users": filter_assignable_users(data[USERS], user["role"]),
+    }
+    response = FastJSONResponse(payload)
+    set_etag(response, etag)
+    return response
+
+
+@router.get("/reports/cost-of-quality")
+async def cost_of_quality_report(
+    request: Request,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    group_by: str = "month",
+):
+    """
+    Cost of quality (scrap + other costs, rework hours) per month, day,
+    year, customer, part number, failure code or work center, for DMT
+    dates between date_from and date_to (YYYY-MM-DD, inclusive).
+    """
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    # Mismos roles que pueden exportar: el reporte no se filtra por visibilidad
+    if user["role"] not in ["Admin", "Quality Manager"]:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+    try:
+        date_from, date_to = parse_date(date_from), parse_date(date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        rows = await get_db().run(DMTRepository().cost_of_quality, date_from, date_to, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    totals = {
+        key: sum(row[key] for row in rows)
+        for key in ("records", "material_scrap_cost", "others_cost", "total_cost", "rework_hours")
+    }
+    return FastJSONResponse(
+        {"group_by": group_by, "date_from": date_from, "date_to": date_to, "rows": rows, "totals": totals}
+    )
 
 
 @router.get("/{dmt_id}")
 async def get_dmt_record(request: Request, dmt_id: str):
-    """Get a single DMT record by ID"""
+    """Get a single DMT record by ID (ETag / If-None-Match aware)"""
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
-    record = c.fetchone()
-    conn.close()
+
+    # updated_at sólo tiene resolución de segundos; el contador de la tabla es exacto
+    # y se puede comprobar sin consultar la fila
+    codes = get_reference_codes()
+    def _etag():
+        return make_etag("dmt_records", dmt_id, db.table_versions.current("dmt_records"), *codes.versions())
+
+    etag = await db.run(_etag)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    def _load(conn):
+        record = fetch_dict(conn, "SELECT * FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
+        # Códigos de las columnas de referencia -> nombres
+        return codes.decode(record, conn)
+
+    record = await db.run_read(_load)
     
     if not record:
         raise HTTPException(status_code=404, detail="DMT record not found")
         
-    return dict(record)
+    response = FastJSONResponse(record)
+    set_etag(response, etag)
+    return response
 
 
 @router.post("")
@@ -125,55 +296,67 @@ async def create_dmt_record(request: Request, data: DMTRecordCreate):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
     
     new_id = str(uuid.uuid4())
     
-    # Obtener todos los campos del modelo Pydantic
-    fields = data.model_dump()
-    
-    # 1. Obtener los nombres de campo del modelo (en un orden predecible)
-    model_field_names = list(data.model_fields.keys()) 
-    
-    # 2. Definir TODAS las columnas a insertar (incluyendo las de control)
-    keys = ["id", "status"] + model_field_names
-    
-    # 3. Definir TODOS los valores correspondientes
-    values = [new_id, "open"] + [fields.get(key) for key in model_field_names]
-    
-    # Construir la sentencia SQL de forma segura
-    placeholders = ", ".join(["?"] * len(keys))
-    column_names = ", ".join(keys)
-
+    # Obtener todos los campos del modelo Pydantic, con números y fechas ya
+    # convertidos al tipo de su columna (migración 0010)
     try:
+        fields = typed_dmt_values(data.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    # El número de reporte se asigna dentro de la misma transacción del INSERT
+    allocator = get_report_number_allocator()
+    if allocator.needs_refill:
+        await db.run(allocator.prefetch)
+    codes = get_reference_codes()
+
+    def _insert(conn):
+        c = conn.cursor()
+
+        # Columnas de referencia como códigos de diccionario (migración 0011);
+        # un valor desconocido se agrega inactivo a su tabla de entidades
+        values_by_field = codes.encode(conn, fields)
+
+        # 1. Campos del modelo que son columnas de dmt_records (los campos
+        #    extra del formulario, como title o category, no se guardan)
+        columns = dmt_columns(conn)
+        model_field_names = [name for name in data.model_fields if name in columns]
+        
+        # 2. Definir TODAS las columnas a insertar (incluyendo las de control)
+        keys = ["id", "status"] + model_field_names + ["report_number"]
+        
+        # 3. Definir TODOS los valores correspondientes
+        values = [new_id, "open"] + [values_by_field.get(key) for key in model_field_names]
+
+        # Construir la sentencia SQL de forma segura
+        placeholders = ", ".join(["?"] * len(keys))
+        column_names = ", ".join(keys)
+
         # Ejecutar la sentencia INSERT
         c.execute(
             f"INSERT INTO dmt_records ({column_names}) VALUES ({placeholders})",
-            values
+            values + [allocator.allocate(conn)]
         )
         
         # Insertar registro de auditoría
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-            ("dmt_records", new_id, "CREATE", user["id"])
-        )
-        
-        # CRÍTICO: Confirmar los cambios en la base de datos
-        conn.commit()
+        get_audit_writer().record(conn, "dmt_records", new_id, "CREATE", user["id"])
         
         # Recuperar el nuevo registro para la respuesta
         c.execute("SELECT * FROM dmt_records WHERE id = ?", (new_id,))
-        record = dict(c.fetchone())
-        conn.close()
+        return dict(c.fetchone())
+
+    try:
+        # run_write() confirma al salir y deshace ante cualquier error
+        record = await db.run_write(_insert)
+        record = await db.run(codes.decode, record)
         
         return {"item": record, "message": "DMT record created successfully"}
 
     except Exception as e:
-        # Si la inserción falla por cualquier motivo, deshacer y reportar error
+        # Si la inserción falla por cualquier motivo, reportar error
         print(f"FATAL DB ERROR during DMT creation: {e}")
-        conn.rollback() # Deshacer si hubo un fallo
-        conn.close()
         raise HTTPException(
             status_code=500, 
             detail=f"Database error: Could not create DMT record. {e}"
@@ -188,43 +371,86 @@ async def update_dmt_record(request: Request, dmt_id: str, data: DMTRecordUpdate
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
 
-    # Build the UPDATE query dynamically
-    fields = data.model_dump(exclude_unset=True)
-    set_clauses = [f"{k} = ?" for k in fields.keys()]
-    set_values = list(fields.values())
+    try:
+        fields = typed_dmt_values(data.model_dump(exclude_unset=True))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    codes = get_reference_codes()
+
+    def _update(conn):
+        # Build the UPDATE query dynamically from the fields that are dmt_records columns,
+        # reference columns as dictionary codes (migration 0011)
+        # Antes de codificar: los valores desconocidos se añadirían a las tablas de entidades
+        old = fetch_dict(conn, "SELECT * FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
+        if not old:
+            raise HTTPException(status_code=404, detail="DMT record not found or not active")
+
+        columns = dmt_columns(conn)
+        updates = codes.encode(conn, {k: v for k, v in fields.items() if k in columns})
+        if not updates:
+            raise HTTPException(status_code=400, detail="No fields provided for update")
+        set_clauses_str = ", ".join(f"{k} = ?" for k in updates)
+
+        c = conn.cursor()
+        c.execute(
+            f"UPDATE dmt_records SET {set_clauses_str}, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
+            list(updates.values()) + [dmt_id]
+        )
 
-    if not set_clauses:
-        raise HTTPException(status_code=400, detail="No fields provided for update")
+        # Retrieve the updated record for the response
+        c.execute("SELECT * FROM dmt_records WHERE id = ?", (dmt_id,))
+        record = dict(c.fetchone())
 
-    set_clauses_str = ", ".join(set_clauses)
-    
-    c.execute(
-        f"UPDATE dmt_records SET {set_clauses_str}, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
-        set_values + [dmt_id]
-    )
-    
-    if c.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="DMT record not found or not active")
+        # Sólo las columnas modificadas, para el historial del registro
+        get_audit_writer().record(conn, "dmt_records", dmt_id, "UPDATE", user["id"], dmt_changes(conn, old, record))
+        return record
 
-    c.execute(
-        "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-        ("dmt_records", dmt_id, "UPDATE", user["id"])
-    )
-    
-    conn.commit()
-    
-    # Retrieve the updated record for the response
-    c.execute("SELECT * FROM dmt_records WHERE id = ?", (dmt_id,))
-    record = dict(c.fetchone())
-    conn.close()
+    record = await db.run_write(_update)
+    record = await db.run(codes.decode, record)
     
     return {"item": record, "message": "DMT record updated successfully"}
 
 
+@router.get("/{dmt_id}/history")
+async def get_dmt_history(
+    request: Request,
+    dmt_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Config.AUDIT_PAGE_SIZE,
+):
+    """
+    Audit timeline of a DMT record, newest first, one page at a time.
+
+    Each entry has action, user_id, timestamp and changes: for updates,
+    {column: [old, new]} of the columns that changed.
+    """
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    db = get_db()
+    # Las entradas aún en el búfer del escritor de auditoría de este proceso
+    await db.run(get_audit_writer().flush)
+
+    try:
+        history = await db.run(
+            DMTRepository().history,
+            dmt_id,
+            cursor=cursor,
+            limit=clamp_limit(limit, Config.AUDIT_PAGE_SIZE, Config.AUDIT_MAX_PAGE_SIZE),
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if history is None:
+        raise HTTPException(status_code=404, detail="DMT record not found")
+
+    entries, next_cursor = history
+    return FastJSONResponse({"dmt_id": dmt_id, "history": entries, "next_cursor": next_cursor})
+
+
 @router.delete("/{dmt_id}")
 async def delete_dmt_record(request: Request, dmt_id: str):
     """Delete a DMT record (soft delete)"""
@@ -236,32 +462,27 @@ async def delete_dmt_record(request: Request, dmt_id: str):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    c.execute(
-        "UPDATE dmt_records SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
-        (dmt_id,)
-    )
-    
-    if c.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="DMT record not found or already deleted")
 
-    c.execute(
-        "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-        ("dmt_records", dmt_id, "DELETE", user["id"])
-    )
+    def _apply(conn):
+        c = conn.cursor()
+        c.execute(
+            "UPDATE dmt_records SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
+            (dmt_id,)
+        )
     
-    conn.commit()
-    conn.close()
+        if c.rowcount == 0:
+            raise HTTPException(status_code=404, detail="DMT record not found or already deleted")
+
+        get_audit_writer().record(conn, "dmt_records", dmt_id, "DELETE", user["id"])
+
+    await db.run_write(_apply)
     
     return {"message": "DMT record deleted successfully"}
 
 
 @router.get("/export/{format}")
 async def export_dmt_records(request: Request, format: str, days: Optional[int] = None):
-    """Export DMT records in JSON or CSV format"""
+    """Export DMT records in CSV, JSON, NDJSON or XLSX format"""
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -271,35 +492,18 @@ async def export_dmt_records(request: Request, format: str, days: Optional[int]
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
 
-    query = "SELECT * FROM dmt_records WHERE is_active = 1"
-    params = []
-    
-    if days is not None and days > 0:
-        # Assuming you use SQLite or a database that supports date comparisons
-        query += f" AND created_at >= date('now', '-{days} days')"
-    
-    c.execute(query, params)
-    records = [dict(row) for row in c.fetchall()]
-    conn.close()
-    
-    if not records:
+    if format not in ExportService.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid export format. Use 'csv', 'json', 'ndjson' or 'xlsx'.")
+
+    # Leer la primera fila antes de responder para poder devolver 404 si no hay registros
+    rows = DMTRepository().iter_export(days)
+    first = await db.run(next, rows, None)
+    if first is None:
         raise HTTPException(status_code=404, detail="No records found to export")
 
-    if format == "csv":
-        csv_buffer = ExportService.export_csv(records, "dmt_records")
-        return StreamingResponse(
-            io.BytesIO(csv_buffer.encode('utf-8')),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=dmt_records.csv"}
-        )
-    elif format == "json":
-        json_data = ExportService.export_json(records, "dmt_records")
-        return json_data
-    else:
-        raise HTTPException(status_code=400, detail="Invalid export format. Use 'csv' or 'json'.")
+    # Las filas se leen y se codifican en el ejecutor de la base de datos, por partes
+    return await ExportService.stream_rows(itertools.chain([first], rows), "dmt_records", format)
 
 
 @router.post("/{dmt_id}/close")
@@ -313,25 +517,20 @@ async def close_dmt(request: Request, dmt_id: str):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    c.execute(
-        "UPDATE dmt_records SET status = 'closed', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
-        (dmt_id,)
-    )
-    
-    if c.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="DMT record not found or already closed")
 
-    c.execute(
-        "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-        ("dmt_records", dmt_id, "CLOSE", user["id"])
-    )
+    def _apply(conn):
+        c = conn.cursor()
+        c.execute(
+            "UPDATE dmt_records SET status = 'closed', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
+            (dmt_id,)
+        )
     
-    conn.commit()
-    conn.close()
+        if c.rowcount == 0:
+            raise HTTPException(status_code=404, detail="DMT record not found or already closed")
+
+        get_audit_writer().record(conn, "dmt_records", dmt_id, "CLOSE", user["id"])
+
+    await db.run_write(_apply)
     
     return {"message": "DMT record closed successfully"}
 
@@ -347,103 +546,19 @@ async def reopen_dmt(request: Request, dmt_id: str):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    c.execute(
-        "UPDATE dmt_records SET status = 'open', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
-        (dmt_id,)
-    )
-    
-    if c.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="DMT record not found or already open")
 
-    c.execute(
-        "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-        ("dmt_records", dmt_id, "REOPEN", user["id"])
-    )
-    
-    conn.commit()
-    conn.close()
+    def _apply(conn):
+        c = conn.cursor()
+        c.execute(
+            "UPDATE dmt_records SET status = 'open', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
+            (dmt_id,)
+        )
     
-    return {"message": "DMT record reopened successfully"}
-
-# /app/api/dmt.py
+        if c.rowcount == 0:
+            raise HTTPException(status_code=404, detail="DMT record not found or already open")
 
-# ... (código previo)
+        get_audit_writer().record(conn, "dmt_records", dmt_id, "REOPEN", user["id"])
 
-@router.post("")
-async def create_dmt_record(request: Request, data: DMTRecordCreate):
-    """Create a new DMT record (FIXED: Robust DB INSERT logic)"""
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    new_id = str(uuid.uuid4())
+    await db.run_write(_apply)
     
-    # Lista de TODAS las columnas a insertar
-    columns = [
-        "id", "user_id", "status", "created_at", "updated_at", "is_active",
-        "work_center", "part_num", "operation", "employee_name", "qty",
-        "customer", "shop_order", "serial_number", "inspection_item", "date",
-        "prepared_by", "description", "car_type", "car_cycle", "car_second_cycle_date",
-        "process_description", "analysis", "analysis_by", 
-        "disposition", "disposition_date", "engineer", "failure_code", 
-        "rework_hours", "responsible_dept", "material_scrap_cost", "others_cost", 
-        "engineering_remarks", "repair_process", 
-        # <-- LOS NUEVOS CAMPOS DEBEN ESTAR AQUÍ
-        "title", "category", "severity", "department", "raisedBy", 
-        "assignedTo", "rootCause", "correctiveAction", "preventiveAction", "targetDate"
-    ]
-
-    # Lista de valores
-    values = [
-        new_id, user["id"], "open", datetime.now(), datetime.now(), 1,
-        data.work_center, data.part_num, data.operation, data.employee_name, data.qty,
-        data.customer, data.shop_order, data.serial_number, data.inspection_item, data.date,
-        data.prepared_by, data.description, data.car_type, data.car_cycle, data.car_second_cycle_date,
-        data.process_description, data.analysis, data.analysis_by,
-        data.disposition, data.disposition_date, data.engineer, data.failure_code, 
-        data.rework_hours, data.responsible_dept, data.material_scrap_cost, data.others_cost, 
-        data.engineering_remarks, data.repair_process, 
-        # <-- LOS VALORES DE LOS NUEVOS CAMPOS DEBEN ESTAR AQUÍ
-        data.title, data.category, data.severity, data.department, data.raisedBy, 
-        data.assignedTo, data.rootCause, data.correctiveAction, data.preventiveAction, data.targetDate
-    ]
-    
-    # Crear la declaración SQL
-    placeholders = ", ".join(["?"] * len(columns))
-    column_names = ", ".join(columns)
-    
-    try:
-        c.execute(f"INSERT INTO dmt_records ({column_names}) VALUES ({placeholders})", values)
-        
-        # Log de auditoría
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-            ("dmt_records", new_id, "CREATE", user["id"])
-        )
-        
-        conn.commit()
-        
-        # Devolver el registro creado
-        c.execute("SELECT * FROM dmt_records WHERE id = ?", (new_id,))
-        new_record = c.fetchone()
-        
-    except Exception as e:
-        conn.rollback()
-        # Mejorar el manejo de errores para reportar el problema de la base de datos
-        print(f"FATAL DB ERROR during DMT creation: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: Could not create DMT record. {e}"
-        )
-    finally:
-        conn.close()
-
-    return {"id": new_id, "message": "DMT record created successfully", "record": dict(new_record)}
\ No newline at end of file
+    return {"message": "DMT record reopened successfully"}
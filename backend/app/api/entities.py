@@ -4,10 +4,14 @@ Entities API endpoints (REST)
 from typing import Optional
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from config import EntityType
-from repositories import Repository
+from config import Config, EntityType
+from database import get_db
+from repositories import Repository, DuplicateError
 from services import ExportService
 from auth.auth import get_current_user
+from utils.etag import make_etag, not_modified, set_etag
+from utils.json_response import FastJSONResponse
+from utils.pagination import InvalidCursorError, clamp_limit
 
 router = APIRouter()
 
@@ -18,8 +22,17 @@ class EntityCreate(BaseModel):
 
 
 @router.get("/{entity}")
-async def list_entities(request: Request, entity: str, search: str = ""):
-    """List all entities of a given type"""
+async def list_entities(
+    request: Request,
+    entity: str,
+    search: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Config.PAGE_SIZE,
+):
+    """
+    List entities of a given type, newest first; follow next_cursor for more.
+    Send the ETag back in If-None-Match to get a 304 while the table is unchanged.
+    """
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -29,16 +42,44 @@ async def list_entities(request: Request, entity: str, search: str = ""):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid entity type")
     
+    # El ETag sale del contador de versiones de la tabla: un 304 no toca la base de datos.
+    # Se lee antes de la consulta para que nunca etiquete datos más viejos que él.
+    # Leer el contador consulta SQLite: fuera del bucle de eventos, como los datos.
+    db = get_db()
+    def _etag():
+        return make_etag(entity, db.table_versions.current(entity), request.url.query)
+
+    etag = await db.run(_etag)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
     repo = Repository(entity_type)
-    # CORREGIDO: Esto ahora lista correctamente las entidades para una solicitud GET
-    items, total = repo.get_all(page=1, search=search if search else None) 
-    
-    return {"items": items, "total": total}
+    search = search if search else None
+
+    def _load():
+        total, exact = repo.count(search=search)
+        items, next_cursor = repo.get_page(
+            search=search,
+            cursor=cursor,
+            limit=clamp_limit(limit, Config.PAGE_SIZE, Config.MAX_PAGE_SIZE),
+        )
+        return items, total, exact, next_cursor
+
+    try:
+        items, total, exact, next_cursor = await get_db().run(_load)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # total_exact es False cuando la búsqueda superó Config.COUNT_CAP ("1000+")
+    response = FastJSONResponse({"items": items, "total": total, "total_exact": exact, "next_cursor": next_cursor})
+    set_etag(response, etag)
+    return response
 
 
 @router.get("/{entity}/export/{format}")
 async def export_entities(request: Request, entity: str, format: str, days: Optional[int] = None):
-    """Export entities in JSON or CSV format"""
+    """Export entities in CSV, JSON, NDJSON or XLSX format"""
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -50,23 +91,9 @@ async def export_entities(request: Request, entity: str, format: str, days: Opti
     
     repo = Repository(entity_type)
     
-    # Get all items
-    total_items = []
-    page = 1
-    while True:
-        page_items, total = repo.get_all(days=days, page=page)
-        if not page_items:
-            break
-        total_items.extend(page_items)
-        # Nota: Se agregó un chequeo para evitar un loop infinito si el total es mal calculado o muy grande
-        if len(total_items) >= total: 
-            break
-        page += 1
-
-    if format == "csv":
-        return ExportService.export_csv(total_items, entity)
-    else:
-        return ExportService.export_json(total_items, entity)
+    # Filas en streaming: la memoria no crece con el tamaño de la exportación.
+    # Se leen por partes en el ejecutor de la base de datos (cuenta para su límite)
+    return await ExportService.stream_rows(repo.iter_all(days=days), entity, format)
 
 
 @router.post("/{entity}")
@@ -83,10 +110,13 @@ async def create_entity(request: Request, entity: str, data: EntityCreate):
     
     repo = Repository(entity_type)
     
-    if entity == "employees" and data.employee_number:
-        item = repo.create(data.name.strip(), employee_number=data.employee_number.strip())
-    else:
-        item = repo.create(data.name.strip())
+    try:
+        if entity == "employees" and data.employee_number:
+            item = await get_db().run(repo.create, data.name.strip(), employee_number=data.employee_number.strip())
+        else:
+            item = await get_db().run(repo.create, data.name.strip())
+    except DuplicateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     return {"item": item, "message": "Entity created successfully"}
 
@@ -105,10 +135,13 @@ async def update_entity(request: Request, entity: str, item_id: str, data: Entit
     
     repo = Repository(entity_type)
     
-    if entity == "employees" and data.employee_number is not None:
-        item = repo.update(item_id, data.name.strip(), employee_number=data.employee_number.strip())
-    else:
-        item = repo.update(item_id, data.name.strip())
+    try:
+        if entity == "employees" and data.employee_number is not None:
+            item = await get_db().run(repo.update, item_id, data.name.strip(), employee_number=data.employee_number.strip())
+        else:
+            item = await get_db().run(repo.update, item_id, data.name.strip())
+    except DuplicateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     if not item:
         raise HTTPException(status_code=404, detail="Entity not found")
@@ -130,7 +163,7 @@ async def delete_entity(request: Request, entity: str, item_id: str):
         raise HTTPException(status_code=400, detail="Invalid entity type")
     
     repo = Repository(entity_type)
-    success = repo.delete(item_id)
+    success = await get_db().run(repo.delete, item_id)
     
     if not success:
         raise HTTPException(status_code=404, detail="Entity not found")
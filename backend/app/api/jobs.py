@@ -0,0 +1,176 @@
+"""
+Background jobs API endpoints (REST)
+
+Long exports and CSV imports are submitted here and run by
+scripts/job_worker.py; clients poll GET /api/jobs/{id} and download the
+result when the job has succeeded.
+"""
+import os
+import shutil
+from typing import Dict, Optional
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile, status
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from config import EntityType
+from database import get_db
+from auth.auth import get_current_user
+from services import ExportService, get_job_queue
+from services.job_queue import FINISHED, SUCCEEDED
+from utils.json_response import FastJSONResponse
+
+router = APIRouter()
+
+# Mismos roles que /api/dmt/export
+DMT_EXPORT_ROLES = ["Admin", "Quality Manager"]
+
+# Campos internos que no se exponen al cliente
+PRIVATE_FIELDS = ("result_path", "worker_id")
+
+
+def _public(job: Dict) -> Dict:
+    job = {k: v for k, v in job.items() if k not in PRIVATE_FIELDS}
+    job["params"] = {k: v for k, v in job["params"].items() if k != "upload_path"}
+    job["result_url"] = f"/api/jobs/{job['id']}/result" if job["status"] == SUCCEEDED else None
+    return job
+
+
+def _accepted(job: Dict) -> FastJSONResponse:
+    return FastJSONResponse(
+        _public(job),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": f"/api/jobs/{job['id']}"},
+    )
+
+
+def _require_user(request: Request) -> Dict:
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+
+async def _get_job(job_id: str, user: Dict) -> Dict:
+    job = await get_db().run(get_job_queue().get, job_id)
+    # Un trabajo ajeno se trata como inexistente (salvo para Admin)
+    if not job or (job["created_by"] != user["id"] and user["role"] != "Admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _check_format(format: str):
+    if format not in ExportService.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid export format. Use 'csv', 'json', 'ndjson' or 'xlsx'.")
+
+
+def _check_entity(entity: str):
+    try:
+        EntityType(entity)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid entity type")
+
+
+@router.get("")
+async def list_jobs(request: Request, limit: int = 50):
+    """The current user's jobs, newest first"""
+    user = _require_user(request)
+    jobs = await get_db().run(get_job_queue().list, user["id"], min(max(limit, 1), 200))
+    return FastJSONResponse({"jobs": [_public(job) for job in jobs]})
+
+
+@router.get("/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """Status, progress and (once succeeded) result_url of a job"""
+    user = _require_user(request)
+    return FastJSONResponse(_public(await _get_job(job_id, user)))
+
+
+@router.get("/{job_id}/result")
+async def download_job_result(request: Request, job_id: str):
+    """Download the file produced by a succeeded job"""
+    user = _require_user(request)
+    job = await _get_job(job_id, user)
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        raise HTTPException(status_code=410, detail="Job result is no longer available")
+    return FileResponse(job["result_path"], media_type=job["media_type"], filename=job["result_name"])
+
+
+@router.delete("/{job_id}")
+async def cancel_job(request: Request, job_id: str):
+    """Cancel a queued or running job"""
+    user = _require_user(request)
+    job = await _get_job(job_id, user)
+    if job["status"] in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    cancelled = await get_db().run(get_job_queue().cancel, job_id)
+    if not cancelled:
+        raise HTTPException(status_code=409, detail="Job has already finished")
+    return FastJSONResponse(_public(cancelled))
+
+
+@router.post("/exports/dmt/{format}")
+async def submit_dmt_export(request: Request, format: str, days: Optional[int] = None):
+    """Queue an export of the DMT records (same rules as /api/dmt/export/{format})"""
+    user = _require_user(request)
+    if user["role"] not in DMT_EXPORT_ROLES:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    _check_format(format)
+
+    job = await get_db().run(
+        get_job_queue().enqueue, "export_dmt", {"format": format, "days": days}, user["id"]
+    )
+    return _accepted(job)
+
+
+@router.post("/exports/entities/{entity}/{format}")
+async def submit_entity_export(request: Request, entity: str, format: str, days: Optional[int] = None):
+    """Queue an export of an entity table"""
+    user = _require_user(request)
+    _check_entity(entity)
+    _check_format(format)
+
+    job = await get_db().run(
+        get_job_queue().enqueue, "export_entities", {"entity": entity, "format": format, "days": days}, user["id"]
+    )
+    return _accepted(job)
+
+
+async def queue_csv_import(file: UploadFile, entity: str, user_id: str) -> Dict:
+    """
+    Save an uploaded CSV next to the job files and queue its import_csv job.
+    Also used by the HTMX upload form (app/entities/routes.py).
+    """
+    queue = get_job_queue()
+    job_id = queue.new_id()
+    upload_path = queue.artifact_path(job_id, ".upload.csv")
+
+    def _save():
+        with open(upload_path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+
+    # Guardar el archivo fuera del event loop; el worker lo lee después
+    await run_in_threadpool(_save)
+    try:
+        job = await get_db().run(
+            queue.enqueue,
+            "import_csv",
+            {"entity": entity, "upload_path": upload_path, "filename": file.filename},
+            user_id,
+            job_id=job_id,
+        )
+    except Exception:
+        os.remove(upload_path)
+        raise
+    return job
+
+
+@router.post("/imports/{entity}")
+async def submit_csv_import(request: Request, entity: str, file: UploadFile = File(...)):
+    """Queue a CSV import; the per-row results become the job's result file"""
+    user = _require_user(request)
+    _check_entity(entity)
+    if not (file.filename or "").lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Please upload a CSV file")
+
+    return _accepted(await queue_csv_import(file, entity, user["id"]))
@@ -4,7 +4,9 @@ Users API endpoints (REST)
 from typing import List
 from fastapi import APIRouter, HTTPException, Request, status
 from pydantic import BaseModel
+from database import get_db
 from auth.auth import get_current_user, require_admin, create_user, get_all_users, get_user_by_id, update_user, delete_user, activate_user, UserRole
+from auth.sessions import get_session_store
 
 router = APIRouter()
 
@@ -29,7 +31,7 @@ async def list_users(request: Request):
     except:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = get_all_users()
+    users = await get_db().run(get_all_users)
     return {"users": users}
 
 
@@ -42,7 +44,7 @@ async def create_user_endpoint(request: Request, data: UserCreate):
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        user = create_user(data.username, data.password, UserRole(data.role))
+        user = await get_db().run(create_user, data.username, data.password, UserRole(data.role))
         return {"user": user, "message": "User created successfully"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -57,7 +59,8 @@ async def update_user_endpoint(request: Request, user_id: str, data: UserUpdate)
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        success = update_user(
+        success = await get_db().run(
+            update_user,
             user_id,
             username=data.username,
             password=data.password if data.password else None,
@@ -80,13 +83,25 @@ async def delete_user_endpoint(request: Request, user_id: str):
     except:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    success = delete_user(user_id)
+    success = await get_db().run(delete_user, user_id)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     
     return {"message": "User deleted successfully"}
 
 
+@router.delete("/{user_id}/sessions")
+async def revoke_user_sessions(request: Request, user_id: str):
+    """Sign a user out everywhere (Admin only)"""
+    try:
+        require_admin(request)
+    except:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    revoked = await get_db().run(get_session_store().revoke_user, user_id)
+    return {"revoked": revoked, "message": "User sessions revoked"}
+
+
 @router.post("/{user_id}/activate")
 async def activate_user_endpoint(request: Request, user_id: str):
     """Activate a user (Admin only)"""
@@ -95,7 +110,7 @@ async def activate_user_endpoint(request: Request, user_id: str):
     except:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    success = activate_user(user_id)
+    success = await get_db().run(activate_user, user_id)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     
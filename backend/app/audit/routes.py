@@ -4,8 +4,10 @@ Audit log routes
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from config import Config
 from database import get_db
 from auth.auth import get_current_user
+from repositories import AuditRepository
 
 router = APIRouter()
 templates = Jinja2Templates(directory="jinja_templates")
@@ -20,13 +22,7 @@ async def audit_log(request: Request):
             from fastapi.responses import RedirectResponse
             return RedirectResponse(url="/auth/login", status_code=302)
         
-        db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT 100")
-        logs = [dict(row) for row in c.fetchall()]
-        conn.close()
+        logs, _ = await get_db().run(AuditRepository().query, limit=Config.AUDIT_PAGE_SIZE)
 
         return templates.TemplateResponse("audit_page.html", {
             "request": request,
@@ -6,9 +6,16 @@ from fastapi import APIRouter, Form, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from config import EntityType
-from database import get_db
-from services import ExportService
-from auth.auth import get_current_user, get_all_users, get_assignable_users
+from database import fetch_dict, get_db
+from repositories import DMTRepository, get_audit_writer, get_reference_cache, get_reference_codes
+from repositories.dmt_repository import dmt_changes
+from repositories.reference_cache import USERS
+from repositories.counts import format_count, maintained_count
+from services import ExportService, get_report_number_allocator
+from services.dashboard_stats import dashboard_stats
+from utils.pagination import InvalidCursorError
+from utils.typed_columns import typed_dmt_values
+from auth.auth import get_current_user, get_all_users, get_assignable_users, filter_assignable_users
 import uuid
 
 router = APIRouter()
@@ -21,26 +28,28 @@ def render_toast(message: str, type: str = "success") -> str:
     return templates.get_template("components/toast.html").render(message=message, color=color)
 
 
-def get_next_report_number() -> int:
-    """Get the next report number and increment the counter"""
-    try:
-        db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("SELECT next_number FROM report_counter WHERE id = 1")
-        result = c.fetchone()
-        next_number = result[0] if result else 1000
-        
-        c.execute("UPDATE report_counter SET next_number = ? WHERE id = 1", (next_number + 1,))
-        conn.commit()
-        conn.close()
-        
-        return next_number
-    except Exception as e:
-        print(f"Error getting next report number: {e}")
-        import time
-        return 1000 + int(time.time() % 10000)
+SELECTOR_ENTITIES = {
+    "workcenters": EntityType.WORKCENTERS,
+    "partnumbers": EntityType.PARTNUMBERS,
+    "employees": EntityType.EMPLOYEES,
+    "customers": EntityType.CUSTOMERS,
+    "inspection_items": EntityType.INSPECTION_ITEMS,
+    "prepared_by": EntityType.PREPARED_BY,
+    "car_types": EntityType.CAR_TYPES,
+    "dispositions": EntityType.DISPOSITIONS,
+    "failure_codes": EntityType.FAILURE_CODES,
+}
+
+
+async def load_form_selectors(user_role: str):
+    """Selector options and assignable users for the DMT form, from the reference cache"""
+    cache = get_reference_cache()
+    tables = [entity.value for entity in SELECTOR_ENTITIES.values()] + [USERS]
+    # Even a loaded cache polls SQLite to check it is current: DB thread
+    data, _ = await get_db().run(cache.snapshot, tables)
+
+    selectors = {key: data[entity.value] for key, entity in SELECTOR_ENTITIES.items()}
+    return selectors, filter_assignable_users(data[USERS], user_role)
 
 
 def get_workflow_permissions(user_role: str, workflow_status: str, record_status: str, created_by: str = None, current_user_id: str = None):
@@ -110,10 +119,6 @@ async def dmt_dashboard(request: Request):
             return RedirectResponse(url="/auth/login", status_code=302)
         
         db = get_db()
-        conn = db.get_connection()
-        c = db.get_connection().cursor()
-
-        stats = {}
         dmt_entities = [
             EntityType.WORKCENTERS,
             EntityType.CUSTOMERS,
@@ -123,36 +128,34 @@ async def dmt_dashboard(request: Request):
             EntityType.DISPOSITIONS,
             EntityType.FAILURE_CODES,
         ]
-        
-        for entity in dmt_entities:
-            try:
-                c.execute(f"SELECT COUNT(*) as count FROM {entity.value} WHERE is_active = 1")
-                stats[entity.value] = c.fetchone()[0]
-            except Exception as e:
-                print(f"Error getting stats for {entity.value}: {e}")
-                stats[entity.value] = 0
 
-        c.execute("SELECT COUNT(*) as count FROM dmt_records WHERE is_active = 1")
-        stats["dmt_records"] = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) as count FROM dmt_records WHERE status = 'open' AND is_active = 1")
-        stats["open_dmts"] = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) as count FROM dmt_records WHERE status = 'closed' AND is_active = 1")
-        stats["closed_dmts"] = c.fetchone()[0]
+        # Counts come from the shared in-process snapshot (bounded staleness);
+        # checking that it is still fresh polls SQLite, so it runs in a DB thread
+        snapshot = await db.run(dashboard_stats.get)
+
+        stats = {entity.value: snapshot["entities"].get(entity.value, 0) for entity in dmt_entities}
+        stats["dmt_records"] = snapshot["total_dmt"]
+        stats["open_dmts"] = snapshot["open_dmt"]
+        stats["closed_dmts"] = snapshot["closed_dmt"]
+        stats["avg_rework_hours"] = snapshot["avg_rework_hours"]
+        stats["cost_of_non_conformance"] = snapshot["cost_of_non_conformance"]
+        stats["dmt_by_failure_code"] = snapshot["dmt_by_failure_code"]
+        
+        def _load(conn):
+            c = conn.cursor()
+
+            if user["role"] in ["Admin", "Inspector", "Supervisor"]:
+                c.execute("SELECT * FROM dmt_records WHERE is_active = 1 ORDER BY created_at DESC LIMIT 10")
+            else:
+                c.execute("""
+                    SELECT * FROM dmt_records 
+                    WHERE is_active = 1 AND (created_by = ? OR assigned_to = ?)
+                    ORDER BY created_at DESC LIMIT 10
+                """, (user["id"], user["id"]))
+            
+            return get_reference_codes().decode_rows([dict(row) for row in c.fetchall()], conn)
 
-        if user["role"] in ["Admin", "Inspector", "Supervisor"]:
-            c.execute("SELECT * FROM dmt_records WHERE is_active = 1 ORDER BY created_at DESC LIMIT 10")
-        else:
-            c.execute("""
-                SELECT * FROM dmt_records 
-                WHERE is_active = 1 AND (created_by = ? OR assigned_to = ?)
-                ORDER BY created_at DESC LIMIT 10
-            """, (user["id"], user["id"]))
-        
-        recent_dmts = [dict(row) for row in c.fetchall()]
-        
-        conn.close()
+        recent_dmts = await db.run_read(_load)
 
         return templates.TemplateResponse("dmt/dashboard.html", {
             "request": request,
@@ -166,99 +169,68 @@ async def dmt_dashboard(request: Request):
 
 
 @router.get("/records", response_class=HTMLResponse)
-async def dmt_records_list(request: Request, page: int = 1, search: str = ""):
-    """List all DMT records with pagination and search"""
+async def dmt_records_list(request: Request, page: int = 1, search: str = "", cursor: str = ""):
+    """
+    List DMT records with search. Pages follow ``next_cursor``;
+    ``page`` is only the page label shown by the template.
+    """
     user = get_current_user(request)
     if not user:
         return RedirectResponse(url="/auth/login", status_code=302)
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
+    repo = DMTRepository()
 
-    where_clause = "WHERE is_active = 1"
-    params = []
-    
-    # Admin, Inspector, and Supervisor can see all uploaded DMTs
-    if user["role"] in ["Admin", "Inspector", "Supervisor"]:
-        where_clause += " AND (is_session = 0 OR (is_session = 1 AND created_by = ?))"
-        params.append(user["id"])
-    else:
-        # Others can only see their own sessions and assigned/created uploaded DMTs
-        where_clause += " AND ((is_session = 0 AND (created_by = ? OR assigned_to = ?)) OR (is_session = 1 AND created_by = ?))"
-        params.extend([user["id"], user["id"], user["id"]])
-    
-    if search:
-        where_clause += " AND (report_number LIKE ? OR part_num LIKE ? OR shop_order LIKE ? OR status LIKE ?)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param, search_param, search_param])
-
-    c.execute(f"SELECT COUNT(*) as count FROM dmt_records {where_clause}", params)
-    total = c.fetchone()[0]
-
-    offset = (page - 1) * 20
-    c.execute(
-        f"SELECT * FROM dmt_records {where_clause} ORDER BY report_number DESC LIMIT 20 OFFSET ?",
-        params + [offset]
-    )
-    records = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
+    def _load():
+        total, exact = repo.count(user, search=search or None)
+        records, next_cursor = repo.get_page(user, search=search or None, cursor=cursor or None)
+        return records, total, format_count(total, exact), next_cursor
+
+    try:
+        records, total, total_display, next_cursor = await db.run(_load)
+    except InvalidCursorError:
+        return render_toast("Invalid page cursor", "error")
 
     return templates.TemplateResponse("dmt/list.html", {
         "request": request,
         "records": records,
         "total": total,
+        "total_display": total_display,
         "page": page,
         "search": search,
+        "next_cursor": next_cursor,
         "user": user
     })
 
 
 @router.get("/records/items", response_class=HTMLResponse)
-async def get_dmt_records_items(request: Request, page: int = 1, search: str = ""):
-    """Get paginated DMT records for HTMX updates"""
+async def get_dmt_records_items(request: Request, page: int = 1, search: str = "", cursor: str = ""):
+    """Get a page of DMT records (by cursor) for HTMX updates"""
     user = get_current_user(request)
     if not user:
         return RedirectResponse(url="/auth/login", status_code=302)
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
+    repo = DMTRepository()
 
-    where_clause = "WHERE is_active = 1"
-    params = []
-    
-    if user["role"] in ["Admin", "Inspector", "Supervisor"]:
-        where_clause += " AND (is_session = 0 OR (is_session = 1 AND created_by = ?))"
-        params.append(user["id"])
-    else:
-        where_clause += " AND ((is_session = 0 AND (created_by = ? OR assigned_to = ?)) OR (is_session = 1 AND created_by = ?))"
-        params.extend([user["id"], user["id"], user["id"]])
-    
-    if search:
-        where_clause += " AND (report_number LIKE ? OR part_num LIKE ? OR shop_order LIKE ? OR status LIKE ?)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param, search_param, search_param])
-
-    c.execute(f"SELECT COUNT(*) as count FROM dmt_records {where_clause}", params)
-    total = c.fetchone()[0]
-
-    offset = (page - 1) * 20
-    c.execute(
-        f"SELECT * FROM dmt_records {where_clause} ORDER BY report_number DESC LIMIT 20 OFFSET ?",
-        params + [offset]
-    )
-    records = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
+    def _load():
+        total, exact = repo.count(user, search=search or None)
+        records, next_cursor = repo.get_page(user, search=search or None, cursor=cursor or None)
+        return records, total, format_count(total, exact), next_cursor
+
+    try:
+        records, total, total_display, next_cursor = await db.run(_load)
+    except InvalidCursorError:
+        return render_toast("Invalid page cursor", "error")
 
     return templates.TemplateResponse("dmt/records_list.html", {
         "request": request,
         "records": records,
         "total": total,
+        "total_display": total_display,
         "page": page,
         "search": search,
+        "next_cursor": next_cursor,
         "user": user
     })
 
@@ -270,30 +242,7 @@ async def dmt_create_form(request: Request):
     if not user:
         return RedirectResponse(url="/auth/login", status_code=302)
     
-    db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-
-    selectors = {}
-    selector_entities = {
-        "workcenters": EntityType.WORKCENTERS,
-        "partnumbers": EntityType.PARTNUMBERS,
-        "employees": EntityType.EMPLOYEES,
-        "customers": EntityType.CUSTOMERS,
-        "inspection_items": EntityType.INSPECTION_ITEMS,
-        "prepared_by": EntityType.PREPARED_BY,
-        "car_types": EntityType.CAR_TYPES,
-        "dispositions": EntityType.DISPOSITIONS,
-        "failure_codes": EntityType.FAILURE_CODES,
-    }
-    
-    for key, entity in selector_entities.items():
-        c.execute(f"SELECT id, name FROM {entity.value} WHERE is_active = 1 ORDER BY name")
-        selectors[key] = [dict(row) for row in c.fetchall()]
-    
-    assignable_users = get_assignable_users(user["role"])
-    
-    conn.close()
+    selectors, assignable_users = await load_form_selectors(user["role"])
 
     permissions = get_workflow_permissions(user["role"], "draft", "open")
 
@@ -383,50 +332,68 @@ async def create_dmt_record(
                     status_code=303
                 )
         
+        # Numbers and dates in their column types (migration 0010); an invalid
+        # value raises ValueError and is shown as the form error
+        typed = typed_dmt_values({
+            "qty": qty, "date": date, "disposition_date": disposition_date,
+            "rework_hours": rework_hours, "material_scrap_cost": material_scrap_cost,
+            "others_cost": others_cost,
+        })
+        qty, date, disposition_date = typed["qty"], typed["date"], typed["disposition_date"]
+        rework_hours = typed["rework_hours"]
+        material_scrap_cost, others_cost = typed["material_scrap_cost"], typed["others_cost"]
+
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
 
         dmt_id = str(uuid.uuid4())[:8].upper()
-        report_number = get_next_report_number()
+        allocator = get_report_number_allocator()
+        if allocator.needs_refill:
+            await db.run(allocator.prefetch)
         
         is_session = 1 if save_as_session == "true" else 0
-        
-        print(f"[v0] Creating DMT record: id={dmt_id}, report_number={report_number}, is_session={is_session}")
-        
-        c.execute("""
-            INSERT INTO dmt_records (
-                id, report_number, 
-                work_center, part_num, operation, employee_name, qty, customer,
-                shop_order, serial_number, inspection_item, date, prepared_by,
-                description, car_type, car_cycle, car_second_cycle_date,
+        codes = get_reference_codes()
+        
+        def _insert(conn):
+            # Claimed in the same transaction as the insert
+            report_number = allocator.allocate(conn)
+            # Reference columns as dictionary codes (migration 0011)
+            refs = codes.encode(conn, {
+                "work_center": work_center, "part_num": part_num, "customer": customer,
+                "inspection_item": inspection_item, "prepared_by": prepared_by, "car_type": car_type,
+                "disposition": disposition, "failure_code": failure_code,
+            })
+            print(f"[v0] Creating DMT record: id={dmt_id}, report_number={report_number}, is_session={is_session}")
+
+            c = conn.cursor()
+            c.execute("""
+                INSERT INTO dmt_records (
+                    id, report_number, 
+                    work_center, part_num, operation, employee_name, qty, customer,
+                    shop_order, serial_number, inspection_item, date, prepared_by,
+                    description, car_type, car_cycle, car_second_cycle_date,
+                    process_description, analysis, analysis_by,
+                    disposition, disposition_date, engineer, failure_code, rework_hours,
+                    responsible_dept, material_scrap_cost, others_cost, engineering_remarks,
+                    repair_process, 
+                    status, workflow_status, 
+                    created_by, assigned_to, is_session
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                dmt_id, report_number, 
+                refs["work_center"], refs["part_num"], operation, employee_name, qty, refs["customer"],
+                shop_order, serial_number, refs["inspection_item"], date, refs["prepared_by"],
+                description, refs["car_type"], car_cycle, car_second_cycle_date,
                 process_description, analysis, analysis_by,
-                disposition, disposition_date, engineer, failure_code, rework_hours,
+                refs["disposition"], disposition_date, engineer, refs["failure_code"], rework_hours,
                 responsible_dept, material_scrap_cost, others_cost, engineering_remarks,
                 repair_process, 
-                status, workflow_status, 
-                created_by, assigned_to, is_session
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            dmt_id, report_number, 
-            work_center, part_num, operation, employee_name, qty, customer,
-            shop_order, serial_number, inspection_item, date, prepared_by,
-            description, car_type, car_cycle, car_second_cycle_date,
-            process_description, analysis, analysis_by,
-            disposition, disposition_date, engineer, failure_code, rework_hours,
-            responsible_dept, material_scrap_cost, others_cost, engineering_remarks,
-            repair_process, 
-            'open', 'draft', 
-            user["id"], assigned_to, is_session
-        ))
+                'open', 'draft', 
+                user["id"], assigned_to, is_session
+            ))
 
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-            ("dmt_records", dmt_id, "CREATE", user["id"])
-        )
+            get_audit_writer().record(conn, "dmt_records", dmt_id, "CREATE", user["id"])
 
-        conn.commit()
-        conn.close()
+        await db.run_write(_insert)
 
         print(f"[v0] DMT record created successfully")
         
@@ -446,38 +413,16 @@ async def dmt_edit_form(dmt_id: str, request: Request):
         return RedirectResponse(url="/auth/login", status_code=302)
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
+    def _load(conn):
+        row = conn.execute("SELECT * FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,)).fetchone()
+        return get_reference_codes().decode(dict(row), conn) if row else None
 
-    c.execute("SELECT * FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
-    record = c.fetchone()
+    record = await db.run_read(_load)
     
     if not record:
-        conn.close()
         return render_toast("DMT record not found", "error")
 
-    record = dict(record)
-
-    selectors = {}
-    selector_entities = {
-        "workcenters": EntityType.WORKCENTERS,
-        "partnumbers": EntityType.PARTNUMBERS,
-        "employees": EntityType.EMPLOYEES,
-        "customers": EntityType.CUSTOMERS,
-        "inspection_items": EntityType.INSPECTION_ITEMS,
-        "prepared_by": EntityType.PREPARED_BY,
-        "car_types": EntityType.CAR_TYPES,
-        "dispositions": EntityType.DISPOSITIONS,
-        "failure_codes": EntityType.FAILURE_CODES,
-    }
-    
-    for key, entity in selector_entities.items():
-        c.execute(f"SELECT id, name FROM {entity.value} WHERE is_active = 1 ORDER BY name")
-        selectors[key] = [dict(row) for row in c.fetchall()]
-    
-    assignable_users = get_assignable_users(user["role"])
-    
-    conn.close()
+    selectors, assignable_users = await load_form_selectors(user["role"])
 
     permissions = get_workflow_permissions(
         user["role"], 
@@ -539,7 +484,7 @@ async def update_dmt_record(
             return RedirectResponse(url="/auth/login", status_code=303)
         
         if assigned_to:
-            assignable_users = get_assignable_users(user["role"])
+            assignable_users = await get_db().run(get_assignable_users, user["role"])
             assignable_ids = [u["id"] for u in assignable_users]
             
             if assigned_to not in assignable_ids:
@@ -585,42 +530,64 @@ async def update_dmt_record(
                     status_code=303
                 )
         
+        # Numbers and dates in their column types (migration 0010); an invalid
+        # value raises ValueError and is shown as the form error
+        typed = typed_dmt_values({
+            "qty": qty, "date": date, "disposition_date": disposition_date,
+            "rework_hours": rework_hours, "material_scrap_cost": material_scrap_cost,
+            "others_cost": others_cost,
+        })
+        qty, date, disposition_date = typed["qty"], typed["date"], typed["disposition_date"]
+        rework_hours = typed["rework_hours"]
+        material_scrap_cost, others_cost = typed["material_scrap_cost"], typed["others_cost"]
+
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
 
         is_session = 1 if save_as_session == "true" else 0
         
         print(f"[v0] Updating DMT record: id={dmt_id}, is_session={is_session}")
+        codes = get_reference_codes()
+
+        def _update(conn):
+            old = fetch_dict(conn, "SELECT * FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
+            if not old:
+                # Before encoding: unknown values would become entity rows
+                return False
+            # Reference columns as dictionary codes (migration 0011)
+            refs = codes.encode(conn, {
+                "work_center": work_center, "part_num": part_num, "customer": customer,
+                "inspection_item": inspection_item, "prepared_by": prepared_by, "car_type": car_type,
+                "disposition": disposition, "failure_code": failure_code,
+            })
+            c = conn.cursor()
+            c.execute("""
+                UPDATE dmt_records SET
+                    work_center = ?, part_num = ?, operation = ?, employee_name = ?, qty = ?,
+                    customer = ?, shop_order = ?, serial_number = ?, inspection_item = ?,
+                    date = ?, prepared_by = ?, description = ?, car_type = ?, car_cycle = ?,
+                    car_second_cycle_date = ?, process_description = ?, analysis = ?,
+                    analysis_by = ?, disposition = ?, disposition_date = ?, engineer = ?,
+                    failure_code = ?, rework_hours = ?, responsible_dept = ?,
+                    material_scrap_cost = ?, others_cost = ?, engineering_remarks = ?,
+                    repair_process = ?, status = ?, assigned_to = ?, is_session = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND is_active = 1
+            """, (
+                refs["work_center"], refs["part_num"], operation, employee_name, qty, refs["customer"],
+                shop_order, serial_number, refs["inspection_item"], date, refs["prepared_by"],
+                description, refs["car_type"], car_cycle, car_second_cycle_date,
+                process_description, analysis, analysis_by,
+                refs["disposition"], disposition_date, engineer, refs["failure_code"], rework_hours,
+                responsible_dept, material_scrap_cost, others_cost, engineering_remarks,
+                repair_process, status, assigned_to, is_session, dmt_id
+            ))
 
-        c.execute("""
-            UPDATE dmt_records SET
-                work_center = ?, part_num = ?, operation = ?, employee_name = ?, qty = ?,
-                customer = ?, shop_order = ?, serial_number = ?, inspection_item = ?,
-                date = ?, prepared_by = ?, description = ?, car_type = ?, car_cycle = ?,
-                car_second_cycle_date = ?, process_description = ?, analysis = ?,
-                analysis_by = ?, disposition = ?, disposition_date = ?, engineer = ?,
-                failure_code = ?, rework_hours = ?, responsible_dept = ?,
-                material_scrap_cost = ?, others_cost = ?, engineering_remarks = ?,
-                repair_process = ?, status = ?, assigned_to = ?, is_session = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ? AND is_active = 1
-        """, (
-            work_center, part_num, operation, employee_name, qty, customer,
-            shop_order, serial_number, inspection_item, date, prepared_by,
-            description, car_type, car_cycle, car_second_cycle_date,
-            process_description, analysis, analysis_by,
-            disposition, disposition_date, engineer, failure_code, rework_hours,
-            responsible_dept, material_scrap_cost, others_cost, engineering_remarks,
-            repair_process, status, assigned_to, is_session, dmt_id
-        ))
-
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-            ("dmt_records", dmt_id, "UPDATE", user["id"])
-        )
+            # Changed columns only, for the record's history
+            new = fetch_dict(conn, "SELECT * FROM dmt_records WHERE id = ?", (dmt_id,))
+            get_audit_writer().record(conn, "dmt_records", dmt_id, "UPDATE", user["id"], dmt_changes(conn, old, new))
+            return True
 
-        conn.commit()
-        conn.close()
+        if not await db.run_write(_update):
+            return render_toast("DMT record not found", "error")
 
         print(f"[v0] DMT record updated successfully")
         
@@ -640,33 +607,25 @@ async def delete_dmt_record(dmt_id: str, request: Request):
         return render_toast("Please log in to delete DMT records", "error")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
 
-    c.execute(
-        "UPDATE dmt_records SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-        (dmt_id,)
-    )
+    def _delete(conn):
+        c = conn.cursor()
+        c.execute(
+            "UPDATE dmt_records SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (dmt_id,)
+        )
 
-    c.execute(
-        "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-        ("dmt_records", dmt_id, "DELETE", user["id"])
-    )
+        get_audit_writer().record(conn, "dmt_records", dmt_id, "DELETE", user["id"])
 
-    conn.commit()
-    conn.close()
+    def _query(conn):
+        c = conn.cursor()
+        total = maintained_count(conn, "dmt_records")
 
-    db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    c.execute("SELECT COUNT(*) as count FROM dmt_records WHERE is_active = 1")
-    total = c.fetchone()[0]
-    
-    c.execute("SELECT * FROM dmt_records WHERE is_active = 1 ORDER BY created_at DESC LIMIT 20")
-    records = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
+        c.execute("SELECT * FROM dmt_records WHERE is_active = 1 ORDER BY created_at DESC LIMIT 20")
+        return total, get_reference_codes().decode_rows([dict(row) for row in c.fetchall()], conn)
+
+    await db.run_write(_delete)
+    total, records = await db.run_read(_query)
 
     html = templates.get_template("dmt/records_list.html").render(
         request=request,
@@ -681,15 +640,13 @@ async def delete_dmt_record(dmt_id: str, request: Request):
 
 @router.get("/export/{format}")
 async def export_dmt_records(format: str, request: Request, days: Optional[int] = None):
-    """Export DMT records in JSON or CSV format"""
+    """Export DMT records in CSV, JSON, NDJSON or XLSX format"""
     try:
         user = get_current_user(request)
         if not user:
             return render_toast("Please log in to export DMT records", "error")
         
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
 
         where_clause = "WHERE is_active = 1"
         params = []
@@ -707,17 +664,13 @@ async def export_dmt_records(format: str, request: Request, days: Optional[int]
             where_clause += " AND created_at >= datetime('now', '-' || ? || ' days')"
             params.append(days)
 
-        c.execute(f"SELECT * FROM dmt_records {where_clause} ORDER BY created_at DESC", params)
-        records = [dict(row) for row in c.fetchall()]
-        
-        conn.close()
+        records = get_reference_codes().iter_decoded(
+            db.iter_rows(f"SELECT * FROM dmt_records {where_clause} ORDER BY created_at DESC", params)
+        )
 
-        print(f"[v0] Exporting {len(records)} DMT records (format: {format}, days: {days})")
+        print(f"[v0] Exporting DMT records (format: {format}, days: {days})")
 
-        if format == "csv":
-            return ExportService.export_csv(records, "dmt_records")
-        else:
-            return ExportService.export_json(records, "dmt_records")
+        return await ExportService.stream_rows(records, "dmt_records", format)
     except Exception as e:
         print(f"[v0] Error exporting DMT records: {e}")
         import traceback
@@ -734,55 +687,51 @@ async def advance_workflow(dmt_id: str, request: Request):
             return render_toast("Please log in", "error")
         
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("SELECT workflow_status, status FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
-        result = c.fetchone()
-        
-        if not result:
-            conn.close()
-            return render_toast("DMT record not found", "error")
-        
-        current_workflow = result[0]
-        current_status = result[1]
+
+        def _advance(conn):
+            c = conn.cursor()
+            c.execute("SELECT workflow_status, status FROM dmt_records WHERE id = ? AND is_active = 1", (dmt_id,))
+            result = c.fetchone()
         
-        if current_status == "closed":
-            conn.close()
-            return render_toast("Cannot advance closed record", "error")
+            if not result:
+                return None, "DMT record not found"
         
-        workflow_transitions = {
-            "draft": ("supervisor_review", "supervisor_completed_at"),
-            "supervisor_review": ("manager_review", "manager_completed_at"),
-            "manager_review": ("engineer_review", None),
-            "engineer_review": ("completed", "engineer_completed_at")
-        }
+            current_workflow = result[0]
+            current_status = result[1]
         
-        if current_workflow not in workflow_transitions:
-            conn.close()
-            return render_toast("Invalid workflow status", "error")
+            if current_status == "closed":
+                return None, "Cannot advance closed record"
         
-        next_workflow, timestamp_field = workflow_transitions[current_workflow]
+            workflow_transitions = {
+                "draft": ("supervisor_review", "supervisor_completed_at"),
+                "supervisor_review": ("manager_review", "manager_completed_at"),
+                "manager_review": ("engineer_review", None),
+                "engineer_review": ("completed", "engineer_completed_at")
+            }
         
-        if timestamp_field:
-            c.execute(
-                f"UPDATE dmt_records SET workflow_status = ?, {timestamp_field} = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (next_workflow, dmt_id)
-            )
-        else:
-            c.execute(
-                "UPDATE dmt_records SET workflow_status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (next_workflow, dmt_id)
-            )
+            if current_workflow not in workflow_transitions:
+                return None, "Invalid workflow status"
         
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id, changes) VALUES (?, ?, ?, ?, ?)",
-            ("dmt_records", dmt_id, "WORKFLOW_ADVANCE", user["id"], f"Advanced from {current_workflow} to {next_workflow}")
-        )
+            next_workflow, timestamp_field = workflow_transitions[current_workflow]
         
-        conn.commit()
-        conn.close()
+            if timestamp_field:
+                c.execute(
+                    f"UPDATE dmt_records SET workflow_status = ?, {timestamp_field} = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (next_workflow, dmt_id)
+                )
+            else:
+                c.execute(
+                    "UPDATE dmt_records SET workflow_status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (next_workflow, dmt_id)
+                )
         
+            get_audit_writer().record(conn, "dmt_records", dmt_id, "WORKFLOW_ADVANCE", user["id"], f"Advanced from {current_workflow} to {next_workflow}")
+            return next_workflow, None
+
+        next_workflow, error = await db.run_write(_advance)
+        if error:
+            return render_toast(error, "error")
+
         html = f'<div hx-get="/dmt/edit/{dmt_id}" hx-target="#main-content" hx-trigger="load"></div>'
         html += render_toast(f"Workflow advanced to {next_workflow.replace('_', ' ').title()}", "success")
         return html
@@ -803,22 +752,18 @@ async def close_dmt(dmt_id: str, request: Request):
             return render_toast("Only Engineers, Inspectors, and Admins can close DMT records", "error")
         
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute(
-            "UPDATE dmt_records SET status = 'closed', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
-            (dmt_id,)
-        )
-        
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-            ("dmt_records", dmt_id, "CLOSE", user["id"])
-        )
-        
-        conn.commit()
-        conn.close()
+
+        def _apply(conn):
+            c = conn.cursor()
+            c.execute(
+                "UPDATE dmt_records SET status = 'closed', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
+                (dmt_id,)
+            )
         
+            get_audit_writer().record(conn, "dmt_records", dmt_id, "CLOSE", user["id"])
+
+        await db.run_write(_apply)
+
         return RedirectResponse(url="/dmt/records?success=DMT record closed successfully", status_code=303)
     except Exception as e:
         print(f"[v0] Error closing DMT: {e}")
@@ -837,22 +782,18 @@ async def reopen_dmt(dmt_id: str, request: Request):
             return render_toast("Only Admins and Inspectors can reopen DMT records", "error")
         
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute(
-            "UPDATE dmt_records SET status = 'open', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
-            (dmt_id,)
-        )
-        
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, user_id) VALUES (?, ?, ?, ?)",
-            ("dmt_records", dmt_id, "REOPEN", user["id"])
-        )
-        
-        conn.commit()
-        conn.close()
+
+        def _apply(conn):
+            c = conn.cursor()
+            c.execute(
+                "UPDATE dmt_records SET status = 'open', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_active = 1",
+                (dmt_id,)
+            )
         
+            get_audit_writer().record(conn, "dmt_records", dmt_id, "REOPEN", user["id"])
+
+        await db.run_write(_apply)
+
         return RedirectResponse(url=f"/dmt/edit/{dmt_id}?success=DMT record reopened successfully", status_code=303)
     except Exception as e:
         print(f"[v0] Error reopening DMT: {e}")
@@ -868,25 +809,25 @@ async def search_employees(request: Request, q: str = ""):
             return ""
         
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
         
         search_param = f"%{q}%"
-        c.execute("""
-            SELECT id, name, employee_number 
-            FROM employees 
-            WHERE is_active = 1 
-            AND (
-                CAST(id AS TEXT) LIKE ? 
-                OR name LIKE ? 
-                OR employee_number LIKE ?
-            )
-            ORDER BY name 
-            LIMIT 10
-        """, (search_param, search_param, search_param))
+        def _search(conn):
+            c = conn.execute("""
+                SELECT id, name, employee_number 
+                FROM employees 
+                WHERE is_active = 1 
+                AND (
+                    CAST(id AS TEXT) LIKE ? 
+                    OR name LIKE ? 
+                    OR employee_number LIKE ?
+                )
+                ORDER BY name 
+                LIMIT 10
+            """, (search_param, search_param, search_param))
         
-        employees = [dict(row) for row in c.fetchall()]
-        conn.close()
+            return [dict(row) for row in c.fetchall()]
+
+        employees = await db.run_read(_search)
         
         if not employees:
             return '<div class="px-4 py-2 text-gray-500 text-sm">No employees found</div>'
@@ -1,12 +1,15 @@
+from html import escape as html_escape
 from typing import Optional
 from fastapi import APIRouter, Form, Request, UploadFile, File
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from config import EntityType, Config
-from repositories import Repository
+from database import get_db
+from repositories import Repository, DuplicateError
 from services import ExportService
-from services.csv_import_service import CSVImportService
+from app.api.jobs import queue_csv_import
 from utils import get_entity_info
+from auth.auth import get_current_user
 
 router = APIRouter()
 templates = Jinja2Templates(directory="jinja_templates")
@@ -22,7 +25,7 @@ def render_toast(message: str, type: str = "success") -> str:
 async def entity_page(entity: str, request: Request):
     """Render an entity management page"""
     repo = Repository(EntityType(entity))
-    items, total = repo.get_all(page=1)
+    items, total = await get_db().run(repo.get_all, page=1)
     info = get_entity_info(entity)
     
     total_pages = (total + Config.PAGE_SIZE - 1) // Config.PAGE_SIZE
@@ -42,7 +45,7 @@ async def entity_page(entity: str, request: Request):
 async def get_items(entity: str, request: Request, page: int = 1, search: str = ""):
     """Get paginated and filtered items"""
     repo = Repository(EntityType(entity))
-    items, total = repo.get_all(page=page, search=search if search else None)
+    items, total = await get_db().run(repo.get_all, page=page, search=search if search else None)
     info = get_entity_info(entity)
     
     total_pages = (total + Config.PAGE_SIZE - 1) // Config.PAGE_SIZE
@@ -68,12 +71,15 @@ async def create_item(
     """Create a new item"""
     repo = Repository(EntityType(entity))
     
-    if entity == "employees" and employee_number:
-        repo.create(name.strip(), employee_number=employee_number.strip())
-    else:
-        repo.create(name.strip())
-
-    items, total = repo.get_all(page=1)
+    try:
+        if entity == "employees" and employee_number:
+            await get_db().run(repo.create, name.strip(), employee_number=employee_number.strip())
+        else:
+            await get_db().run(repo.create, name.strip())
+    except DuplicateError as e:
+        return render_toast(html_escape(str(e)), "error")
+
+    items, total = await get_db().run(repo.get_all, page=1)
     info = get_entity_info(entity)
     
     total_pages = (total + Config.PAGE_SIZE - 1) // Config.PAGE_SIZE
@@ -97,66 +103,32 @@ async def upload_csv(
     request: Request,
     file: UploadFile = File(...)
 ):
-    """Upload and import CSV file"""
+    """Upload a CSV file and queue its import"""
     # Validate file type
     if not file.filename.endswith('.csv'):
         return render_toast("Please upload a CSV file", "error")
-    
+
+    user = get_current_user(request)
+    if not user:
+        return render_toast("Please log in to import CSV files", "error")
+
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Parse CSV
-        items, parse_errors = CSVImportService.parse_csv(content, entity)
-        
-        if parse_errors:
-            error_msg = "<br>".join(parse_errors[:5])  # Show first 5 errors
-            if len(parse_errors) > 5:
-                error_msg += f"<br>...and {len(parse_errors) - 5} more errors"
-            return render_toast(f"CSV parsing errors:<br>{error_msg}", "error")
-        
-        if not items:
-            return render_toast("No valid items found in CSV", "error")
-        
-        # Import items
-        success, skipped, import_errors = CSVImportService.import_items(items, entity)
-        
-        # Refresh items list
-        repo = Repository(EntityType(entity))
-        items_list, total = repo.get_all(page=1)
-        info = get_entity_info(entity)
-        
-        total_pages = (total + Config.PAGE_SIZE - 1) // Config.PAGE_SIZE
-        html = templates.get_template("components/items_list.html").render(
-            request=request,
-            items=items_list,
-            total=total,
-            entity=entity,
-            page=1,
-            search="",
-            info=info,
-            total_pages=total_pages
-        )
-        
-        # Build success message
-        msg = f"✓ Imported {success} items"
-        if skipped > 0:
-            msg += f", skipped {skipped} duplicates"
-        if import_errors:
-            msg += f"<br>⚠ {len(import_errors)} errors occurred"
-        
-        html += render_toast(msg, "success" if not import_errors else "info")
-        return html
-    
+        # A large file would hold a database thread and the writer for the
+        # whole import: the job worker runs it (services/jobs.py import_csv)
+        job = await queue_csv_import(file, EntityType(entity).value, user["id"])
     except Exception as e:
-        return render_toast(f"Upload failed: {str(e)}", "error")
+        return render_toast(f"Upload failed: {html_escape(str(e))}", "error")
+
+    return render_toast(
+        f"Import queued as job {job['id']}; follow its progress at /api/jobs/{job['id']}", "info"
+    )
 
 
 @router.get("/{entity}/edit/{item_id}", response_class=HTMLResponse)
 async def edit_form(entity: str, item_id: str, request: Request):
     """Render edit form for an item"""
     repo = Repository(EntityType(entity))
-    item = repo.get_by_id(item_id)
+    item = await get_db().run(repo.get_by_id, item_id)
 
     if not item:
         return render_toast("Item not found", "error")
@@ -183,15 +155,18 @@ async def update_item(
     """Update an existing item"""
     repo = Repository(EntityType(entity))
     
-    if entity == "employees" and employee_number is not None:
-        updated = repo.update(item_id, name.strip(), employee_number=employee_number.strip())
-    else:
-        updated = repo.update(item_id, name.strip())
+    try:
+        if entity == "employees" and employee_number is not None:
+            updated = await get_db().run(repo.update, item_id, name.strip(), employee_number=employee_number.strip())
+        else:
+            updated = await get_db().run(repo.update, item_id, name.strip())
+    except DuplicateError as e:
+        return render_toast(html_escape(str(e)), "error")
 
     if not updated:
         return render_toast("Item not found", "error")
 
-    items, total = repo.get_all(page=1)
+    items, total = await get_db().run(repo.get_all, page=1)
     info = get_entity_info(entity)
     
     total_pages = (total + Config.PAGE_SIZE - 1) // Config.PAGE_SIZE
@@ -214,12 +189,12 @@ async def update_item(
 async def delete_item(entity: str, item_id: str, request: Request):
     """Delete an item"""
     repo = Repository(EntityType(entity))
-    success = repo.delete(item_id)
+    success = await get_db().run(repo.delete, item_id)
 
     if not success:
         return render_toast("Item not found", "error")
 
-    items, total = repo.get_all(page=1)
+    items, total = await get_db().run(repo.get_all, page=1)
     info = get_entity_info(entity)
     
     total_pages = (total + Config.PAGE_SIZE - 1) // Config.PAGE_SIZE
@@ -239,39 +214,7 @@ async def delete_item(entity: str, item_id: str, request: Request):
 
 @router.get("/{entity}/export/{format}")
 async def export_data(entity: str, format: str, days: Optional[int] = None):
-    """Export entity data in JSON or CSV format"""
+    """Export entity data in CSV, JSON, NDJSON or XLSX format"""
     repo = Repository(EntityType(entity))
     
-    # Get all items without pagination when exporting
-    if days:
-        items, _ = repo.get_all(days=days, page=1)
-        # Get all pages if there are more items
-        total_items = []
-        page = 1
-        while True:
-            page_items, total = repo.get_all(days=days, page=page)
-            if not page_items:
-                break
-            total_items.extend(page_items)
-            if len(total_items) >= total:
-                break
-            page += 1
-        items = total_items
-    else:
-        # Get all items without date filter
-        total_items = []
-        page = 1
-        while True:
-            page_items, total = repo.get_all(page=page)
-            if not page_items:
-                break
-            total_items.extend(page_items)
-            if len(total_items) >= total:
-                break
-            page += 1
-        items = total_items
-
-    if format == "csv":
-        return ExportService.export_csv(items, entity)
-    else:
-        return ExportService.export_json(items, entity)
+    return await ExportService.stream_rows(repo.iter_all(days=days), entity, format)
@@ -5,6 +5,7 @@ import sqlite3
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from app.models.schemas import DMTRecordCreate, DMTRecordUpdate
+from services.report_number_allocator import get_report_number_allocator
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,31 +17,9 @@ class DMTService:
     def __init__(self, db_connection):
         self.conn = db_connection
     
-    def _generate_report_number(self) -> str:
-        """Generate next report number starting from 1000"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT report_number FROM dmt_records 
-                WHERE report_number LIKE 'RPT-%'
-                ORDER BY id DESC LIMIT 1
-            """)
-            row = cursor.fetchone()
-            
-            if row and row[0]:
-                # Extract number from RPT-XXXX format
-                try:
-                    last_num = int(row[0].split('-')[1])
-                    next_num = last_num + 1
-                except (IndexError, ValueError):
-                    next_num = 1000
-            else:
-                next_num = 1000
-            
-            return f"RPT-{next_num:04d}"
-        except sqlite3.Error as e:
-            logger.error(f"Error generating report number: {e}")
-            return f"RPT-1000"
+    def _generate_report_number(self) -> int:
+        """Claim the next report number in the current transaction"""
+        return get_report_number_allocator().allocate(self.conn)
     
     def get_record_by_id(self, record_id: int) -> Optional[Dict[str, Any]]:
         """Get DMT record by ID"""
@@ -9,6 +9,8 @@ from enum import Enum
 from typing import Optional
 from fastapi import Request, HTTPException, status
 from database.connection import get_db
+from repositories.reference_cache import USERS, get_reference_cache
+from .sessions import get_session_store
 
 
 class UserRole(str, Enum):
@@ -31,35 +33,23 @@ ROLE_HIERARCHY = {
 }
 
 
+def filter_assignable_users(users: list, current_user_role: str) -> list:
+    """Keep the users whose role is equal or higher than current_user_role"""
+    current_role_level = ROLE_HIERARCHY.get(current_user_role, 0)
+    return [
+        user for user in users
+        if ROLE_HIERARCHY.get(user["role"], 0) >= current_role_level
+    ]
+
+
 def get_assignable_users(current_user_role: str) -> list:
     """
     Get users that can be assigned to based on role hierarchy.
     Users can only assign to roles equal or higher than their own.
     """
     try:
-        current_role_level = ROLE_HIERARCHY.get(current_user_role, 0)
-        
-        db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT id, username, role, is_active
-            FROM users
-            WHERE is_active = 1
-            ORDER BY username
-        """)
-        
-        all_users = [dict(row) for row in c.fetchall()]
-        conn.close()
-        
-        # Filter users based on role hierarchy
-        assignable_users = [
-            user for user in all_users
-            if ROLE_HIERARCHY.get(user["role"], 0) >= current_role_level
-        ]
-        
-        return assignable_users
+        # Active users come from the reference cache (no query in the common case)
+        return filter_assignable_users(get_reference_cache().get(USERS), current_user_role)
     except Exception as e:
         print(f"Error getting assignable users: {e}")
         return []
@@ -91,18 +81,17 @@ def create_user(username: str, password: str, role: UserRole) -> dict:
         raise ValueError("Password must be at least 6 characters long")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
     
     user_id = str(uuid.uuid4())
     password_hash = hash_password(password)
     
     try:
-        c.execute("""
-            INSERT INTO users (id, username, password_hash, role)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, username, password_hash, role.value))
-        conn.commit()
+        with db.write() as conn:
+            conn.execute("""
+                INSERT INTO users (id, username, password_hash, role)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, username, password_hash, role.value))
+        get_reference_cache().invalidate(USERS)
         
         return {
             "id": user_id,
@@ -114,8 +103,6 @@ def create_user(username: str, password: str, role: UserRole) -> dict:
     except Exception as e:
         print(f"Error creating user: {e}")
         raise ValueError(f"Failed to create user: {str(e)}")
-    finally:
-        conn.close()
 
 
 def authenticate_user(username: str, password: str) -> Optional[dict]:
@@ -125,17 +112,12 @@ def authenticate_user(username: str, password: str) -> Optional[dict]:
     
     try:
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT id, username, password_hash, role, is_active
-            FROM users
-            WHERE username = ? AND is_active = 1
-        """, (username,))
-        
-        user = c.fetchone()
-        conn.close()
+        with db.read() as conn:
+            user = conn.execute("""
+                SELECT id, username, password_hash, role, is_active
+                FROM users
+                WHERE username = ? AND is_active = 1
+            """, (username,)).fetchone()
         
         if user and verify_password(password, user["password_hash"]):
             return {
@@ -149,9 +131,40 @@ def authenticate_user(username: str, password: str) -> Optional[dict]:
         return None
 
 
+# Active users by id, rebuilt whenever the reference cache reloads them
+_users_by_id = (None, {})
+
+
+def get_active_user(user_id: str) -> Optional[dict]:
+    """
+    The active user ``user_id`` (id, username, role) as of now, or None.
+    Reads through the reference cache, which may query the database: run
+    it off the event loop (ServerSessionMiddleware does, once per request).
+    """
+    global _users_by_id
+    users = get_reference_cache().get(USERS)
+    if _users_by_id[0] is not users:
+        _users_by_id = (users, {
+            user["id"]: {"id": user["id"], "username": user["username"], "role": user["role"]}
+            for user in users
+        })
+    user = _users_by_id[1].get(user_id)
+    return dict(user) if user else None
+
+
 def get_current_user(request: Request) -> Optional[dict]:
-    """Get the current logged-in user from session"""
-    return request.session.get("user")
+    """
+    Get the current logged-in user (id, username, role). The session only
+    holds the user id; ServerSessionMiddleware resolves it when the request
+    starts, so role changes apply right away and deactivated users are
+    logged out.
+    """
+    user_id = request.session.get("user_id")
+    user = getattr(request.state, "user", None)
+    # None as well right after a login or logout within this request
+    if not user_id or not user or user["id"] != user_id:
+        return None
+    return dict(user)
 
 
 def require_admin(request: Request) -> dict:
@@ -174,12 +187,8 @@ def create_default_admin():
     """Create default admin user if no users exist"""
     try:
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("SELECT COUNT(*) as count FROM users")
-        count = c.fetchone()["count"]
-        conn.close()
+        with db.read() as conn:
+            count = conn.execute("SELECT COUNT(*) as count FROM users").fetchone()["count"]
         
         if count == 0:
             create_user("admin", "admin123", UserRole.ADMIN)
@@ -192,17 +201,13 @@ def get_all_users():
     """Get all users"""
     try:
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT id, username, role, is_active, created_at, updated_at
-            FROM users
-            ORDER BY created_at DESC
-        """)
-        
-        users = [dict(row) for row in c.fetchall()]
-        conn.close()
+        with db.read() as conn:
+            c = conn.execute("""
+                SELECT id, username, role, is_active, created_at, updated_at
+                FROM users
+                ORDER BY created_at DESC
+            """)
+            users = [dict(row) for row in c.fetchall()]
         return users
     except Exception as e:
         print(f"Error getting all users: {e}")
@@ -216,17 +221,12 @@ def get_user_by_id(user_id: str) -> Optional[dict]:
     
     try:
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT id, username, role, is_active, created_at, updated_at
-            FROM users
-            WHERE id = ?
-        """, (user_id,))
-        
-        user = c.fetchone()
-        conn.close()
+        with db.read() as conn:
+            user = conn.execute("""
+                SELECT id, username, role, is_active, created_at, updated_at
+                FROM users
+                WHERE id = ?
+            """, (user_id,)).fetchone()
         
         return dict(user) if user else None
     except Exception as e:
@@ -243,8 +243,6 @@ def update_user(user_id: str, username: str = None, password: str = None, role:
         raise ValueError("Password must be at least 6 characters long")
     
     db = get_db()
-    conn = db.get_connection()
-    c = conn.cursor()
     
     updates = []
     params = []
@@ -262,28 +260,29 @@ def update_user(user_id: str, username: str = None, password: str = None, role:
         params.append(role.value)
     
     if not updates:
-        conn.close()
         return False
     
     updates.append("updated_at = CURRENT_TIMESTAMP")
     params.append(user_id)
     
     try:
-        c.execute(f"""
-            UPDATE users
-            SET {', '.join(updates)}
-            WHERE id = ?
-        """, params)
-        conn.commit()
-        success = c.rowcount > 0
+        with db.write() as conn:
+            c = conn.execute(f"""
+                UPDATE users
+                SET {', '.join(updates)}
+                WHERE id = ?
+            """, params)
+            success = c.rowcount > 0
+        get_reference_cache().invalidate(USERS)
+        if success and password:
+            # A new password signs the user out everywhere
+            get_session_store().revoke_user(user_id)
     except sqlite3.IntegrityError:
         print(f"Error: Username already exists")
         success = False
     except Exception as e:
         print(f"Error updating user: {e}")
         success = False
-    finally:
-        conn.close()
     
     return success
 
@@ -295,18 +294,16 @@ def delete_user(user_id: str) -> bool:
     
     try:
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("""
-            UPDATE users
-            SET is_active = 0, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (user_id,))
-        
-        conn.commit()
-        success = c.rowcount > 0
-        conn.close()
+        with db.write() as conn:
+            c = conn.execute("""
+                UPDATE users
+                SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (user_id,))
+            success = c.rowcount > 0
+        get_reference_cache().invalidate(USERS)
+        if success:
+            get_session_store().revoke_user(user_id)
         
         return success
     except Exception as e:
@@ -321,18 +318,14 @@ def activate_user(user_id: str) -> bool:
     
     try:
         db = get_db()
-        conn = db.get_connection()
-        c = conn.cursor()
-        
-        c.execute("""
-            UPDATE users
-            SET is_active = 1, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (user_id,))
-        
-        conn.commit()
-        success = c.rowcount > 0
-        conn.close()
+        with db.write() as conn:
+            c = conn.execute("""
+                UPDATE users
+                SET is_active = 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (user_id,))
+            success = c.rowcount > 0
+        get_reference_cache().invalidate(USERS)
         
         return success
     except Exception as e:
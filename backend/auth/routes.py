@@ -5,6 +5,7 @@ from fastapi import APIRouter, Form, Request, Response, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
+from database import get_db
 from auth.auth import (
     authenticate_user,
     get_current_user,
@@ -49,10 +50,10 @@ async def login(
         if not username or not password:
             return render_toast("Username and password are required", "error")
         
-        user = authenticate_user(username, password)
+        user = await get_db().run(authenticate_user, username, password)
         
         if user:
-            request.session["user"] = user
+            request.session["user_id"] = user["id"]
             return '<div hx-get="/" hx-target="body" hx-push-url="true" hx-trigger="load"></div>'
         
         return render_toast("Invalid username or password", "error")
@@ -76,7 +77,7 @@ async def admin_users_page(request: Request):
     except:
         return RedirectResponse(url="/login", status_code=302)
     
-    users = get_all_users()
+    users = await get_db().run(get_all_users)
     
     return templates.TemplateResponse("auth/admin_users.html", {
         "request": request,
@@ -120,7 +121,7 @@ async def create_user_handler(
         if not username or not password or not role:
             return render_toast("All fields are required", "error")
         
-        user = create_user(username, password, UserRole(role))
+        user = await get_db().run(create_user, username, password, UserRole(role))
         html = '<div hx-get="/auth/admin/users" hx-target="#main-content" hx-trigger="load"></div>'
         html += render_toast(f"User {username} created successfully!", "success")
         return html
@@ -139,7 +140,7 @@ async def edit_user_form(request: Request, user_id: str):
     except:
         return render_toast("Admin access required", "error")
     
-    user = get_user_by_id(user_id)
+    user = await get_db().run(get_user_by_id, user_id)
     if not user:
         return render_toast("User not found", "error")
     
@@ -171,7 +172,8 @@ async def update_user_handler(
         if not username or not role:
             return render_toast("Username and role are required", "error")
         
-        success = update_user(
+        success = await get_db().run(
+            update_user,
             user_id,
             username=username,
             password=password if password else None,
@@ -199,10 +201,10 @@ async def delete_user_handler(request: Request, user_id: str):
     except:
         return render_toast("Admin access required", "error")
     
-    success = delete_user(user_id)
+    success = await get_db().run(delete_user, user_id)
     
     if success:
-        users = get_all_users()
+        users = await get_db().run(get_all_users)
         html = templates.get_template("auth/users_list.html").render(
             request=request,
             users=users,
@@ -222,10 +224,10 @@ async def activate_user_handler(request: Request, user_id: str):
     except:
         return render_toast("Admin access required", "error")
     
-    success = activate_user(user_id)
+    success = await get_db().run(activate_user, user_id)
     
     if success:
-        users = get_all_users()
+        users = await get_db().run(get_all_users)
         html = templates.get_template("auth/users_list.html").render(
             request=request,
             users=users,
@@ -0,0 +1,338 @@
+"""
+Server-side sessions: opaque cookie ids, a process-local LRU and a SQLite table
+"""
+import hashlib
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from config import Config
+from database import TableVersions, get_db
+
+# table_versions counter bumped whenever sessions are deleted (migration 0015)
+REVOCATIONS = "session_revocations"
+
+
+def _key(session_id: str) -> str:
+    # Stored and cached under a hash, never the cookie value itself
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+class _Session:
+    __slots__ = ("user_id", "data", "expires_at")
+
+    def __init__(self, user_id: Optional[str], data: Dict, expires_at: float):
+        self.user_id = user_id
+        self.data = data
+        self.expires_at = expires_at
+
+
+class MemorySessionStore:
+    """
+    Sessions held in a process-local LRU of ``max_entries``.
+
+    A session expires ``max_age`` seconds after its last use (sliding
+    expiry); the new expiry is recorded at most every ``touch_interval``
+    seconds, so most requests are a dictionary lookup and nothing else.
+    ``data["user_id"]`` names the user a session belongs to, for
+    revoke_user().
+
+    On its own this store suits a single process: sessions are lost on a
+    restart or once evicted. SQLiteSessionStore puts a table behind it.
+    """
+
+    def __init__(
+        self,
+        max_age: int = Config.SESSION_MAX_AGE,
+        max_entries: int = Config.SESSION_CACHE_SIZE,
+        touch_interval: int = Config.SESSION_TOUCH_INTERVAL,
+    ):
+        self.max_age = max_age
+        self.max_entries = max(1, max_entries)
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+
+    def _cached(self, key: str) -> Optional[_Session]:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if session.expires_at <= time.time():
+                # Possibly extended by another process; the table knows
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return session
+
+    def _remember(self, key: str, session: _Session):
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def _forget(self, matches: Callable[[str, _Session], bool]) -> int:
+        with self._lock:
+            keys = [key for key, session in self._sessions.items() if matches(key, session)]
+            for key in keys:
+                del self._sessions[key]
+        return len(keys)
+
+    def clear_cache(self):
+        """Drop every cached session (they are read again on their next use)"""
+        with self._lock:
+            self._sessions.clear()
+
+    def _fetch(self, key: str) -> Optional[_Session]:
+        return None
+
+    def _store(self, key: str, session: _Session):
+        pass
+
+    def _extend(self, key: str, expires_at: float):
+        pass
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        """A copy of the session's data, or None for an unknown or expired id"""
+        key = _key(session_id)
+        session = self._cached(key)
+        if session is None:
+            session = self._fetch(key)
+            if session is not None:
+                self._remember(key, session)
+        return dict(session.data) if session is not None else None
+
+    def save(self, session_id: Optional[str], data: Dict) -> str:
+        """Store ``data`` under session_id (a new random id when None); returns the id"""
+        session_id = session_id or secrets.token_urlsafe(32)
+        key = _key(session_id)
+        session = _Session(data.get("user_id"), dict(data), time.time() + self.max_age)
+        self._store(key, session)
+        self._remember(key, session)
+        return session_id
+
+    def touch_due(self, session_id: str) -> bool:
+        """Whether the session's expiry has moved enough to be recorded again"""
+        session = self._cached(_key(session_id))
+        return session is not None and time.time() + self.max_age - session.expires_at >= self.touch_interval
+
+    def touch(self, session_id: str):
+        """Push the session's expiry to ``max_age`` seconds from now"""
+        key = _key(session_id)
+        session = self._cached(key)
+        if session is not None:
+            expires_at = time.time() + self.max_age
+            self._extend(key, expires_at)
+            session.expires_at = expires_at
+
+    def delete(self, session_id: str):
+        """End one session (logout)"""
+        key = _key(session_id)
+        self._forget(lambda k, _: k == key)
+
+    def revoke_user(self, user_id: str) -> int:
+        """End every session of a user; returns how many there were"""
+        return self._forget(lambda _, session: session.user_id == user_id)
+
+    def sweep(self) -> int:
+        """Remove expired sessions; returns how many"""
+        now = time.time()
+        return self._forget(lambda _, session: session.expires_at <= now)
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """
+    MemorySessionStore backed by the sessions table (migration 0015), so
+    sessions are shared by every worker and survive restarts. The LRU only
+    saves the table read: a cache miss reads the session's row.
+
+    Deleting sessions bumps the session_revocations table_versions counter;
+    every process empties its cache when it sees the bump, so a logout or a
+    revocation takes effect everywhere on the next request.
+    """
+
+    def __init__(self, table_versions: Optional[TableVersions] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.table_versions = table_versions
+        if table_versions is not None:
+            table_versions.subscribe(self._on_tables_changed)
+
+    def _on_tables_changed(self, tables: Set[str]):
+        if REVOCATIONS in tables:
+            self.clear_cache()
+
+    def _fetch(self, key: str) -> Optional[_Session]:
+        with get_db().read() as conn:
+            row = conn.execute(
+                "SELECT user_id, data, expires_at FROM sessions WHERE id = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return _Session(row["user_id"], json.loads(row["data"]), row["expires_at"]) if row else None
+
+    def _store(self, key: str, session: _Session):
+        with get_db().write() as conn:
+            conn.execute(
+                """
+                INSERT INTO sessions (id, user_id, data, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    user_id = excluded.user_id, data = excluded.data, expires_at = excluded.expires_at
+                """,
+                (key, session.user_id, json.dumps(session.data), session.expires_at),
+            )
+
+    def _extend(self, key: str, expires_at: float):
+        with get_db().write() as conn:
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, key))
+
+    @staticmethod
+    def _revoked(conn):
+        conn.execute("UPDATE table_versions SET version = version + 1 WHERE table_name = ?", (REVOCATIONS,))
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        if self.table_versions is not None:
+            # Revocations by other processes
+            self.table_versions.poll()
+        return super().load(session_id)
+
+    def delete(self, session_id: str):
+        super().delete(session_id)
+        with get_db().write() as conn:
+            if conn.execute("DELETE FROM sessions WHERE id = ?", (_key(session_id),)).rowcount:
+                self._revoked(conn)
+
+    def revoke_user(self, user_id: str) -> int:
+        super().revoke_user(user_id)
+        with get_db().write() as conn:
+            revoked = conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+            if revoked:
+                self._revoked(conn)
+        return revoked
+
+    def sweep(self, batch_size: int = 1000) -> int:
+        # Expired sessions are refused anyway; nothing to revoke
+        super().sweep()
+        swept = 0
+        while True:
+            with get_db().write() as conn:
+                deleted = conn.execute(
+                    "DELETE FROM sessions WHERE id IN "
+                    "(SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                    (time.time(), batch_size),
+                ).rowcount
+            swept += deleted
+            if deleted < batch_size:
+                return swept
+
+
+class ServerSessionMiddleware:
+    """
+    Stand-in for Starlette's SessionMiddleware: request.session is still a
+    dict, but the cookie only carries an opaque session id and the data
+    stays in a session store. A session is created once something is put
+    in request.session and ended when it is cleared; a change of
+    ``user_id`` (signing in) always starts a new id.
+
+    With a ``user_loader``, the session's user is resolved once per request
+    in a database thread and kept in request.state.user. Requests without
+    a session cookie do not touch the database.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: Optional[MemorySessionStore] = None,
+        cookie_name: str = Config.SESSION_COOKIE_NAME,
+        max_age: int = Config.SESSION_MAX_AGE,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = Config.SESSION_HTTPS_ONLY,
+        user_loader: Optional[Callable[[str], Optional[Dict]]] = None,
+    ):
+        self.app = app
+        self.store = store
+        self.user_loader = user_loader
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.flags = f"path={path}; HttpOnly; SameSite={same_site}" + ("; Secure" if https_only else "")
+
+    def _cookie(self, session_id: Optional[str]) -> str:
+        if session_id is None:
+            return f"{self.cookie_name}=null; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.flags}"
+        return f"{self.cookie_name}={session_id}; Max-Age={self.max_age}; {self.flags}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        store = self.store or get_session_store()
+        db = get_db()
+        session_id = HTTPConnection(scope).cookies.get(self.cookie_name)
+        def start():
+            # Both may read the database (table_versions polls, cache
+            # misses), so they run in a database thread, not on the loop
+            data = store.load(session_id)
+            user_id = (data or {}).get("user_id")
+            user = self.user_loader(user_id) if self.user_loader and user_id else None
+            return data, user
+
+        # No cookie, nothing to load: /health and static files never queue
+        # for a database thread
+        initial, user = await db.run(start) if session_id else (None, None)
+        scope["session"] = dict(initial or {})
+        if self.user_loader is not None:
+            scope.setdefault("state", {})["user"] = user
+
+        async def commit() -> Optional[str]:
+            data = scope["session"]
+            if not data:
+                if initial is not None:
+                    await db.run(store.delete, session_id)
+                # Also clears the cookie of an expired or revoked session
+                return self._cookie(None) if session_id else None
+            if initial is None or data.get("user_id") != initial.get("user_id"):
+                if initial is not None:
+                    await db.run(store.delete, session_id)
+                return self._cookie(await db.run(store.save, None, data))
+            if data != initial:
+                await db.run(store.save, session_id, data)
+                return self._cookie(session_id)
+            if store.touch_due(session_id):
+                await db.run(store.touch, session_id)
+                return self._cookie(session_id)
+            return None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                cookie = await commit()
+                if cookie:
+                    MutableHeaders(scope=message).append("Set-Cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+_session_store: Optional[MemorySessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> MemorySessionStore:
+    """Get the process-wide session store (Config.SESSION_BACKEND)"""
+    global _session_store
+    if _session_store is None:
+        with _store_lock:
+            if _session_store is None:
+                if Config.SESSION_BACKEND == "memory":
+                    _session_store = MemorySessionStore()
+                elif Config.SESSION_BACKEND == "sqlite":
+                    _session_store = SQLiteSessionStore(table_versions=get_db().table_versions)
+                else:
+                    raise ValueError(
+                        f"Unknown session backend {Config.SESSION_BACKEND!r}; use 'sqlite' or 'memory'"
+                    )
+    return _session_store
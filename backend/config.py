@@ -13,9 +13,87 @@ class Config:
     # Database
     DATABASE_PATH: str = os.getenv("DATABASE_PATH", "qms.db")
 
+    # Connection pool (WAL mode: many readers, one writer)
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+    DB_WRITE_POOL_SIZE: int = int(os.getenv("DB_WRITE_POOL_SIZE", "1"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", "20000"))
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+
+    # Schema migrations: how long a starting worker waits for another to finish migrating
+    DB_MIGRATION_LOCK_TIMEOUT: float = float(os.getenv("DB_MIGRATION_LOCK_TIMEOUT", "300"))
+
+    # Async database access (thread pool dedicated to SQLite calls)
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+    DB_EXECUTOR_QUEUE_DEPTH: int = int(os.getenv("DB_EXECUTOR_QUEUE_DEPTH", "64"))
+
     # Pagination
     PAGE_SIZE: int = int(os.getenv("PAGE_SIZE", "20"))
     MAX_PAGE_SIZE: int = 100
+    # Filtered list totals stop counting here and are shown as "1000+"
+    COUNT_CAP: int = int(os.getenv("COUNT_CAP", "1000"))
+
+    # DMT report numbers: >1 lets each worker reserve a block (hi/lo) instead of
+    # claiming every number from the shared counter
+    REPORT_NUMBER_BLOCK_SIZE: int = int(os.getenv("REPORT_NUMBER_BLOCK_SIZE", "1"))
+
+    # Dashboard: seconds a stats snapshot may be served before it is rebuilt
+    DASHBOARD_STATS_MAX_AGE: float = float(os.getenv("DASHBOARD_STATS_MAX_AGE", "5"))
+
+    # Form selectors: safety-net lifetime of cached reference data; writes
+    # from any worker invalidate it on the next request (table_versions)
+    REFERENCE_CACHE_MAX_AGE: float = float(os.getenv("REFERENCE_CACHE_MAX_AGE", "60"))
+
+    # Exports: rows fetched from SQLite per round trip while streaming
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+    # Background jobs (services/job_queue.py), run by scripts/job_worker.py
+    JOB_ARTIFACTS_DIR: str = os.getenv("JOB_ARTIFACTS_DIR", "job_artifacts")
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # Seconds before the first retry; doubled for every further attempt
+    JOB_RETRY_DELAY: float = float(os.getenv("JOB_RETRY_DELAY", "10"))
+    # A running job without a heartbeat for this long is handed to another worker
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+    # Finished jobs and their files are deleted after this many days
+    JOB_RETENTION_DAYS: int = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+    # Audit log: months kept in audit_log itself (1 = the current month);
+    # older months are moved to audit_log_YYYY_MM partitions by the job
+    # workers, AUDIT_PARTITION_BATCH_SIZE rows per transaction. 0 disables it
+    AUDIT_HOT_MONTHS: int = int(os.getenv("AUDIT_HOT_MONTHS", "1"))
+    AUDIT_PARTITION_BATCH_SIZE: int = int(os.getenv("AUDIT_PARTITION_BATCH_SIZE", "5000"))
+    # Partitions older than AUDIT_ARCHIVE_MONTHS months (counting the current
+    # one) are moved to compressed segment files in AUDIT_ARCHIVE_DIR, which
+    # every web process must be able to read; AUDIT_ARCHIVE_BLOCK_ROWS entries
+    # per compressed block. 0 disables it
+    AUDIT_ARCHIVE_MONTHS: int = int(os.getenv("AUDIT_ARCHIVE_MONTHS", "12"))
+    AUDIT_ARCHIVE_DIR: str = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+    AUDIT_ARCHIVE_BLOCK_ROWS: int = int(os.getenv("AUDIT_ARCHIVE_BLOCK_ROWS", "1000"))
+    AUDIT_PAGE_SIZE: int = int(os.getenv("AUDIT_PAGE_SIZE", "100"))
+    AUDIT_MAX_PAGE_SIZE: int = 500
+
+    # Audit writes (repositories/audit_writer.py). "async" appends entries to
+    # a spool file in AUDIT_SPOOL_DIR and inserts them in group commits every
+    # AUDIT_FLUSH_INTERVAL seconds or AUDIT_FLUSH_BATCH entries; "sync" inserts
+    # each entry in the transaction of the change it records, as do the
+    # AUDIT_SYNC_ACTIONS in either mode. AUDIT_SPOOL_FSYNC=1 also survives
+    # power loss, at one fsync per entry
+    AUDIT_WRITE_MODE: str = os.getenv("AUDIT_WRITE_MODE", "async")
+    AUDIT_SYNC_ACTIONS: tuple = tuple(
+        action.strip().upper()
+        for action in os.getenv("AUDIT_SYNC_ACTIONS", "DELETE,CLOSE,REOPEN,WORKFLOW_ADVANCE").split(",")
+        if action.strip()
+    )
+    AUDIT_SPOOL_DIR: str = os.getenv("AUDIT_SPOOL_DIR", "audit_spool")
+    AUDIT_SPOOL_FSYNC: bool = os.getenv("AUDIT_SPOOL_FSYNC", "0") == "1"
+    AUDIT_FLUSH_INTERVAL: float = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+    AUDIT_FLUSH_BATCH: int = int(os.getenv("AUDIT_FLUSH_BATCH", "500"))
+    # Audit changes longer than this (bytes of JSON) are stored zlib-compressed
+    AUDIT_CHANGES_COMPRESS_BYTES: int = int(os.getenv("AUDIT_CHANGES_COMPRESS_BYTES", "1024"))
 
     # Application
     APP_TITLE: str = "Quality Management System"
@@ -25,7 +103,16 @@ class Config:
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production" 
     SESSION_COOKIE_NAME: str = "qms_session"
-    SESSION_MAX_AGE: int = 3600 * 24  # 24 hours
+    # Idle time after which a session expires; every use pushes it back
+    SESSION_MAX_AGE: int = int(os.getenv("SESSION_MAX_AGE", str(3600 * 24)))  # 24 hours
+    # Server-side session store (auth/sessions.py): "sqlite" (shared by all
+    # workers, survives restarts) or "memory" (one process only)
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "sqlite")
+    # Sessions kept in each process's LRU cache
+    SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+    # A session's expiry is written back at most this often (seconds)
+    SESSION_TOUCH_INTERVAL: int = int(os.getenv("SESSION_TOUCH_INTERVAL", "300"))
+    SESSION_HTTPS_ONLY: bool = os.getenv("SESSION_HTTPS_ONLY", "0") == "1"
 
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
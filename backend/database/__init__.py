@@ -2,5 +2,20 @@
 Database package initialization
 """
 from .connection import Database, get_db
+from .executor import DatabaseExecutor, DatabaseBusyError
+from .pool import ConnectionPool, PoolTimeoutError
+from .rows import execute_tuples, fetch_dict, fetch_dicts
+from .table_versions import TableVersions
 
-__all__ = ["Database", "get_db"]
+__all__ = [
+    "Database",
+    "get_db",
+    "DatabaseExecutor",
+    "DatabaseBusyError",
+    "ConnectionPool",
+    "PoolTimeoutError",
+    "TableVersions",
+    "execute_tuples",
+    "fetch_dict",
+    "fetch_dicts",
+]
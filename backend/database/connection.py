@@ -1,9 +1,19 @@
 """
 Database connection and initialization
 """
+import asyncio
 import sqlite3
 import os
-from config import Config, EntityType
+import threading
+import traceback
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Sequence
+from config import Config
+from .executor import DatabaseBusyError, DatabaseExecutor
+from .migrator import migrate
+from .pool import ConnectionPool, PooledConnection
+from .rows import execute_tuples
+from .table_versions import TableVersions
 
 
 class Database:
@@ -14,162 +24,184 @@ class Database:
         db_exists = os.path.exists(db_path)
         if not db_exists:
             print(f"Creating new database at {db_path}")
+        self.pool = ConnectionPool(
+            db_path,
+            read_size=Config.DB_READ_POOL_SIZE,
+            write_size=Config.DB_WRITE_POOL_SIZE,
+            timeout=Config.DB_POOL_TIMEOUT,
+            busy_timeout_ms=Config.DB_BUSY_TIMEOUT_MS,
+            cache_size_kb=Config.DB_CACHE_SIZE_KB,
+            mmap_size=Config.DB_MMAP_SIZE,
+            synchronous=Config.DB_SYNCHRONOUS,
+        )
+        self.executor = DatabaseExecutor(
+            max_workers=Config.DB_EXECUTOR_WORKERS,
+            max_queue=Config.DB_EXECUTOR_QUEUE_DEPTH,
+        )
         self.init_db()
+        # Change notifications for process-local caches (see table_versions.py)
+        self.table_versions = TableVersions(self.pool)
 
-    def get_connection(self):
-        """Get a database connection with row factory"""
+    def _acquire(self, readonly: bool) -> PooledConnection:
         try:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            return conn
+            return self.pool.acquire(readonly=readonly)
         except sqlite3.DatabaseError as e:
             print(f"Database error: {e}")
             print(f"The database file may be corrupted. Please delete {self.db_path} and run scripts/seed_database.py")
             raise
 
-    def init_db(self):
-        """Initialize database tables and indexes"""
+    def get_connection(self) -> PooledConnection:
+        """
+        Check out a writer-lane connection with row factory.
+        close() returns it to the pool; prefer read() / write() in new code.
+        """
+        return self._acquire(readonly=False)
+
+    @contextmanager
+    def read(self) -> Iterator[PooledConnection]:
+        """Borrow a query-only connection from the reader lane"""
+        conn = self._acquire(readonly=True)
         try:
-            conn = self.get_connection()
-            c = conn.cursor()
-
-            # Create entity tables
-            for entity in EntityType:
-                c.execute(f"""
-                    CREATE TABLE IF NOT EXISTS {entity.value} (
-                        id TEXT PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_active BOOLEAN DEFAULT 1
-                    )
-                """)
-                c.execute(
-                    f"CREATE INDEX IF NOT EXISTS idx_{entity.value}_name ON {entity.value}(name)"
-                )
-                c.execute(
-                    f"CREATE INDEX IF NOT EXISTS idx_{entity.value}_created ON {entity.value}(created_at)"
-                )
-
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS dmt_records (
-                    id TEXT PRIMARY KEY,
-                    report_number INTEGER UNIQUE,
-                    -- General Information
-                    work_center TEXT,
-                    part_num TEXT,
-                    operation TEXT,
-                    employee_name TEXT,
-                    qty TEXT,
-                    customer TEXT,
-                    shop_order TEXT,
-                    serial_number TEXT,
-                    inspection_item TEXT,
-                    date TEXT,
-                    prepared_by TEXT,
-                    -- Defect Description
-                    description TEXT,
-                    car_type TEXT,
-                    car_cycle TEXT,
-                    car_second_cycle_date TEXT,
-                    -- Process Analysis
-                    process_description TEXT,
-                    analysis TEXT,
-                    analysis_by TEXT,
-                    -- Engineering
-                    disposition TEXT,
-                    disposition_date TEXT,
-                    engineer TEXT,
-                    failure_code TEXT,
-                    rework_hours TEXT,
-                    responsible_dept TEXT,
-                    material_scrap_cost TEXT,
-                    others_cost TEXT,
-                    engineering_remarks TEXT,
-                    repair_process TEXT,
-                    -- Metadata
-                    status TEXT DEFAULT 'open',
-                    workflow_status TEXT DEFAULT 'draft',
-                    supervisor_completed_at TIMESTAMP,
-                    manager_completed_at TIMESTAMP,
-                    engineer_completed_at TIMESTAMP,
-                    created_by TEXT,
-                    assigned_to TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    is_session BOOLEAN DEFAULT 0
-                )
-            """)
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_id ON dmt_records(id)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_report_number ON dmt_records(report_number)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_shop_order ON dmt_records(shop_order)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_part_num ON dmt_records(part_num)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_status ON dmt_records(status)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_created_by ON dmt_records(created_by)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_assigned_to ON dmt_records(assigned_to)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_is_session ON dmt_records(is_session)")
-
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS audit_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    entity_type TEXT NOT NULL,
-                    entity_id TEXT NOT NULL,
-                    action TEXT NOT NULL,
-                    user_id TEXT,
-                    changes TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id TEXT PRIMARY KEY,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            c.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
-
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS report_counter (
-                    id INTEGER PRIMARY KEY CHECK (id = 1),
-                    next_number INTEGER NOT NULL DEFAULT 1000
-                )
-            """)
-            
-            c.execute("INSERT OR IGNORE INTO report_counter (id, next_number) VALUES (1, 1000)")
-
-            try:
-                c.execute("SELECT workflow_status FROM dmt_records LIMIT 1")
-            except sqlite3.OperationalError:
-                c.execute("ALTER TABLE dmt_records ADD COLUMN workflow_status TEXT DEFAULT 'draft'")
-                c.execute("ALTER TABLE dmt_records ADD COLUMN supervisor_completed_at TIMESTAMP")
-                c.execute("ALTER TABLE dmt_records ADD COLUMN manager_completed_at TIMESTAMP")
-                c.execute("ALTER TABLE dmt_records ADD COLUMN engineer_completed_at TIMESTAMP")
-                print("Added workflow columns to dmt_records table")
+            yield conn
+        finally:
+            conn.close()
 
+    @contextmanager
+    def write(self) -> Iterator[PooledConnection]:
+        """
+        Borrow the writer connection inside an IMMEDIATE transaction.
+        Commits on success, rolls back on any exception. Callbacks
+        registered with conn.after_commit() run after the commit, once the
+        connection is back in the pool.
+        """
+        conn = self._acquire(readonly=False)
+        callbacks = conn._after_commit = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            callbacks.clear()
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn._after_commit = None
+            conn.close()
+        for callback in callbacks:
             try:
-                c.execute("SELECT employee_number FROM employees LIMIT 1")
-            except sqlite3.OperationalError:
-                c.execute("ALTER TABLE employees ADD COLUMN employee_number TEXT")
-                c.execute("CREATE INDEX IF NOT EXISTS idx_employees_number ON employees(employee_number)")
-                print("Added employee_number column to employees table")
+                callback()
+            except Exception:
+                # The transaction is committed; report and carry on
+                traceback.print_exc()
+
+    def iter_rows(self, query: str, params: Sequence = (), chunk_size: int = None) -> Iterator[Dict]:
+        """
+        Stream query results as dicts, fetching ``chunk_size`` rows at a time.
+
+        One reader connection (and its snapshot) is held until the iterator
+        is exhausted or closed, so exports see a consistent view without
+        loading the whole result into memory.
+        """
+        chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+        with self.read() as conn:
+            c = execute_tuples(conn, query, params)
+            names = [column[0] for column in c.description]
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(names, row))
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Await a blocking callable (repository method, auth helper...) on the DB executor"""
+        return await self.executor.run(func, *args, **kwargs)
+
+    async def iterate(self, iterator: Iterator, retry_delay: float = 0.05) -> AsyncIterator:
+        """
+        Step a blocking iterator (iter_rows, an export built on it) on the
+        DB executor, one next() per call, so a long stream takes a slot only
+        while it works and never runs outside the executor.
+
+        The first step fails fast with DatabaseBusyError like run(); later
+        ones wait for a free slot, since the consumer has already started
+        (a response is being sent). The iterator is closed, releasing its
+        connection, when the consumer stops early.
+        """
+        lock = threading.Lock()
+        abandoned = []
+        done = object()
+
+        def close():
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+        def step():
+            with lock:
+                item = next(iterator, done)
+                if abandoned:
+                    # Consumer gone while this step ran
+                    close()
+                return item
+
+        first = True
+        try:
+            while True:
+                try:
+                    item = await self.run(step)
+                except DatabaseBusyError:
+                    if first:
+                        raise
+                    await asyncio.sleep(retry_delay)
+                    continue
+                if item is done:
+                    return
+                first = False
+                yield item
+        finally:
+            abandoned.append(True)
+            # A step still running in a DB thread closes it when it returns
+            if lock.acquire(blocking=False):
+                try:
+                    close()
+                finally:
+                    lock.release()
+
+    def _call_read(self, func: Callable, *args, **kwargs) -> Any:
+        with self.read() as conn:
+            return func(conn, *args, **kwargs)
+
+    def _call_write(self, func: Callable, *args, **kwargs) -> Any:
+        with self.write() as conn:
+            return func(conn, *args, **kwargs)
+
+    async def run_read(self, func: Callable, *args, **kwargs) -> Any:
+        """Await func(conn, ...) on a reader connection"""
+        return await self.executor.run(self._call_read, func, *args, **kwargs)
+
+    async def run_write(self, func: Callable, *args, **kwargs) -> Any:
+        """Await func(conn, ...) inside a write transaction"""
+        return await self.executor.run(self._call_write, func, *args, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.executor.shutdown(wait=False)
+        self.table_versions.close()
+        self.pool.close()
 
+    def init_db(self):
+        """
+        Bring the schema up to date by applying pending migrations
+        (database/migrations). A no-op when the schema is already current.
+        """
+        try:
+            conn = self.get_connection()
             try:
-                c.execute("SELECT is_session FROM dmt_records LIMIT 1")
-            except sqlite3.OperationalError:
-                c.execute("ALTER TABLE dmt_records ADD COLUMN is_session BOOLEAN DEFAULT 0")
-                c.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_is_session ON dmt_records(is_session)")
-                print("Added is_session column to dmt_records table")
-
-            conn.commit()
-            conn.close()
+                migrate(conn, lock_timeout=Config.DB_MIGRATION_LOCK_TIMEOUT)
+            finally:
+                conn.close()
         except sqlite3.DatabaseError as e:
             print(f"\n{'='*60}")
             print("DATABASE ERROR DETECTED")
@@ -0,0 +1,66 @@
+"""
+Bounded executor that keeps blocking SQLite work off the event loop
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class DatabaseBusyError(Exception):
+    """Raised when the database executor queue is full"""
+
+
+class DatabaseExecutor:
+    """
+    Dedicated thread pool for database calls.
+
+    ``max_workers`` caps how many SQLite calls run at once and
+    ``max_queue`` caps how many more may wait behind them. Once both are
+    exhausted, run() fails fast with DatabaseBusyError instead of letting
+    requests pile up on a saturated worker.
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 64):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="sqlite",
+        )
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Calls currently running or queued"""
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable on the executor and await its result"""
+        if not self._slots.acquire(blocking=False):
+            raise DatabaseBusyError(
+                f"Database queue is full ({self.max_workers} running, {self.max_queue} queued)"
+            )
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        # The slot is freed when the work finishes, not when the caller stops
+        # waiting, so cancelled requests still count against the limit.
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and join the worker threads"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,17 @@
+"""
+Composite (created_at, id) indexes backing keyset pagination.
+
+They replace the single-column created_at indexes on the entity tables,
+which they cover as a prefix.
+"""
+from config import EntityType
+
+
+def upgrade(conn):
+    for entity in EntityType:
+        conn.execute(f"DROP INDEX IF EXISTS idx_{entity.value}_created")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{entity.value}_created_id ON {entity.value}(created_at, id)"
+        )
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dmt_records_created_id ON dmt_records(created_at, id)")
@@ -0,0 +1,93 @@
+"""
+Trigger-maintained row counts.
+
+row_counts holds one counter per (table, bucket) so list endpoints can read
+totals in O(1) instead of running COUNT(*). Entity tables keep an 'active'
+bucket. dmt_records keeps the buckets needed to rebuild every role's
+visibility rule (see repositories/counts.py):
+
+    active              is_active = 1
+    status:<status>     active, by status
+    public              active uploaded DMTs (is_session = 0)
+    session:<user>      active sessions created by <user>
+    created:<user>      active uploaded DMTs created by <user>
+    assigned:<user>     active uploaded DMTs assigned to <user>
+    own:<user>          active uploaded DMTs both created by and assigned to <user>
+"""
+from config import EntityType
+
+ENTITY_BUCKETS = [
+    ("'active'", "{r}.is_active = 1"),
+]
+
+DMT_BUCKETS = [
+    ("'active'", "{r}.is_active = 1"),
+    ("'status:' || {r}.status", "{r}.is_active = 1 AND {r}.status IS NOT NULL"),
+    ("'public'", "{r}.is_active = 1 AND {r}.is_session = 0"),
+    ("'session:' || {r}.created_by", "{r}.is_active = 1 AND {r}.is_session = 1 AND {r}.created_by IS NOT NULL"),
+    ("'created:' || {r}.created_by", "{r}.is_active = 1 AND {r}.is_session = 0 AND {r}.created_by IS NOT NULL"),
+    ("'assigned:' || {r}.assigned_to", "{r}.is_active = 1 AND {r}.is_session = 0 AND {r}.assigned_to IS NOT NULL"),
+    ("'own:' || {r}.created_by", "{r}.is_active = 1 AND {r}.is_session = 0 AND {r}.created_by = {r}.assigned_to"),
+]
+
+DMT_WATCHED_COLUMNS = "is_active, is_session, status, created_by, assigned_to"
+
+
+def _bump(table: str, buckets, row: str, delta: int) -> str:
+    statements = []
+    for key, cond in buckets:
+        statements.append(
+            f"INSERT INTO row_counts (table_name, bucket, n) "
+            f"SELECT '{table}', {key.format(r=row)}, {delta} WHERE {cond.format(r=row)} "
+            f"ON CONFLICT (table_name, bucket) DO UPDATE SET n = n + excluded.n;"
+        )
+    return "\n".join(statements)
+
+
+def _install(conn, table: str, buckets, watched: str):
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+        BEGIN
+            {_bump(table, buckets, "NEW", 1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+        BEGIN
+            {_bump(table, buckets, "OLD", -1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_update AFTER UPDATE OF {watched} ON {table}
+        BEGIN
+            {_bump(table, buckets, "OLD", -1)}
+            {_bump(table, buckets, "NEW", 1)}
+        END
+    """)
+
+    # Backfill from the rows already present
+    for key, cond in buckets:
+        conn.execute(f"""
+            INSERT INTO row_counts (table_name, bucket, n)
+            SELECT '{table}', {key.format(r=table)}, COUNT(*) FROM {table}
+            WHERE {cond.format(r=table)}
+            GROUP BY 2
+            ON CONFLICT (table_name, bucket) DO UPDATE SET n = n + excluded.n
+        """)
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS row_counts (
+            table_name TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (table_name, bucket)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM row_counts")
+
+    for entity in EntityType:
+        _install(conn, entity.value, ENTITY_BUCKETS, "is_active")
+
+    _install(conn, "dmt_records", DMT_BUCKETS, DMT_WATCHED_COLUMNS)
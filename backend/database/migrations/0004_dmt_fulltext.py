@@ -0,0 +1,58 @@
+"""
+FTS5 index over the free-text DMT fields.
+
+dmt_records_fts is an external-content table: it stores only the index and
+reads text from dmt_records by rowid. Triggers keep it in sync. dmt_records
+has no INTEGER PRIMARY KEY, so a VACUUM may renumber rowids; rebuild the
+index afterwards with
+
+    INSERT INTO dmt_records_fts(dmt_records_fts) VALUES('rebuild');
+"""
+
+FTS_COLUMNS = [
+    "description",
+    "analysis",
+    "process_description",
+    "engineering_remarks",
+    "repair_process",
+]
+
+
+def upgrade(conn):
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"NEW.{col}" for col in FTS_COLUMNS)
+    old_values = ", ".join(f"OLD.{col}" for col in FTS_COLUMNS)
+
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS dmt_records_fts USING fts5(
+            {columns},
+            content='dmt_records',
+            content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dmt_records_fts_insert AFTER INSERT ON dmt_records
+        BEGIN
+            INSERT INTO dmt_records_fts (rowid, {columns}) VALUES (NEW.rowid, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dmt_records_fts_delete AFTER DELETE ON dmt_records
+        BEGIN
+            INSERT INTO dmt_records_fts (dmt_records_fts, rowid, {columns})
+            VALUES ('delete', OLD.rowid, {old_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dmt_records_fts_update AFTER UPDATE OF {columns} ON dmt_records
+        BEGIN
+            INSERT INTO dmt_records_fts (dmt_records_fts, rowid, {columns})
+            VALUES ('delete', OLD.rowid, {old_values});
+            INSERT INTO dmt_records_fts (rowid, {columns}) VALUES (NEW.rowid, {new_values});
+        END
+    """)
+
+    # Index the records that already exist
+    conn.execute("INSERT INTO dmt_records_fts (dmt_records_fts) VALUES ('rebuild')")
@@ -0,0 +1,32 @@
+"""
+Case-insensitive uniqueness for active entity records.
+
+Entities are deduplicated by name, employees by employee number (two people
+may share a name). Indexes are partial (is_active = 1) so a soft-deleted
+record never blocks re-creating it. Active duplicates already in the table
+are soft-deleted first, keeping the oldest record.
+"""
+from config import EntityType
+
+
+def upgrade(conn):
+    for entity in EntityType:
+        table = entity.value
+        column = "employee_number" if entity == EntityType.EMPLOYEES else "name"
+
+        c = conn.execute(f"""
+            UPDATE {table} SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+            WHERE is_active = 1 AND {column} IS NOT NULL AND EXISTS (
+                SELECT 1 FROM {table} AS older
+                WHERE older.is_active = 1
+                  AND older.{column} = {table}.{column} COLLATE NOCASE
+                  AND (older.created_at, older.id) < ({table}.created_at, {table}.id)
+            )
+        """)
+        if c.rowcount:
+            print(f"Deactivated {c.rowcount} duplicate rows in {table}")
+
+        conn.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_{column}_unique
+            ON {table}({column} COLLATE NOCASE) WHERE is_active = 1
+        """)
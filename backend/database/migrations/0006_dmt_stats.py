@@ -0,0 +1,85 @@
+"""
+Trigger-maintained DMT dashboard aggregates.
+
+dmt_stats keeps, for active records, a row count (n) and a running sum
+(total) per metric:
+
+    rework_hours          records with rework hours filled in / hours summed
+    non_conformance_cost  records with a scrap or other cost / both costs summed
+    failure_code:<code>   records per failure code
+
+Status counts already live in row_counts (migration 0003).
+"""
+
+HAS_REWORK = "{r}.is_active = 1 AND TRIM(COALESCE({r}.rework_hours, '')) != ''"
+HAS_COST = (
+    "{r}.is_active = 1 AND (TRIM(COALESCE({r}.material_scrap_cost, '')) != '' "
+    "OR TRIM(COALESCE({r}.others_cost, '')) != '')"
+)
+HAS_FAILURE_CODE = "{r}.is_active = 1 AND TRIM(COALESCE({r}.failure_code, '')) != ''"
+
+METRICS = [
+    ("'rework_hours'", "CAST({r}.rework_hours AS REAL)", HAS_REWORK),
+    (
+        "'non_conformance_cost'",
+        "COALESCE(CAST({r}.material_scrap_cost AS REAL), 0) + COALESCE(CAST({r}.others_cost AS REAL), 0)",
+        HAS_COST,
+    ),
+    ("'failure_code:' || {r}.failure_code", "0", HAS_FAILURE_CODE),
+]
+
+WATCHED_COLUMNS = "is_active, rework_hours, material_scrap_cost, others_cost, failure_code"
+
+
+def _bump(row: str, sign: int) -> str:
+    statements = []
+    for key, amount, cond in METRICS:
+        statements.append(
+            f"INSERT INTO dmt_stats (key, n, total) "
+            f"SELECT {key.format(r=row)}, {sign}, {sign} * ({amount.format(r=row)}) "
+            f"WHERE {cond.format(r=row)} "
+            f"ON CONFLICT (key) DO UPDATE SET n = n + excluded.n, total = total + excluded.total;"
+        )
+    return "\n".join(statements)
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dmt_stats (
+            key TEXT PRIMARY KEY,
+            n INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM dmt_stats")
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dmt_stats_insert AFTER INSERT ON dmt_records
+        BEGIN
+            {_bump("NEW", 1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dmt_stats_delete AFTER DELETE ON dmt_records
+        BEGIN
+            {_bump("OLD", -1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dmt_stats_update AFTER UPDATE OF {WATCHED_COLUMNS} ON dmt_records
+        BEGIN
+            {_bump("OLD", -1)}
+            {_bump("NEW", 1)}
+        END
+    """)
+
+    # Backfill from the existing records
+    for key, amount, cond in METRICS:
+        conn.execute(f"""
+            INSERT INTO dmt_stats (key, n, total)
+            SELECT {key.format(r="dmt_records")}, COUNT(*), TOTAL({amount.format(r="dmt_records")})
+            FROM dmt_records
+            WHERE {cond.format(r="dmt_records")}
+            GROUP BY 1
+            ON CONFLICT (key) DO UPDATE SET n = n + excluded.n, total = total + excluded.total
+        """)
@@ -0,0 +1,34 @@
+"""
+Per-table change counters for cross-process cache invalidation.
+
+table_versions holds one counter per watched table, bumped by triggers in
+the same transaction as every insert, update or delete. Worker processes
+notice commits from any connection through PRAGMA data_version and then
+compare counters to learn which tables changed (see
+database/table_versions.py).
+"""
+from config import EntityType
+
+WATCHED_TABLES = [entity.value for entity in EntityType] + ["users", "dmt_records"]
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+
+    for table in WATCHED_TABLES:
+        conn.execute(
+            "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)",
+            (table,),
+        )
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            """)
@@ -0,0 +1,25 @@
+"""
+Composite (column, id) indexes backing the sortable DMT listing.
+
+Keyset pages ordered by report number, status, part number or shop order
+break ties on id; these replace the single-column indexes, which they
+cover as a prefix.
+
+The is_session index is dropped: with only two values it never narrows a
+search, yet the planner picked it for the visibility filter and then had
+to sort every visible row instead of walking a sort index and stopping
+at the page limit. Per-user filters still use the created_by and
+assigned_to indexes.
+"""
+
+SORT_COLUMNS = ["report_number", "status", "part_num", "shop_order"]
+
+
+def upgrade(conn):
+    for column in SORT_COLUMNS:
+        conn.execute(f"DROP INDEX IF EXISTS idx_dmt_records_{column}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_dmt_records_{column}_id ON dmt_records({column}, id)"
+        )
+
+    conn.execute("DROP INDEX IF EXISTS idx_dmt_records_is_session")
@@ -0,0 +1,40 @@
+"""
+Background job queue (see services/job_queue.py).
+
+A job moves queued -> running -> succeeded / failed, or to cancelled.
+Failed attempts go back to queued with a later run_after until
+max_attempts is reached. A running job whose heartbeat_at is older than
+the lease is assumed to have lost its worker and is queued again.
+"""
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            progress_done INTEGER NOT NULL DEFAULT 0,
+            progress_total INTEGER,
+            message TEXT,
+            error TEXT,
+            result TEXT,
+            result_path TEXT,
+            result_name TEXT,
+            media_type TEXT,
+            worker_id TEXT,
+            created_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    # Claiming: oldest runnable queued job first
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after)")
+    # Job lists per user, newest first
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_by ON jobs(created_by, created_at)")
@@ -0,0 +1,113 @@
+"""
+Typed numeric and date columns in dmt_records.
+
+qty becomes INTEGER, rework_hours / material_scrap_cost / others_cost
+REAL, and date / disposition_date ISO-8601 (YYYY-MM-DD) TEXT, each with
+a CHECK so only such values (or NULL) can be stored. SQLite cannot
+change a column's type in place, so the table is rebuilt: a copy with
+the new definitions is filled keeping every rowid (the FTS index refers
+to rows by rowid), the old table is dropped, the copy renamed, and the
+indexes and triggers are recreated from their saved SQL.
+
+Existing text is converted with utils.typed_columns and blanks become
+NULL. Values that cannot be converted are NULL as well; the original
+text is kept in dmt_invalid_values so it can be corrected by hand.
+
+New indexes back the cost-of-quality report (costs summed over a range
+of DMT dates): a partial index on date covering the cost and hours
+columns, and one on disposition_date. The partial index also lists
+is_active and is_session; SQLite only treats it as covering when the
+columns of its WHERE clause are in the index too.
+"""
+import importlib
+import re
+from utils.typed_columns import DATE_COLUMNS, INTEGER_COLUMNS, REAL_COLUMNS, TYPED_COLUMNS, to_column_value
+
+DEFINITIONS = {
+    **{
+        column: f'INTEGER CHECK ("{column}" IS NULL OR (typeof("{column}") = \'integer\' AND "{column}" >= 0))'
+        for column in INTEGER_COLUMNS
+    },
+    **{
+        column: f'REAL CHECK ("{column}" IS NULL OR (typeof("{column}") = \'real\' AND "{column}" >= 0))'
+        for column in REAL_COLUMNS
+    },
+    **{
+        column: f'TEXT CHECK ("{column}" IS NULL OR "{column}" IS date("{column}"))'
+        for column in DATE_COLUMNS
+    },
+}
+
+
+def _typed(column, value):
+    try:
+        return to_column_value(column, value)
+    except ValueError:
+        return None
+
+
+def upgrade(conn):
+    conn.create_function("dmt_typed", 2, _typed, deterministic=True)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dmt_invalid_values (
+            dmt_id TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            value TEXT,
+            PRIMARY KEY (dmt_id, column_name)
+        ) WITHOUT ROWID
+    """)
+    invalid = 0
+    for column in TYPED_COLUMNS:
+        invalid += conn.execute(f"""
+            INSERT OR REPLACE INTO dmt_invalid_values (dmt_id, column_name, value)
+            SELECT id, '{column}', "{column}" FROM dmt_records
+            WHERE TRIM(COALESCE("{column}", '')) != '' AND dmt_typed('{column}', "{column}") IS NULL
+        """).rowcount
+    if invalid:
+        print(f"{invalid} DMT values could not be converted; originals kept in dmt_invalid_values")
+
+    create_sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'dmt_records'"
+    ).fetchone()[0]
+    create_sql = re.sub(r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?dmt_records\"?", "CREATE TABLE dmt_records_typed", create_sql)
+    for column, definition in DEFINITIONS.items():
+        create_sql, found = re.subn(rf'(?<![\w"])"?{column}"?\s+TEXT\b', f'"{column}" {definition}', create_sql)
+        if found != 1:
+            raise RuntimeError(f"dmt_records.{column} is not a single TEXT column; cannot convert it")
+
+    saved = [
+        row[0]
+        for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = 'dmt_records' "
+            "AND type IN ('index', 'trigger') AND sql IS NOT NULL ORDER BY type, name"
+        )
+    ]
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(dmt_records)")]
+    values = [f"dmt_typed('{c}', \"{c}\")" if c in TYPED_COLUMNS else f'"{c}"' for c in columns]
+    column_list = ", ".join(f'"{c}"' for c in columns)
+
+    conn.execute(create_sql)
+    conn.execute(f"""
+        INSERT INTO dmt_records_typed (rowid, {column_list})
+        SELECT rowid, {", ".join(values)} FROM dmt_records
+    """)
+    conn.execute("DROP TABLE dmt_records")
+    conn.execute("ALTER TABLE dmt_records_typed RENAME TO dmt_records")
+    for sql in saved:
+        conn.execute(sql)
+
+    # Rebuild the aggregates: unconvertible amounts no longer count
+    importlib.import_module(f"{__package__}.0006_dmt_stats").upgrade(conn)
+    conn.execute("UPDATE table_versions SET version = version + 1 WHERE table_name = 'dmt_records'")
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dmt_records_cost_by_date
+        ON dmt_records(date, material_scrap_cost, others_cost, rework_hours, is_active, is_session)
+        WHERE is_active = 1 AND is_session = 0
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dmt_records_disposition_date
+        ON dmt_records(disposition_date)
+        WHERE is_active = 1
+    """)
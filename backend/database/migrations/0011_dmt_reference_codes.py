@@ -0,0 +1,146 @@
+"""
+Dictionary-encoded reference columns in dmt_records.
+
+work_center, customer, part_num, failure_code, disposition, car_type,
+inspection_item and prepared_by held repeated free text (an entity id or
+a name, depending on which form wrote the row). They become INTEGER codes
+pointing into the matching entity table; repositories/reference_codes.py
+turns them back into names on read.
+
+The entity tables get ``ref INTEGER PRIMARY KEY`` for that. It aliases the
+rowid, so unlike a plain rowid it survives VACUUM; the old text id stays
+the public identifier (NOT NULL UNIQUE). Existing rows keep their rowid as
+their ref.
+
+Each DMT value is matched to an entity by id, then by name (ignoring
+case, active rows first). Values no entity knows are added to the entity
+table as inactive rows: the record keeps its text, and the value does
+not show up in the form selectors. Blanks become NULL.
+
+Both kinds of tables are rebuilt (SQLite cannot change a primary key or
+a column type in place), keeping every rowid, indexes and triggers.
+"""
+import importlib
+import re
+import uuid
+
+# dmt_records column -> entity table its codes point into
+REFERENCE_COLUMNS = {
+    "work_center": "workcenters",
+    "customer": "customers",
+    "part_num": "partnumbers",
+    "failure_code": "failure_codes",
+    "disposition": "dispositions",
+    "car_type": "car_types",
+    "inspection_item": "inspection_items",
+    "prepared_by": "prepared_by",
+}
+
+
+def _rebuild(conn, table, create_sql, columns, values, copy_rowid=True):
+    """Recreate ``table`` from ``create_sql``, filling it with ``values`` (SQL per column)"""
+    create_sql = re.sub(
+        rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?{table}\"?", f"CREATE TABLE {table}_rebuilt", create_sql
+    )
+    saved = [
+        row[0]
+        for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? "
+            "AND type IN ('index', 'trigger') AND sql IS NOT NULL ORDER BY type, name",
+            (table,),
+        )
+    ]
+    targets = (["rowid"] if copy_rowid else []) + [f'"{c}"' for c in columns]
+    sources = (["rowid"] if copy_rowid else []) + values
+
+    conn.execute(create_sql)
+    conn.execute(f"""
+        INSERT INTO {table}_rebuilt ({", ".join(targets)})
+        SELECT {", ".join(sources)} FROM {table}
+    """)
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_rebuilt RENAME TO {table}")
+    for sql in saved:
+        conn.execute(sql)
+
+
+def _table_sql(conn, table):
+    return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+
+
+def _add_ref(conn, table):
+    create_sql, found = re.subn(
+        r'(?<![\w"])"?id"?\s+TEXT\s+PRIMARY\s+KEY\b',
+        "ref INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE",
+        _table_sql(conn, table),
+    )
+    if found != 1:
+        raise RuntimeError(f"{table}.id is not a TEXT PRIMARY KEY; cannot add ref")
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    # ref takes the old rowid
+    _rebuild(conn, table, create_sql, ["ref"] + columns, ["rowid"] + [f'"{c}"' for c in columns], copy_rowid=False)
+
+
+def upgrade(conn):
+    for table in sorted(set(REFERENCE_COLUMNS.values())):
+        _add_ref(conn, table)
+
+    # Entities for values that match nothing, then id/name -> ref per table
+    codes = {}
+    for column, table in REFERENCE_COLUMNS.items():
+        by_id = {}
+        by_name = {}
+        # Active rows last, so they win a name shared with inactive ones
+        for ref, entity_id, name in conn.execute(
+            f"SELECT ref, id, name FROM {table} ORDER BY COALESCE(is_active, 0), ref"
+        ):
+            by_id[entity_id] = ref
+            by_name[(name or "").strip().casefold()] = ref
+
+        missing = {}
+        for (value,) in conn.execute(
+            f'SELECT DISTINCT "{column}" FROM dmt_records WHERE TRIM(COALESCE("{column}", \'\')) != \'\''
+        ):
+            text = str(value).strip()
+            if text not in by_id and text.casefold() not in by_name:
+                missing.setdefault(text.casefold(), text)
+        for key, text in missing.items():
+            ref = conn.execute(
+                f"INSERT INTO {table} (id, name, is_active) VALUES (?, ?, 0)", (str(uuid.uuid4()), text)
+            ).lastrowid
+            by_name[key] = ref
+        if missing:
+            print(f"Added {len(missing)} inactive {table} rows for DMT {column} values")
+        codes[column] = (by_id, by_name)
+
+    def _code(column, value):
+        if value is None or not str(value).strip():
+            return None
+        text = str(value).strip()
+        by_id, by_name = codes[column]
+        return by_id.get(text) or by_name.get(text.casefold())
+
+    conn.create_function("dmt_reference_code", 2, _code, deterministic=True)
+
+    create_sql = _table_sql(conn, "dmt_records")
+    for column, table in REFERENCE_COLUMNS.items():
+        definition = (
+            f'"{column}" INTEGER REFERENCES {table}(ref) '
+            f'CHECK ("{column}" IS NULL OR typeof("{column}") = \'integer\')'
+        )
+        create_sql, found = re.subn(rf'(?<![\w"])"?{column}"?\s+TEXT\b', definition, create_sql)
+        if found != 1:
+            raise RuntimeError(f"dmt_records.{column} is not a single TEXT column; cannot encode it")
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(dmt_records)")]
+    values = [f"dmt_reference_code('{c}', \"{c}\")" if c in REFERENCE_COLUMNS else f'"{c}"' for c in columns]
+    _rebuild(conn, "dmt_records", create_sql, columns, values)
+
+    # failure_code:<code> keys now hold the code
+    importlib.import_module(f"{__package__}.0006_dmt_stats").upgrade(conn)
+    conn.execute(
+        "UPDATE table_versions SET version = version + 1 WHERE table_name IN ({})".format(
+            ", ".join("?" * (len(REFERENCE_COLUMNS) + 1))
+        ),
+        ["dmt_records", *REFERENCE_COLUMNS.values()],
+    )
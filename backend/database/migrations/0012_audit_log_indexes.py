@@ -0,0 +1,27 @@
+"""
+Indexes for audit_log, and the audit_log_all view.
+
+audit_log had no index besides its id, so every audit page sorted the
+whole table. The timestamp index serves the newest-first listing (the
+rowid id is its implicit last column, breaking ties for keyset paging);
+the other two serve the history of one record and of one user.
+
+Closed months are moved into audit_log_YYYY_MM partition tables with the
+same indexes (repositories/audit_repository.py). audit_log_all is the
+union of audit_log and every partition; it starts out as audit_log alone
+and is recreated whenever a partition is added.
+"""
+
+INDEXES = {
+    "timestamp": "timestamp",
+    "entity": "entity_type, entity_id, timestamp",
+    "user": "user_id, timestamp",
+}
+
+
+def upgrade(conn):
+    for name, columns in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_audit_log_{name} ON audit_log({columns})")
+
+    conn.execute("DROP VIEW IF EXISTS audit_log_all")
+    conn.execute("CREATE VIEW audit_log_all AS SELECT * FROM audit_log")
@@ -0,0 +1,17 @@
+"""
+Bookkeeping for the asynchronous audit writer (repositories/audit_writer.py).
+
+Buffered audit entries are spooled to local files (segments) before they
+reach audit_log. A segment's name is recorded here in the transaction
+that inserts its entries, so a segment replayed after a crash is never
+inserted twice.
+"""
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS audit_spool_applied (
+            segment TEXT PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """)
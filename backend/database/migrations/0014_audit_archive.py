@@ -0,0 +1,24 @@
+"""
+Catalogue of archived audit log segments (repositories/audit_archive.py).
+
+Monthly audit_log_YYYY_MM partitions past Config.AUDIT_ARCHIVE_MONTHS are
+written to compressed segment files in Config.AUDIT_ARCHIVE_DIR and then
+dropped. A segment is listed here in the same transaction that drops its
+partition, so audit queries see every entry exactly once: either in the
+partition or in a listed segment. Archived entries are not part of the
+audit_log_all view.
+"""
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS audit_archive_segments (
+            file TEXT PRIMARY KEY,
+            month TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            first_timestamp TEXT,
+            last_timestamp TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_archive_segments_month ON audit_archive_segments(month)")
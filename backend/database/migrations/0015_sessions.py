@@ -0,0 +1,31 @@
+"""
+Server-side sessions (auth/sessions.py).
+
+The session cookie only carries a random id; the session itself lives
+here under the SHA-256 of that id, so a copy of the database cannot be
+replayed as cookies. user_id serves revoking every session of a user,
+expires_at (unix time, pushed forward while the session is used) the
+expiry sweeps.
+
+Each process keeps recently used sessions in memory. Deleting sessions
+bumps the session_revocations counter in table_versions (by hand, not by
+trigger, so that ordinary logins and expiry updates do not empty every
+process's cache).
+"""
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+    conn.execute(
+        "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('session_revocations', 0)"
+    )
@@ -0,0 +1,8 @@
+"""
+Numbered schema migrations.
+
+Each module is named ``NNNN_description.py`` and defines ``upgrade(conn)``.
+Migrations run in order inside a single exclusive transaction and must not
+commit; database/migrator.py records the applied number in
+``PRAGMA user_version``.
+"""
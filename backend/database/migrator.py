@@ -0,0 +1,88 @@
+"""
+Schema migrations keyed on PRAGMA user_version
+"""
+import importlib
+import os
+import re
+from typing import Callable, List, NamedTuple, Optional
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable
+
+
+def _migration_files() -> List[tuple]:
+    """(version, module name) for every numbered file, in order"""
+    files = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _MIGRATION_FILE.match(filename)
+        if match:
+            files.append((int(match.group(1)), filename[:-3]))
+    files.sort()
+    versions = [version for version, _ in files]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration numbers in {MIGRATIONS_DIR}")
+    return files
+
+
+def latest_version() -> int:
+    """Highest migration number available (read from filenames, nothing is imported)"""
+    files = _migration_files()
+    return files[-1][0] if files else 0
+
+
+def load_migrations() -> List[Migration]:
+    """Import every migration module, in order"""
+    migrations = []
+    for version, module_name in _migration_files():
+        module = importlib.import_module(f"{__package__}.migrations.{module_name}")
+        migrations.append(Migration(version, module_name, module.upgrade))
+    return migrations
+
+
+def current_version(conn) -> int:
+    """Schema version recorded in the database file"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target: Optional[int] = None, lock_timeout: float = 300.0) -> int:
+    """
+    Apply pending migrations and return the resulting schema version.
+
+    When the database is already current this costs a single PRAGMA read.
+    Otherwise an EXCLUSIVE transaction serializes concurrent starters: the
+    first process migrates, the others wait for the lock (up to
+    ``lock_timeout`` seconds), re-check the version and find nothing to do.
+    Either every pending migration is applied or none is.
+    """
+    target = latest_version() if target is None else target
+    version = current_version(conn)
+    if version >= target:
+        return version
+
+    busy_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout = {int(lock_timeout * 1000)}")
+    try:
+        conn.execute("BEGIN EXCLUSIVE")
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+
+    try:
+        # Another process may have migrated while we waited for the lock
+        version = current_version(conn)
+        for migration in load_migrations():
+            if version < migration.version <= target:
+                print(f"Applying migration {migration.name}")
+                migration.upgrade(conn)
+                conn.execute(f"PRAGMA user_version = {migration.version}")
+                version = migration.version
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return version
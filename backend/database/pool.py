@@ -0,0 +1,229 @@
+"""
+SQLite connection pool with separate reader and writer lanes
+"""
+import os
+import queue
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled sqlite3.Connection.
+
+    Behaves like the wrapped connection, except that close() hands the
+    connection back to its lane instead of closing it.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection, lane: "_Lane"):
+        self._pool = pool
+        self._conn = conn
+        self._lane = lane
+        self._released = False
+        # Set by Database.write() for the duration of its transaction
+        self._after_commit: Optional[List[Callable[[], None]]] = None
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def after_commit(self, callback: Callable[[], None]) -> bool:
+        """
+        Run callback() once the enclosing Database.write() transaction has
+        committed; it is dropped if the transaction rolls back. Returns
+        False (and does nothing) outside write().
+        """
+        if self._after_commit is None:
+            return False
+        self._after_commit.append(callback)
+        return True
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        """The underlying sqlite3 connection"""
+        return self._conn
+
+    def close(self):
+        """Return the connection to the pool"""
+        if not self._released:
+            self._released = True
+            self._pool._release(self._conn, self._lane)
+
+    def __del__(self):
+        # Safety net for callers that forget to close on an error path
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class _Lane:
+    """A bounded set of long-lived connections of one kind (reader or writer)"""
+
+    def __init__(self, name: str, size: int, readonly: bool):
+        self.name = name
+        self.size = max(1, size)
+        self.readonly = readonly
+        self.idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Pool of long-lived SQLite connections.
+
+    SQLite allows many concurrent readers but only one writer, so the pool
+    keeps two lanes: a reader lane of ``read_size`` query-only connections
+    and a writer lane (normally a single connection) that serializes writes
+    inside the process instead of letting them fight over the file lock.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        read_size: int = 8,
+        write_size: int = 1,
+        timeout: float = 30.0,
+        busy_timeout_ms: int = 5000,
+        cache_size_kb: int = 20000,
+        mmap_size: int = 256 * 1024 * 1024,
+        synchronous: str = "NORMAL",
+    ):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.synchronous = synchronous
+        self._read_size = read_size
+        self._write_size = write_size
+        self._pid = os.getpid()
+        self._wal_checked = False
+        self._init_lanes()
+
+    def _init_lanes(self):
+        self.reader = _Lane("reader", self._read_size, readonly=True)
+        self.writer = _Lane("writer", self._write_size, readonly=False)
+
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        """Open a new connection and apply the tuning pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+
+        if not self._wal_checked:
+            # journal_mode is persistent in the database file; checking it
+            # once per process is enough.
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                print(f"Warning: could not enable WAL mode (journal_mode={mode})")
+            self._wal_checked = True
+
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _check_fork(self):
+        """Drop connections inherited from a parent process"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._wal_checked = False
+            self._init_lanes()
+
+    def acquire(self, readonly: bool = False) -> PooledConnection:
+        """Check out a connection from the reader or writer lane"""
+        self._check_fork()
+        lane = self.reader if readonly else self.writer
+
+        try:
+            conn = lane.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with lane.lock:
+                if lane.created < lane.size:
+                    lane.created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect(lane.readonly)
+                except Exception:
+                    with lane.lock:
+                        lane.created -= 1
+                    raise
+            else:
+                try:
+                    conn = lane.idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a {lane.name} connection"
+                    )
+
+        return PooledConnection(self, conn, lane)
+
+    def _release(self, conn: sqlite3.Connection, lane: _Lane):
+        """Return a connection to its lane, discarding any open transaction"""
+        if lane is not self.reader and lane is not self.writer:
+            # Lane was reset (fork); the connection belongs to another process
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it so a fresh one gets created
+            with lane.lock:
+                lane.created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        lane.idle.put(conn)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Pool occupancy, for health checks"""
+        return {
+            lane.name: {
+                "size": lane.size,
+                "open": lane.created,
+                "idle": lane.idle.qsize(),
+            }
+            for lane in (self.reader, self.writer)
+        }
+
+    def close(self):
+        """Close every idle connection"""
+        for lane in (self.reader, self.writer):
+            closed: List[sqlite3.Connection] = []
+            while True:
+                try:
+                    closed.append(lane.idle.get_nowait())
+                except queue.Empty:
+                    break
+            for conn in closed:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            with lane.lock:
+                lane.created -= len(closed)
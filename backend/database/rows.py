@@ -0,0 +1,33 @@
+"""
+Row fetching without sqlite3.Row
+"""
+from typing import Dict, List, Optional, Sequence
+
+
+def execute_tuples(conn, query: str, params: Sequence = ()):
+    """
+    Execute on a cursor that yields plain tuples. Converting sqlite3.Row
+    objects with dict(row) goes through the mapping protocol column by
+    column and costs about twice as much as zipping tuples with the column
+    names read once from cursor.description.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    return cursor
+
+
+def fetch_dicts(conn, query: str, params: Sequence = ()) -> List[Dict]:
+    """Every result row as a dict"""
+    cursor = execute_tuples(conn, query, params)
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def fetch_dict(conn, query: str, params: Sequence = ()) -> Optional[Dict]:
+    """The first result row as a dict, or None"""
+    cursor = execute_tuples(conn, query, params)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
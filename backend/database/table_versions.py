@@ -0,0 +1,82 @@
+"""
+Cross-process change notifications for in-memory caches
+"""
+import os
+import threading
+from typing import Callable, Dict, List, Set
+from .pool import ConnectionPool
+
+Listener = Callable[[Set[str]], None]
+
+
+class TableVersions:
+    """
+    Tells process-local caches which tables were written by anyone.
+
+    Writes bump a counter in table_versions inside their own transaction
+    (triggers, migration 0007). Each process keeps one dedicated connection
+    and asks it for ``PRAGMA data_version``, which changes whenever another
+    connection (in this or any other worker) has committed. Only then are
+    the counters re-read and listeners told which tables moved, so a poll
+    with nothing new costs a few microseconds and no table reads.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._listeners: List[Listener] = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._conn = None
+        self._data_version = None
+        self._versions: Dict[str, int] = {}
+
+    def subscribe(self, listener: Listener):
+        """Call listener(changed_tables) whenever poll() finds changes"""
+        self._listeners.append(listener)
+
+    def poll(self) -> Set[str]:
+        """Notify listeners of tables written since the last poll and return them"""
+        with self._lock:
+            if os.getpid() != self._pid:
+                # A forked worker needs its own connection
+                self._reset()
+            if self._conn is None:
+                self._conn = self.pool._connect(readonly=True)
+
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return set()
+            self._data_version = data_version
+
+            versions = {
+                row["table_name"]: row["version"]
+                for row in self._conn.execute("SELECT table_name, version FROM table_versions")
+            }
+            first_poll = not self._versions
+            changed = {table for table, version in versions.items() if self._versions.get(table) != version}
+            self._versions = versions
+
+        # The first poll only records a baseline; nothing was cached before it
+        if first_poll or not changed:
+            return set()
+        for listener in self._listeners:
+            listener(changed)
+        return changed
+
+    def version(self, table: str) -> int:
+        """Last seen change counter for table (call poll() first for a current value)"""
+        return self._versions.get(table, 0)
+
+    def current(self, table: str) -> int:
+        """Change counter for table as of now"""
+        self.poll()
+        return self.version(table)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._reset()
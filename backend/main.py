@@ -1,10 +1,13 @@
 # main.py
-from fastapi import FastAPI
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 from app.api.__init__ import api_router
+from auth.auth import get_active_user
+from auth.sessions import ServerSessionMiddleware
 # Asumo que tiene una llave secreta para las sesiones
 from config import Config 
+from database import DatabaseBusyError
 
 # Inicialización de la aplicación
 app = FastAPI(title="Quality Management System API")
@@ -13,8 +16,10 @@ app = FastAPI(title="Quality Management System API")
 # 🔑 CORRECCIÓN CRÍTICA: Middleware de Sesión
 # Esto permite que la solicitud use request.session (usado en auth.py)
 # ===============================================
-# CRÍTICO: Debe usar una llave secreta fuerte aquí.
-app.add_middleware(SessionMiddleware, secret_key=Config.SECRET_KEY)
+# La cookie sólo lleva un id opaco; la sesión vive en el servidor
+# (auth/sessions.py, Config.SESSION_BACKEND). El usuario se resuelve una
+# vez por solicitud, fuera del bucle de eventos (request.state.user)
+app.add_middleware(ServerSessionMiddleware, user_loader=get_active_user)
 
 # ===============================================
 # 🌐 CORRECCIÓN CRÍTICA: CORS Middleware
@@ -34,6 +39,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Cola de la base de datos llena: responder 503 en lugar de acumular solicitudes
+@app.exception_handler(DatabaseBusyError)
+async def database_busy_handler(request: Request, exc: DatabaseBusyError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 # Incluir el router de la API
 app.include_router(api_router, prefix="/api")
 
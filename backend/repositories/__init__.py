@@ -1,6 +1,25 @@
 """
 Repository package initialization
 """
-from .base_repository import Repository
+from .base_repository import Repository, DuplicateError
+from .dmt_repository import DMTRepository
+from .audit_repository import AuditRepository
+from .audit_archive import AuditArchive, get_audit_archive
+from .audit_writer import AuditWriter, get_audit_writer
+from .reference_cache import ReferenceCache, get_reference_cache
+from .reference_codes import ReferenceCodes, get_reference_codes
 
-__all__ = ["Repository"]
+__all__ = [
+    "Repository",
+    "DMTRepository",
+    "AuditRepository",
+    "AuditArchive",
+    "get_audit_archive",
+    "AuditWriter",
+    "get_audit_writer",
+    "DuplicateError",
+    "ReferenceCache",
+    "get_reference_cache",
+    "ReferenceCodes",
+    "get_reference_codes",
+]
@@ -0,0 +1,251 @@
+"""
+Compressed, immutable audit log archive segments
+"""
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import Config
+
+DATA_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx"
+
+# Index file: header, then one fixed-size record per block
+INDEX_MAGIC = b"QMSAUDX1"
+_HEADER = struct.Struct("<8sI")
+# offset, length, rows, first id, last id, first timestamp, last timestamp
+_BLOCK = struct.Struct("<QIIqq32s32s")
+# Bloom filter over the entity, user and action values of a block's entries
+BLOOM_BITS = 16384
+_RECORD_SIZE = _BLOCK.size + BLOOM_BITS // 8
+
+
+def _filter_keys(
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+) -> List[str]:
+    keys = []
+    for prefix, value in (("t", entity_type), ("i", entity_id), ("u", user_id), ("a", action)):
+        if value is not None and value != "":
+            keys.append(f"{prefix}:{value}")
+    # The history of one record: far more selective than type and id apart
+    if entity_type and entity_id:
+        keys.append(f"e:{entity_type}\0{entity_id}")
+    return keys
+
+
+def _bloom_positions(key: str) -> Tuple[int, int, int]:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=12).digest()
+    return tuple(int.from_bytes(digest[i:i + 4], "little") % BLOOM_BITS for i in (0, 4, 8))
+
+
+class ArchiveSegment:
+    """
+    One archived segment: ``<name>.jsonl.gz`` holds the entries, oldest
+    first, as a series of gzip members of up to Config.AUDIT_ARCHIVE_BLOCK_ROWS
+    JSON lines each (so the file is also a plain .jsonl.gz for zcat or jq).
+    ``<name>.idx`` holds one record per member: its byte range, id and
+    timestamp range and a Bloom filter of its entity types, entity ids,
+    users and actions.
+
+    Both files are memory-mapped; a query reads index records and only
+    decompresses the blocks that can hold a match.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        with open(os.path.join(directory, name + INDEX_SUFFIX), "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(os.path.join(directory, name + DATA_SUFFIX), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.blocks = _HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{name}{INDEX_SUFFIX} is not an audit archive index")
+
+    def _block(self, number: int):
+        base = _HEADER.size + number * _RECORD_SIZE
+        offset, length, rows, first_id, last_id, first_ts, last_ts = _BLOCK.unpack_from(self._index, base)
+        return (
+            base + _BLOCK.size,
+            offset,
+            length,
+            (first_ts.rstrip(b"\0").decode(), first_id),
+            (last_ts.rstrip(b"\0").decode(), last_id),
+        )
+
+    def _may_contain(self, bloom: int, positions: List[Tuple[int, int, int]]) -> bool:
+        index = self._index
+        return all(index[bloom + p // 8] & (1 << p % 8) for key in positions for p in key)
+
+    def query(
+        self,
+        limit: int,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        action: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_until: Optional[str] = None,
+        before: Optional[Tuple[str, int]] = None,
+    ) -> List[Dict]:
+        """
+        Up to ``limit`` entries matching every given filter, newest first:
+        timestamp >= date_from, timestamp < date_until and (timestamp, id)
+        < before, like AuditRepository.query() does in SQL.
+        """
+        wanted = [
+            (column, value)
+            for column, value in (
+                ("entity_type", entity_type), ("entity_id", entity_id), ("user_id", user_id), ("action", action)
+            )
+            if value
+        ]
+        positions = [_bloom_positions(key) for key in _filter_keys(entity_type, entity_id, user_id, action)]
+
+        rows = []
+        for number in range(self.blocks - 1, -1, -1):
+            bloom, offset, length, first, last = self._block(number)
+            if date_from and last[0] < date_from:
+                break
+            if date_until and first[0] >= date_until:
+                continue
+            if before and first >= before:
+                continue
+            if not self._may_contain(bloom, positions):
+                continue
+
+            text = zlib.decompress(self._data[offset:offset + length], wbits=31).decode("utf-8")
+            for row in reversed(json.loads("[" + ",".join(text.splitlines()) + "]")):
+                timestamp = row["timestamp"]
+                if date_from and timestamp < date_from:
+                    return rows
+                if date_until and timestamp >= date_until:
+                    continue
+                if before and (timestamp, row["id"]) >= before:
+                    continue
+                if any(row[column] != value for column, value in wanted):
+                    continue
+                rows.append(row)
+                if len(rows) >= limit:
+                    return rows
+        return rows
+
+    def close(self):
+        self._index.close()
+        self._data.close()
+
+
+class AuditArchive:
+    """
+    Writes and reads the segment files in Config.AUDIT_ARCHIVE_DIR.
+
+    Segments are never modified once written. Which of them hold live data
+    is recorded in audit_archive_segments (migration 0014), so a file that
+    is not listed there (an archival that lost a race or failed) is ignored
+    and removed by the process that wrote it.
+    """
+
+    def __init__(self, directory: str = Config.AUDIT_ARCHIVE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._segments: Dict[str, ArchiveSegment] = {}
+
+    def segment(self, name: str) -> ArchiveSegment:
+        """The segment ``name``, mapped once per process"""
+        segment = self._segments.get(name)
+        if segment is None:
+            with self._lock:
+                segment = self._segments.get(name)
+                if segment is None:
+                    segment = self._segments[name] = ArchiveSegment(self.directory, name)
+        return segment
+
+    def write(self, prefix: str, blocks: Iterable[List[Dict]]) -> Optional[Dict]:
+        """
+        Write the entries of ``blocks`` (lists of audit_log rows, in
+        (timestamp, id) order) to a new segment named ``<prefix>-<random>``.
+        Returns {"file", "rows", "first_timestamp", "last_timestamp"}, or
+        None when there were no entries.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{prefix}-{uuid.uuid4().hex[:12]}"
+        data_path = os.path.join(self.directory, name + DATA_SUFFIX)
+        index_path = os.path.join(self.directory, name + INDEX_SUFFIX)
+
+        rows = 0
+        first_timestamp = last_timestamp = None
+        try:
+            with open(data_path + ".tmp", "wb") as data, open(index_path + ".tmp", "wb") as index:
+                index.write(_HEADER.pack(INDEX_MAGIC, 0))
+                count = 0
+                for block in blocks:
+                    if not block:
+                        continue
+                    member = gzip.compress(
+                        "".join(json.dumps(row) + "\n" for row in block).encode("utf-8"),
+                        compresslevel=6,
+                        mtime=0,
+                    )
+                    bloom = bytearray(BLOOM_BITS // 8)
+                    for row in block:
+                        for key in _filter_keys(
+                            row["entity_type"], row["entity_id"], row["user_id"], row["action"]
+                        ):
+                            for p in _bloom_positions(key):
+                                bloom[p // 8] |= 1 << p % 8
+                    first, last = block[0], block[-1]
+                    index.write(_BLOCK.pack(
+                        data.tell(),
+                        len(member),
+                        len(block),
+                        first["id"],
+                        last["id"],
+                        first["timestamp"].encode(),
+                        last["timestamp"].encode(),
+                    ) + bytes(bloom))
+                    data.write(member)
+                    count += 1
+                    rows += len(block)
+                    first_timestamp = first_timestamp or first["timestamp"]
+                    last_timestamp = last["timestamp"]
+
+                index.seek(0)
+                index.write(_HEADER.pack(INDEX_MAGIC, count))
+                for f in (data, index):
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if not rows:
+                self.discard(name)
+                return None
+            os.replace(data_path + ".tmp", data_path)
+            os.replace(index_path + ".tmp", index_path)
+        except BaseException:
+            self.discard(name)
+            raise
+
+        return {"file": name, "rows": rows, "first_timestamp": first_timestamp, "last_timestamp": last_timestamp}
+
+    def discard(self, name: str):
+        """Remove the files of a segment that never made it into the catalogue"""
+        for suffix in (DATA_SUFFIX, INDEX_SUFFIX, DATA_SUFFIX + ".tmp", INDEX_SUFFIX + ".tmp"):
+            try:
+                os.remove(os.path.join(self.directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+audit_archive = AuditArchive()
+
+
+def get_audit_archive() -> AuditArchive:
+    """Get the process-wide audit archive"""
+    return audit_archive
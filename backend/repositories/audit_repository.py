@@ -0,0 +1,336 @@
+"""
+Repository for audit log queries and monthly partitions
+"""
+import re
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from database import fetch_dicts, get_db
+from utils.pagination import encode_cursor, decode_cursor
+from .audit_archive import get_audit_archive
+from .audit_writer import unpack_changes
+
+AUDIT_TABLE = "audit_log"
+# Union of audit_log and every partition, for ad-hoc queries (migration 0012)
+AUDIT_VIEW = "audit_log_all"
+
+# Same indexes as audit_log (migration 0012), created on every partition
+PARTITION_INDEXES = {
+    "timestamp": "timestamp",
+    "entity": "entity_type, entity_id, timestamp",
+    "user": "user_id, timestamp",
+}
+
+_PARTITION = re.compile(r"^audit_log_(\d{4})_(\d{2})$")
+_MONTH = re.compile(r"^\d{4}-\d{2}")
+
+
+def partition_name(month: str) -> str:
+    """'2025-09' -> 'audit_log_2025_09'"""
+    return f"{AUDIT_TABLE}_{month[:4]}_{month[5:7]}"
+
+
+def next_month(month: str) -> str:
+    """'2025-12' -> '2026-01'"""
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def first_kept_month(today: date, months: int) -> str:
+    """First month ('YYYY-MM') of the last ``months`` months, counting today's"""
+    month = f"{today.year:04d}-{today.month:02d}"
+    for _ in range(months - 1):
+        year, number = int(month[:4]), int(month[5:7])
+        month = f"{year - (number == 1):04d}-{(number - 2) % 12 + 1:02d}"
+    return month
+
+
+def list_partitions(conn) -> List[str]:
+    """Months ('YYYY-MM') that have a partition table, newest first"""
+    months = []
+    for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'audit_log_[0-9]*'"
+    ):
+        match = _PARTITION.match(name)
+        if match:
+            months.append(f"{match.group(1)}-{match.group(2)}")
+    return sorted(months, reverse=True)
+
+
+class AuditRepository:
+    """
+    Audit log reads across audit_log and its monthly partitions.
+
+    New entries always go to audit_log. rotate_partitions() moves whole
+    months older than Config.AUDIT_HOT_MONTHS into audit_log_YYYY_MM
+    tables, so audit_log stays small and every partition only holds
+    timestamps of its own month. Partitions are created from audit_log's
+    own definition; a column later added to audit_log must be added to
+    the partitions too.
+
+    archive_partitions() then turns partitions older than
+    Config.AUDIT_ARCHIVE_MONTHS into compressed segment files
+    (repositories/audit_archive.py). query() reads all three tiers.
+    """
+
+    def __init__(self):
+        self.db = get_db()
+
+    def query(
+        self,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        action: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = Config.AUDIT_PAGE_SIZE,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Audit entries matching every given filter, newest first, keyset
+        paginated on (timestamp, id). date_from / date_to are ISO dates,
+        both inclusive.
+
+        audit_log is read first, then each month from the newest back: its
+        partition through its own indexes and its archived segments through
+        their block index. Months outside the date range are skipped, and
+        reading stops once a full page is known to be newer than anything
+        left. Returns (logs, next_cursor); raises InvalidCursorError for a
+        bad cursor.
+        """
+        conditions = []
+        params = []
+        for column, value in (
+            ("entity_type", entity_type),
+            ("entity_id", entity_id),
+            ("user_id", user_id),
+            ("action", action),
+        ):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        upper = None
+        before = None
+        if date_from:
+            conditions.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            upper = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+            conditions.append("timestamp < ?")
+            params.append(upper)
+        if cursor:
+            before = tuple(decode_cursor(cursor, 2))
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend(before)
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        params.append(limit + 1)
+
+        def newest_first(rows: List[Dict]):
+            rows.sort(key=lambda row: (row["timestamp"] or "", row["id"]), reverse=True)
+            del rows[limit + 1:]
+
+        archive = get_audit_archive()
+        with self.db.read() as conn:
+            logs = fetch_dicts(
+                conn, f"SELECT * FROM {AUDIT_TABLE} {where} ORDER BY timestamp DESC, id DESC LIMIT ?", params
+            )
+            # Read in the same snapshot as the partitions, which an
+            # archival drops in the transaction that lists their segments
+            segments: Dict[str, List[str]] = {}
+            for file, month in conn.execute("SELECT file, month FROM audit_archive_segments"):
+                segments.setdefault(month, []).append(file)
+            partitions = set(list_partitions(conn))
+
+            for month in sorted(partitions | set(segments), reverse=True):
+                start, end = f"{month}-01", f"{next_month(month)}-01"
+                if upper and start >= upper:
+                    continue
+                if date_from and end <= date_from:
+                    break
+                # Everything from here on is older than a full page already found
+                if len(logs) > limit and (logs[limit]["timestamp"] or "") >= end:
+                    break
+                if month in partitions:
+                    logs += fetch_dicts(
+                        conn,
+                        f"SELECT * FROM {partition_name(month)} {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                        params,
+                    )
+                for file in segments.get(month, ()):
+                    logs += archive.segment(file).query(
+                        limit + 1,
+                        entity_type=entity_type,
+                        entity_id=entity_id,
+                        user_id=user_id,
+                        action=action,
+                        date_from=date_from,
+                        date_until=upper,
+                        before=before,
+                    )
+                newest_first(logs)
+            newest_first(logs)
+
+        next_cursor = None
+        if len(logs) > limit:
+            logs = logs[:limit]
+            last = logs[-1]
+            next_cursor = encode_cursor([last["timestamp"], last["id"]])
+
+        for log in logs:
+            log["changes"] = unpack_changes(log["changes"])
+        return logs, next_cursor
+
+    @staticmethod
+    def _ensure_partition(conn, month: str) -> str:
+        table = partition_name(month)
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if exists:
+            return table
+
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (AUDIT_TABLE,)
+        ).fetchone()[0]
+        create_sql = re.sub(
+            rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?{AUDIT_TABLE}\"?", f"CREATE TABLE {table}", create_sql
+        )
+        # Ids are assigned by audit_log and kept when rows move
+        create_sql = re.sub(r"\s+AUTOINCREMENT\b", "", create_sql, flags=re.IGNORECASE)
+        conn.execute(create_sql)
+        for name, columns in PARTITION_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table}({columns})")
+
+        AuditRepository._create_view(conn)
+        return table
+
+    @staticmethod
+    def _create_view(conn):
+        sources = [AUDIT_TABLE] + [partition_name(m) for m in list_partitions(conn)]
+        conn.execute(f"DROP VIEW IF EXISTS {AUDIT_VIEW}")
+        conn.execute(
+            f"CREATE VIEW {AUDIT_VIEW} AS " + " UNION ALL ".join(f"SELECT * FROM {source}" for source in sources)
+        )
+
+    def rotate_partitions(
+        self,
+        hot_months: int = Config.AUDIT_HOT_MONTHS,
+        batch_size: int = Config.AUDIT_PARTITION_BATCH_SIZE,
+        today: Optional[date] = None,
+    ) -> int:
+        """
+        Move audit_log entries older than the last ``hot_months`` months
+        (counting the current one) into their monthly partitions, oldest
+        first, ``batch_size`` rows per transaction. Each batch is copied
+        and deleted in the same transaction, so readers never see an entry
+        twice or not at all. Safe to run from several workers at once.
+        Returns the number of entries moved.
+        """
+        if hot_months <= 0:
+            return 0
+        cutoff = f"{first_kept_month(today or date.today(), hot_months)}-01"
+
+        moved = 0
+        while True:
+            with self.db.write() as conn:
+                oldest = conn.execute(
+                    f"SELECT timestamp FROM {AUDIT_TABLE} WHERE timestamp < ? ORDER BY timestamp LIMIT 1",
+                    (cutoff,),
+                ).fetchone()
+                if oldest is None or not _MONTH.match(oldest[0]):
+                    return moved
+
+                old_month = oldest[0][:7]
+                table = self._ensure_partition(conn, old_month)
+                bound = "timestamp >= ? AND timestamp < ?"
+                bound_params = [f"{old_month}-01", f"{next_month(old_month)}-01"]
+                last = conn.execute(
+                    f"SELECT timestamp, id FROM {AUDIT_TABLE} WHERE {bound} ORDER BY timestamp, id LIMIT 1 OFFSET ?",
+                    bound_params + [batch_size - 1],
+                ).fetchone()
+                if last is not None:
+                    bound += " AND (timestamp, id) <= (?, ?)"
+                    bound_params += [last[0], last[1]]
+
+                conn.execute(f"INSERT INTO {table} SELECT * FROM {AUDIT_TABLE} WHERE {bound}", bound_params)
+                moved += conn.execute(f"DELETE FROM {AUDIT_TABLE} WHERE {bound}", bound_params).rowcount
+
+    def archive_partitions(
+        self,
+        archive_months: int = Config.AUDIT_ARCHIVE_MONTHS,
+        block_rows: int = Config.AUDIT_ARCHIVE_BLOCK_ROWS,
+        today: Optional[date] = None,
+    ) -> int:
+        """
+        Move the partitions of months older than the last ``archive_months``
+        months (counting the current one) into archive segments, oldest
+        first. Each partition is read ``block_rows`` entries per short read
+        transaction and written to a segment file; one brief write
+        transaction then checks that nothing was added to the partition
+        meanwhile, lists the segment and drops the partition. When
+        something was added (or another worker archived it first) the
+        segment is discarded and the month is tried again next time.
+        Returns the number of entries archived.
+        """
+        if archive_months <= 0:
+            return 0
+        cutoff = first_kept_month(today or date.today(), archive_months)
+        with self.db.read() as conn:
+            months = [month for month in list_partitions(conn) if month < cutoff]
+
+        archive = get_audit_archive()
+        archived = 0
+        for month in reversed(months):
+            table = partition_name(month)
+
+            def blocks():
+                after = ("", 0)
+                while True:
+                    with self.db.read() as conn:
+                        rows = fetch_dicts(
+                            conn,
+                            f"SELECT * FROM {table} WHERE (timestamp, id) > (?, ?) ORDER BY timestamp, id LIMIT ?",
+                            [*after, block_rows],
+                        )
+                    if not rows:
+                        return
+                    yield rows
+                    after = (rows[-1]["timestamp"], rows[-1]["id"])
+
+            try:
+                segment = archive.write(table, blocks())
+            except sqlite3.OperationalError:
+                # Dropped by another worker while being read
+                continue
+
+            try:
+                with self.db.write() as conn:
+                    exists = conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                    ).fetchone()
+                    rows = segment["rows"] if segment else 0
+                    done = exists and conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == rows
+                    if done:
+                        if segment:
+                            conn.execute(
+                                "INSERT INTO audit_archive_segments "
+                                "(file, month, rows, first_timestamp, last_timestamp) VALUES (?, ?, ?, ?, ?)",
+                                (segment["file"], month, rows, segment["first_timestamp"], segment["last_timestamp"]),
+                            )
+                        conn.execute(f"DROP TABLE {table}")
+                        self._create_view(conn)
+            except BaseException:
+                if segment:
+                    archive.discard(segment["file"])
+                raise
+
+            if done:
+                archived += rows
+            elif segment:
+                archive.discard(segment["file"])
+
+        return archived
@@ -0,0 +1,325 @@
+"""
+Audit log writer: same-transaction entries or buffered group commits
+"""
+import atexit
+import base64
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import Config
+from database import get_db
+
+INSERT_AUDIT = (
+    "INSERT INTO audit_log (entity_type, entity_id, action, user_id, changes, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+# Prefix of a changes value stored zlib-compressed (base64)
+COMPRESSED_PREFIX = "zlib:"
+
+# A segment untouched this long belongs to a process that stopped
+STALE_SEGMENT_SECONDS = 60.0
+# Seconds between looks for such segments
+RECOVERY_INTERVAL = 60.0
+# Applied-segment markers are kept this long, far past the point where any
+# live process could still be retrying or replaying their segment
+APPLIED_MARKER_SECONDS = 7 * 24 * 3600
+
+# (entity_type, entity_id, action, user_id, changes, timestamp)
+Entry = Tuple[str, str, str, Optional[str], Optional[str], str]
+
+
+def _timestamp() -> str:
+    # UTC like the CURRENT_TIMESTAMP default of audit_log, plus milliseconds:
+    # buffered entries get their ids later than synchronous ones, so ids
+    # alone would misorder entries written within the same second
+    return datetime.now(timezone.utc).isoformat(sep=" ", timespec="milliseconds")[:23]
+
+
+def field_changes(old: Dict, new: Dict, ignore: Iterable[str] = ("updated_at",)) -> Dict[str, List]:
+    """{column: [old, new]} for the columns of ``new`` whose value differs from ``old``"""
+    ignore = set(ignore)
+    return {
+        column: [old.get(column), value]
+        for column, value in new.items()
+        if column not in ignore and old.get(column) != value
+    }
+
+
+def pack_changes(changes: Any, compress_over: int = Config.AUDIT_CHANGES_COMPRESS_BYTES) -> Optional[str]:
+    """
+    The audit_log.changes text for ``changes`` (a string or anything
+    JSON-serializable): compact JSON, zlib-compressed once longer than
+    ``compress_over`` bytes. unpack_changes() reverses it.
+    """
+    if changes is None:
+        return None
+    if not isinstance(changes, str):
+        changes = json.dumps(changes, separators=(",", ":"), default=str)
+    if compress_over and len(changes) > compress_over:
+        packed = COMPRESSED_PREFIX + base64.b64encode(zlib.compress(changes.encode("utf-8"), 9)).decode("ascii")
+        if len(packed) < len(changes):
+            return packed
+    return changes
+
+
+def unpack_changes(changes: Optional[str]) -> Optional[str]:
+    """The changes text as it was given to pack_changes()"""
+    if changes and changes.startswith(COMPRESSED_PREFIX):
+        return zlib.decompress(base64.b64decode(changes[len(COMPRESSED_PREFIX):])).decode("utf-8")
+    return changes
+
+
+class AuditWriter:
+    """
+    Writes audit_log entries in one of two ways.
+
+    Synchronous: the entry is inserted in the transaction of the change it
+    records, so both commit or neither does. Used for every entry in
+    "sync" mode and for Config.AUDIT_SYNC_ACTIONS (deletes, closing and
+    reopening, workflow approvals) in either mode.
+
+    Buffered ("async" mode): once the change commits, the entry is
+    appended to a local spool file and queued. A process that dies between
+    that commit and the append (a window of microseconds) loses the entry;
+    actions that must never go unaudited belong in AUDIT_SYNC_ACTIONS. A background thread inserts
+    the queue with one executemany per ``flush_interval`` seconds (sooner
+    once ``batch_size`` entries wait), so a burst of changes costs one
+    audit commit instead of one insert per change. Entries reach audit_log
+    up to ``flush_interval`` seconds after their change.
+
+    The spool makes buffered entries survive a crash. Each flush closes the
+    current spool file (segment) and inserts its entries together with the
+    segment's name in audit_spool_applied (migration 0013), then deletes
+    the file. Segments left behind by a process that died are replayed by
+    the next writer that looks (recover()); a segment already recorded as
+    applied is only deleted, so nothing is inserted twice. Markers are
+    kept for APPLIED_MARKER_SECONDS, so a segment replayed by another
+    process while its owner was still retrying it is not inserted again
+    when that retry succeeds. Once appended, entries are flushed to the OS
+    (a crashed process loses nothing spooled); ``fsync`` also guards
+    against power loss.
+    """
+
+    def __init__(
+        self,
+        mode: str = Config.AUDIT_WRITE_MODE,
+        sync_actions: Tuple[str, ...] = Config.AUDIT_SYNC_ACTIONS,
+        spool_dir: str = Config.AUDIT_SPOOL_DIR,
+        flush_interval: float = Config.AUDIT_FLUSH_INTERVAL,
+        batch_size: int = Config.AUDIT_FLUSH_BATCH,
+        fsync: bool = Config.AUDIT_SPOOL_FSYNC,
+    ):
+        if mode not in ("async", "sync"):
+            raise ValueError(f"Unknown audit write mode {mode!r}; use 'async' or 'sync'")
+        self.mode = mode
+        self.sync_actions = set(sync_actions)
+        self.spool_dir = spool_dir
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        # Guards the queue and the open segment; _flush_lock serializes flushes
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._thread: Optional[threading.Thread] = None
+        self._pending: List[Entry] = []
+        self._segment: Optional[str] = None
+        self._file = None
+        # Closed segments waiting to be inserted, oldest first
+        self._sealed: List[Tuple[Optional[str], List[Entry]]] = []
+        self._next_recovery = 0.0
+
+    def record(
+        self,
+        conn,
+        entity_type: str,
+        entity_id: Any,
+        action: str,
+        user_id: Optional[str] = None,
+        changes: Any = None,
+        sync: bool = False,
+    ):
+        """
+        Audit ``action`` on an entity changed in ``conn``'s write
+        transaction. ``changes`` is a string or anything JSON-serializable
+        (stored through pack_changes()).
+
+        The entry is inserted right away when it has to be synchronous (see
+        the class docstring, or ``sync=True``) or when ``conn`` is not
+        inside Database.write(); otherwise it is buffered once the
+        transaction commits and dropped if it rolls back.
+        """
+        entry = (entity_type, str(entity_id), action, user_id, pack_changes(changes), _timestamp())
+
+        if not (sync or self.mode == "sync" or action in self.sync_actions):
+            after_commit = getattr(conn, "after_commit", None)
+            if after_commit is not None and after_commit(lambda: self.submit([entry])):
+                return
+        conn.execute(INSERT_AUDIT, entry)
+
+    def submit(self, entries: List[Entry]):
+        """Spool committed entries and queue them for the next group commit"""
+        with self._lock:
+            if os.getpid() != self._pid:
+                # A forked worker starts with its own queue, segment and thread
+                self._reset()
+            self._start()
+            try:
+                self._spool(entries)
+            except OSError:
+                # Still inserted by the next flush; only a crash before it would lose them
+                traceback.print_exc()
+            self._pending.extend(entries)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def _spool(self, entries: List[Entry]):
+        if self._file is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._segment = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:12]}.jsonl"
+            self._file = open(os.path.join(self.spool_dir, self._segment), "a", encoding="utf-8")
+        self._file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _seal(self):
+        # Caller holds _lock
+        if not self._pending:
+            return
+        if self._file is not None:
+            self._file.close()
+        self._sealed.append((self._segment, self._pending))
+        self._pending, self._segment, self._file = [], None, None
+
+    def _apply(self, segment: Optional[str], entries: List[Entry]) -> int:
+        # Caller holds _flush_lock; returns the number of entries inserted
+        with get_db().write() as conn:
+            applied = segment is not None and conn.execute(
+                "SELECT 1 FROM audit_spool_applied WHERE segment = ?", (segment,)
+            ).fetchone()
+            if not applied:
+                conn.executemany(INSERT_AUDIT, entries)
+                if segment is not None:
+                    conn.execute("INSERT INTO audit_spool_applied (segment) VALUES (?)", (segment,))
+
+        if segment is not None:
+            try:
+                os.remove(os.path.join(self.spool_dir, segment))
+            except FileNotFoundError:
+                pass
+        return 0 if applied else len(entries)
+
+    def flush(self) -> int:
+        """Insert everything buffered so far; returns the number of entries written"""
+        with self._flush_lock:
+            with self._lock:
+                self._seal()
+                batches = list(self._sealed)
+            written = 0
+            for segment, entries in batches:
+                # On an error the rest stays sealed for the next flush
+                written += self._apply(segment, entries)
+                with self._lock:
+                    self._sealed.pop(0)
+            return written
+
+    @staticmethod
+    def _read_segment(path: str) -> List[Entry]:
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by the crash
+                    continue
+                if isinstance(entry, list) and len(entry) == 6:
+                    entries.append(tuple(entry))
+        return entries
+
+    def recover(self) -> int:
+        """
+        Insert the entries of spool segments left behind by processes that
+        stopped before flushing them. Returns the number of entries recovered.
+        """
+        try:
+            names = sorted(os.listdir(self.spool_dir))
+        except FileNotFoundError:
+            return 0
+
+        recovered = 0
+        cutoff = time.time() - STALE_SEGMENT_SECONDS
+        with self._flush_lock:
+            with self._lock:
+                own = {self._segment} | {segment for segment, _ in self._sealed}
+            for name in names:
+                path = os.path.join(self.spool_dir, name)
+                if not name.endswith(".jsonl") or name in own:
+                    continue
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                    entries = self._read_segment(path)
+                except FileNotFoundError:
+                    # Replayed by another process meanwhile
+                    continue
+                recovered += self._apply(name, entries)
+
+            with get_db().write() as conn:
+                conn.execute(
+                    "DELETE FROM audit_spool_applied WHERE applied_at < datetime('now', ?)",
+                    (f"-{APPLIED_MARKER_SECONDS} seconds",),
+                )
+
+        if recovered:
+            print(f"Recovered {recovered} audit entries from the spool")
+        return recovered
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() >= self._next_recovery:
+                    self._next_recovery = time.monotonic() + RECOVERY_INTERVAL
+                    self.recover()
+            except Exception:
+                # Database busy or similar: entries stay queued and spooled
+                traceback.print_exc()
+
+    def close(self):
+        """Flush what is still buffered (registered to run at exit)"""
+        if os.getpid() != self._pid or not (self._pending or self._sealed):
+            return
+        try:
+            self.flush()
+        except Exception:
+            traceback.print_exc()
+
+
+audit_writer = AuditWriter()
+
+
+def get_audit_writer() -> AuditWriter:
+    """Get the process-wide audit writer"""
+    return audit_writer
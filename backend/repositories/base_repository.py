@@ -1,12 +1,23 @@
 """
 Base repository for CRUD operations
 """
-import json
+import sqlite3
 import uuid
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List, Dict, Iterator
 from datetime import datetime, timedelta
 from config import Config, EntityType
-from database import get_db
+from database import fetch_dict, fetch_dicts, get_db
+from utils.pagination import encode_cursor, decode_cursor
+from .audit_writer import get_audit_writer
+from .counts import capped_count, maintained_count
+from .reference_cache import reference_cache
+
+# Created ids kept in a BULK_IMPORT audit entry; the rest are only counted
+BULK_AUDIT_SAMPLE_IDS = 20
+
+
+class DuplicateError(ValueError):
+    """Raised when a write would create a second active record with the same key"""
 
 
 class Repository:
@@ -15,155 +26,294 @@ class Repository:
     def __init__(self, entity_type: EntityType):
         self.entity_type = entity_type
         self.table = entity_type.value
+        # Active records are unique on this column, case-insensitively (migration 0005)
+        self.unique_column = "employee_number" if entity_type == EntityType.EMPLOYEES else "name"
+        # Public columns only: SELECT * would also return the internal ref (migration 0011)
+        self.columns = "id, name, created_at, updated_at, is_active" + (
+            ", employee_number" if entity_type == EntityType.EMPLOYEES else ""
+        )
         self.db = get_db()
 
-    def get_all(
-        self, 
-        days: Optional[int] = None, 
-        page: int = 1, 
-        search: Optional[str] = None
-    ) -> Tuple[List[Dict], int]:
-        """Get all items with optional filtering and pagination"""
-        conn = self.db.get_connection()
-        c = conn.cursor()
+    def _unique_value(self, name: str, employee_number: Optional[str] = None) -> Optional[str]:
+        return employee_number if self.unique_column == "employee_number" else name
 
-        query = f"SELECT * FROM {self.table} WHERE is_active = 1"
+    def _is_duplicate(self, error: sqlite3.IntegrityError) -> bool:
+        # SQLite names the columns of the violated index, not the index
+        return str(error) == f"UNIQUE constraint failed: {self.table}.{self.unique_column}"
+
+    def _filters(self, days: Optional[int], search: Optional[str]) -> Tuple[str, List]:
+        where = "WHERE is_active = 1"
         params = []
 
         if days:
             date_filter = datetime.now() - timedelta(days=days)
-            query += " AND created_at >= ?"
+            where += " AND created_at >= ?"
             params.append(date_filter)
 
         if search:
-            query += " AND name LIKE ?"
+            where += " AND name LIKE ?"
             params.append(f"%{search}%")
 
-        # Get total count
-        count_query = query.replace("SELECT *", "SELECT COUNT(*)")
-        c.execute(count_query, params)
-        total = c.fetchone()[0]
+        return where, params
+
+    def _count(self, conn, days: Optional[int], search: Optional[str]) -> Tuple[int, bool]:
+        if not days and not search:
+            return maintained_count(conn, self.table), True
+        where, params = self._filters(days, search)
+        return capped_count(conn, self.table, where, params)
+
+    def count(self, days: Optional[int] = None, search: Optional[str] = None) -> Tuple[int, bool]:
+        """
+        Total active items as (count, exact). Unfiltered totals are exact
+        and O(1); filtered totals stop at Config.COUNT_CAP.
+        """
+        with self.db.read() as conn:
+            return self._count(conn, days, search)
+
+    def get_all(
+        self, 
+        days: Optional[int] = None, 
+        page: int = 1, 
+        search: Optional[str] = None
+    ) -> Tuple[List[Dict], int]:
+        """
+        Get all items with optional filtering and page-number pagination.
+        Deep pages scan every skipped row; use get_page() to walk large tables.
+        """
+        where, params = self._filters(days, search)
 
-        # Get paginated results
-        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-        params.extend([Config.PAGE_SIZE, (page - 1) * Config.PAGE_SIZE])
+        with self.db.read() as conn:
+            total, _ = self._count(conn, days, search)
 
-        c.execute(query, params)
-        items = [dict(row) for row in c.fetchall()]
-        conn.close()
+            # Get paginated results
+            items = fetch_dicts(
+                conn,
+                f"SELECT {self.columns} FROM {self.table} {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [Config.PAGE_SIZE, (page - 1) * Config.PAGE_SIZE],
+            )
 
         return items, total
 
+    def get_page(
+        self,
+        days: Optional[int] = None,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = Config.PAGE_SIZE,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Keyset pagination over (created_at, id), newest first.
+
+        Returns (items, next_cursor); next_cursor is None on the last page.
+        Rows inserted while a client is paging never shift or repeat the
+        rows it has yet to see. Raises InvalidCursorError for a bad cursor.
+        """
+        where, params = self._filters(days, search)
+
+        if cursor:
+            where += " AND (created_at, id) < (?, ?)"
+            params.extend(decode_cursor(cursor, 2))
+
+        with self.db.read() as conn:
+            # Fetch one extra row to know whether another page exists
+            items = fetch_dicts(
+                conn,
+                f"SELECT {self.columns} FROM {self.table} {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                params + [limit + 1],
+            )
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = encode_cursor([last["created_at"], last["id"]])
+
+        return items, next_cursor
+
+    def iter_all(self, days: Optional[int] = None) -> Iterator[Dict]:
+        """Stream every active item (newest first) without loading them all"""
+        where, params = self._filters(days, None)
+        return self.db.iter_rows(
+            f"SELECT {self.columns} FROM {self.table} {where} ORDER BY created_at DESC, id DESC", params
+        )
+
     def get_by_id(self, item_id: str) -> Optional[Dict]:
         """Get a single item by ID"""
-        conn = self.db.get_connection()
-        c = conn.cursor()
-        c.execute(
-            f"SELECT * FROM {self.table} WHERE id = ? AND is_active = 1", 
-            (item_id,)
-        )
-        row = c.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        with self.db.read() as conn:
+            return fetch_dict(
+                conn,
+                f"SELECT {self.columns} FROM {self.table} WHERE id = ? AND is_active = 1",
+                (item_id,),
+            )
 
     def create(self, name: str, employee_number: Optional[str] = None) -> Dict:
         """Create a new item"""
-        conn = self.db.get_connection()
-        c = conn.cursor()
+        item_id = str(uuid.uuid4())
 
-        item_id = str(uuid.uuid4())[:8]
-        
-        if self.entity_type == EntityType.EMPLOYEES and employee_number:
-            c.execute(
-                f"INSERT INTO {self.table} (id, name, employee_number) VALUES (?, ?, ?)", 
-                (item_id, name, employee_number)
-            )
-            changes = {"name": name, "employee_number": employee_number}
-        else:
-            c.execute(
-                f"INSERT INTO {self.table} (id, name) VALUES (?, ?)", 
-                (item_id, name)
-            )
-            changes = {"name": name}
-        
-        # Log the creation
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, changes) VALUES (?, ?, ?, ?)",
-            (self.entity_type.value, item_id, "CREATE", json.dumps(changes)),
-        )
+        try:
+            with self.db.write() as conn:
+                c = conn.cursor()
+
+                if self.entity_type == EntityType.EMPLOYEES and employee_number:
+                    c.execute(
+                        f"INSERT INTO {self.table} (id, name, employee_number) VALUES (?, ?, ?)", 
+                        (item_id, name, employee_number)
+                    )
+                    changes = {"name": name, "employee_number": employee_number}
+                else:
+                    c.execute(
+                        f"INSERT INTO {self.table} (id, name) VALUES (?, ?)", 
+                        (item_id, name)
+                    )
+                    changes = {"name": name}
+            
+                # Log the creation
+                get_audit_writer().record(conn, self.entity_type.value, item_id, "CREATE", changes=changes)
 
-        conn.commit()
-        c.execute(f"SELECT * FROM {self.table} WHERE id = ?", (item_id,))
-        new_item = dict(c.fetchone())
-        conn.close()
+                c.execute(f"SELECT {self.columns} FROM {self.table} WHERE id = ?", (item_id,))
+                new_item = dict(c.fetchone())
+        except sqlite3.IntegrityError as e:
+            if not self._is_duplicate(e):
+                raise
+            raise DuplicateError(f"{self.entity_type.value}: {self._unique_value(name, employee_number)!r} already exists")
 
+        reference_cache.invalidate(self.table)
         return new_item
 
     def update(self, item_id: str, name: str, employee_number: Optional[str] = None) -> Optional[Dict]:
         """Update an existing item"""
-        conn = self.db.get_connection()
-        c = conn.cursor()
+        try:
+            with self.db.write() as conn:
+                c = conn.cursor()
 
-        # Get old value for audit log
-        c.execute(f"SELECT * FROM {self.table} WHERE id = ?", (item_id,))
-        old_item = c.fetchone()
-        if not old_item:
-            conn.close()
-            return None
+                # Get old value for audit log
+                c.execute(f"SELECT {self.columns} FROM {self.table} WHERE id = ?", (item_id,))
+                old_item = c.fetchone()
+                if not old_item:
+                    return None
 
-        old_item = dict(old_item)
+                old_item = dict(old_item)
 
-        if self.entity_type == EntityType.EMPLOYEES and employee_number is not None:
-            c.execute(
-                f"UPDATE {self.table} SET name = ?, employee_number = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (name, employee_number, item_id),
-            )
-            changes = {
-                "old": {"name": old_item["name"], "employee_number": old_item.get("employee_number")},
-                "new": {"name": name, "employee_number": employee_number}
-            }
-        else:
-            c.execute(
-                f"UPDATE {self.table} SET name = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (name, item_id),
-            )
-            changes = {"old": old_item["name"], "new": name}
-        
-        # Log the update
-        c.execute(
-            "INSERT INTO audit_log (entity_type, entity_id, action, changes) VALUES (?, ?, ?, ?)",
-            (
-                self.entity_type.value,
-                item_id,
-                "UPDATE",
-                json.dumps(changes),
-            ),
-        )
+                if self.entity_type == EntityType.EMPLOYEES and employee_number is not None:
+                    c.execute(
+                        f"UPDATE {self.table} SET name = ?, employee_number = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                        (name, employee_number, item_id),
+                    )
+                    changes = {
+                        "old": {"name": old_item["name"], "employee_number": old_item.get("employee_number")},
+                        "new": {"name": name, "employee_number": employee_number}
+                    }
+                else:
+                    c.execute(
+                        f"UPDATE {self.table} SET name = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                        (name, item_id),
+                    )
+                    changes = {"old": old_item["name"], "new": name}
+            
+                # Log the update
+                get_audit_writer().record(conn, self.entity_type.value, item_id, "UPDATE", changes=changes)
 
-        conn.commit()
-        c.execute(f"SELECT * FROM {self.table} WHERE id = ?", (item_id,))
-        updated_item = dict(c.fetchone())
-        conn.close()
+                c.execute(f"SELECT {self.columns} FROM {self.table} WHERE id = ?", (item_id,))
+                updated_item = dict(c.fetchone())
+        except sqlite3.IntegrityError as e:
+            if not self._is_duplicate(e):
+                raise
+            raise DuplicateError(f"{self.entity_type.value}: {self._unique_value(name, employee_number)!r} already exists")
 
+        reference_cache.invalidate(self.table)
         return updated_item
 
     def delete(self, item_id: str) -> bool:
         """Soft delete an item"""
-        conn = self.db.get_connection()
-        c = conn.cursor()
+        with self.db.write() as conn:
+            c = conn.cursor()
 
-        c.execute(
-            f"UPDATE {self.table} SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (item_id,),
-        )
-        affected = c.rowcount
-
-        if affected > 0:
             c.execute(
-                "INSERT INTO audit_log (entity_type, entity_id, action) VALUES (?, ?, ?)",
-                (self.entity_type.value, item_id, "DELETE"),
+                f"UPDATE {self.table} SET is_active = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (item_id,),
             )
+            affected = c.rowcount
 
-        conn.commit()
-        conn.close()
+            if affected > 0:
+                get_audit_writer().record(conn, self.entity_type.value, item_id, "DELETE")
+
+        if affected > 0:
+            reference_cache.invalidate(self.table)
         return affected > 0
+
+    def bulk_upsert(self, items: List[Dict], user_id: Optional[str] = None) -> List[Dict]:
+        """
+        Insert many items in one transaction, skipping any whose unique key
+        (name, or employee_number for employees) already exists among
+        active records or earlier in ``items``, case-insensitively.
+
+        Writes a single BULK_IMPORT audit entry with the created and skipped
+        counts and the first BULK_AUDIT_SAMPLE_IDS created ids. Returns one
+        result per input item, in order: {"name", "status": "created" |
+        "skipped", "id"}.
+        """
+        if not items:
+            return []
+
+        rows = [
+            (
+                # Full uuids: 8-character ids start colliding at import sizes,
+                # and a colliding row would be reported as a duplicate
+                str(uuid.uuid4()),
+                item["name"],
+                item.get("employee_number") if self.entity_type == EntityType.EMPLOYEES else None,
+            )
+            for item in items
+        ]
+
+        with self.db.write() as conn:
+            if self.entity_type == EntityType.EMPLOYEES:
+                conn.executemany(
+                    f"INSERT INTO {self.table} (id, name, employee_number) VALUES (?, ?, ?) "
+                    "ON CONFLICT DO NOTHING",
+                    rows,
+                )
+            else:
+                conn.executemany(
+                    f"INSERT INTO {self.table} (id, name) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                    [row[:2] for row in rows],
+                )
+
+            # executemany cannot report which rows were ignored, so look the
+            # generated ids up (in chunks that stay under SQLite's variable limit)
+            created = set()
+            for start in range(0, len(rows), 500):
+                chunk = [row[0] for row in rows[start:start + 500]]
+                placeholders = ", ".join("?" * len(chunk))
+                created.update(
+                    r[0] for r in conn.execute(
+                        f"SELECT id FROM {self.table} WHERE id IN ({placeholders})", chunk
+                    )
+                )
+
+            results = [
+                {
+                    "name": name,
+                    "status": "created" if item_id in created else "skipped",
+                    "id": item_id if item_id in created else None,
+                }
+                for item_id, name, _ in rows
+            ]
+
+            if created:
+                get_audit_writer().record(
+                    conn,
+                    self.entity_type.value,
+                    "bulk",
+                    "BULK_IMPORT",
+                    user_id,
+                    {
+                        "created": len(created),
+                        "skipped": len(results) - len(created),
+                        "sample_ids": [r["id"] for r in results if r["id"]][:BULK_AUDIT_SAMPLE_IDS],
+                    },
+                )
+
+        if created:
+            reference_cache.invalidate(self.table)
+        return results
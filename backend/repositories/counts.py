@@ -0,0 +1,58 @@
+"""
+Row counts for list endpoints.
+
+Unfiltered totals come from the trigger-maintained row_counts table
+(migration 0003). Filtered totals (search, date range) are counted up to
+Config.COUNT_CAP and reported as inexact beyond that.
+"""
+from typing import Dict, List, Tuple
+from config import Config
+
+# Roles that see every uploaded DMT (plus their own sessions)
+DMT_VIEW_ALL_ROLES = ("Admin", "Inspector", "Supervisor")
+
+
+def maintained_count(conn, table: str, bucket: str = "active") -> int:
+    """Current value of a row_counts counter (0 if it was never touched)"""
+    row = conn.execute(
+        "SELECT n FROM row_counts WHERE table_name = ? AND bucket = ?",
+        (table, bucket),
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def capped_count(conn, table: str, where: str, params: List, cap: int = None) -> Tuple[int, bool]:
+    """
+    Count rows matching ``where`` but stop after ``cap``.
+    Returns (count, exact); count is ``cap`` when exact is False.
+    """
+    cap = Config.COUNT_CAP if cap is None else cap
+    n = conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} {where} LIMIT ?)",
+        list(params) + [cap + 1],
+    ).fetchone()[0]
+    if n > cap:
+        return cap, False
+    return n, True
+
+
+def dmt_visible_count(conn, user: Dict) -> int:
+    """Active DMT records visible to ``user``, assembled from maintained buckets"""
+    uid = user["id"]
+    sessions = maintained_count(conn, "dmt_records", f"session:{uid}")
+
+    if user["role"] in DMT_VIEW_ALL_ROLES:
+        return maintained_count(conn, "dmt_records", "public") + sessions
+
+    # Uploaded DMTs created by or assigned to the user, counted once
+    return (
+        maintained_count(conn, "dmt_records", f"created:{uid}")
+        + maintained_count(conn, "dmt_records", f"assigned:{uid}")
+        - maintained_count(conn, "dmt_records", f"own:{uid}")
+        + sessions
+    )
+
+
+def format_count(n: int, exact: bool) -> str:
+    """Display form of a count, e.g. "1000+" when capped"""
+    return str(n) if exact else f"{n}+"
@@ -0,0 +1,382 @@
+"""
+Repository for DMT record queries
+"""
+import html
+import json
+import re
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from config import Config
+from database import fetch_dicts, get_db
+from utils.pagination import encode_cursor, decode_cursor
+from .audit_repository import AuditRepository
+from .audit_writer import field_changes
+from .counts import DMT_VIEW_ALL_ROLES, capped_count, dmt_visible_count
+from .reference_codes import REFERENCE_COLUMNS, get_reference_codes
+
+# Control characters used as snippet highlight markers, swapped for <mark>
+# tags once the snippet text has been HTML-escaped
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_END = "\x03"
+
+_QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+# Columns the listing can be ordered by; each leads an index (migration 0008).
+# part_num holds dictionary codes (migration 0011), so ordering by it groups
+# equal part numbers rather than sorting them alphabetically
+SORTABLE_COLUMNS = ("report_number", "created_at", "status", "part_num", "shop_order")
+DEFAULT_SORT = "-report_number"
+
+# Groupings for the cost-of-quality report. The date groupings are answered
+# from idx_dmt_records_cost_by_date alone (migration 0010); the others group
+# by dictionary code and are named afterwards
+COST_GROUPS = {
+    "day": "date",
+    "month": "substr(date, 1, 7)",
+    "year": "substr(date, 1, 4)",
+    "customer": "customer",
+    "part_num": "part_num",
+    "failure_code": "failure_code",
+    "work_center": "work_center",
+}
+
+_columns: Optional[List[str]] = None
+
+
+def dmt_columns(conn) -> List[str]:
+    """Column names of dmt_records, read once per process"""
+    global _columns
+    if _columns is None:
+        _columns = [row["name"] for row in conn.execute("PRAGMA table_info(dmt_records)")]
+    return _columns
+
+
+def dmt_changes(conn, old: Dict, new: Dict) -> Dict[str, List]:
+    """
+    Field-level diff of two dmt_records rows read through ``conn``, for
+    the audit log: {column: [old, new]} for changed columns only, with
+    reference columns as names rather than codes.
+    """
+    old, new = get_reference_codes().decode_rows([dict(old), dict(new)], conn)
+    return field_changes(old, new)
+
+
+def parse_sort(sort: Optional[str]) -> Tuple[str, bool]:
+    """'-column' / 'column' into (column, descending); only SORTABLE_COLUMNS"""
+    sort = sort or DEFAULT_SORT
+    column = sort.lstrip("-")
+    if column not in SORTABLE_COLUMNS:
+        raise ValueError(f"Cannot sort by {column!r}; use one of {', '.join(SORTABLE_COLUMNS)}")
+    return column, sort.startswith("-")
+
+
+def _keyset(column: str, descending: bool, value, record_id: str) -> Tuple[str, List]:
+    """
+    Rows after (value, record_id) in ORDER BY column, id (both ASC or DESC).
+    SQLite sorts NULL lowest, so NULLs come last descending and first ascending.
+    """
+    if descending:
+        if value is None:
+            return f"{column} IS NULL AND id < ?", [record_id]
+        return f"({column} < ? OR {column} IS NULL OR ({column} = ? AND id < ?))", [value, value, record_id]
+    if value is None:
+        return f"(({column} IS NULL AND id > ?) OR {column} IS NOT NULL)", [record_id]
+    return f"({column} > ? OR ({column} = ? AND id > ?))", [value, value, record_id]
+
+
+def build_fts_query(text: str) -> Optional[str]:
+    """
+    Turn user input into a safe FTS5 query: "quoted phrases" stay phrases,
+    every other word must match, and the last word matches as a prefix.
+    Returns None when there is nothing to search for.
+    """
+    terms = []
+    for phrase, word in _QUERY_TERM.findall(text or ""):
+        if phrase.strip():
+            terms.append('"' + phrase.strip().replace('"', '""') + '"')
+        elif word:
+            # Strip FTS5 syntax characters; keep letters, digits and inner punctuation
+            word = word.strip('"*^():+-')
+            if word:
+                terms.append('"' + word.replace('"', '""') + '"')
+    if not terms:
+        return None
+    if not text.rstrip().endswith('"'):
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class DMTRepository:
+    """Read access to dmt_records scoped to what a user is allowed to see"""
+
+    def __init__(self):
+        self.db = get_db()
+
+    def visibility_clause(self, user: Dict) -> Tuple[str, List]:
+        """WHERE clause limiting dmt_records to rows visible to ``user``"""
+        where = "WHERE is_active = 1"
+        params = []
+
+        if user["role"] in DMT_VIEW_ALL_ROLES:
+            # Admin, Inspector, and Supervisor can see all uploaded DMTs
+            where += " AND (is_session = 0 OR (is_session = 1 AND created_by = ?))"
+            params.append(user["id"])
+        else:
+            # Others can only see their own sessions and assigned/created uploaded DMTs
+            where += " AND ((is_session = 0 AND (created_by = ? OR assigned_to = ?)) OR (is_session = 1 AND created_by = ?))"
+            params.extend([user["id"], user["id"], user["id"]])
+
+        return where, params
+
+    def _filtered(self, user: Dict, search: Optional[str]) -> Tuple[str, List]:
+        where, params = self.visibility_clause(user)
+
+        if search:
+            where += (
+                " AND (report_number LIKE ? OR part_num IN (SELECT ref FROM partnumbers WHERE name LIKE ?)"
+                " OR shop_order LIKE ? OR status LIKE ?)"
+            )
+            search_param = f"%{search}%"
+            params.extend([search_param, search_param, search_param, search_param])
+
+        return where, params
+
+    def count(self, user: Dict, search: Optional[str] = None) -> Tuple[int, bool]:
+        """
+        Visible records as (count, exact). Without a search this is read
+        from maintained counters; searches stop counting at Config.COUNT_CAP.
+        """
+        with self.db.read() as conn:
+            if not search:
+                return dmt_visible_count(conn, user), True
+            where, params = self._filtered(user, search)
+            return capped_count(conn, "dmt_records", where, params)
+
+    def get_page(
+        self,
+        user: Dict,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = Config.PAGE_SIZE,
+        fields: Optional[Sequence[str]] = None,
+        sort: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Visible records, keyset paginated.
+
+        ``sort`` is one of SORTABLE_COLUMNS, prefixed with '-' for
+        descending (default: newest report number first); ties break on id
+        and NULLs sort last when descending. ``fields`` limits the columns
+        returned; id and the sort column are always included.
+
+        Returns (records, next_cursor). Raises InvalidCursorError for a bad
+        cursor and ValueError for an unknown sort column or field.
+        """
+        column, descending = parse_sort(sort)
+        where, params = self._filtered(user, search)
+
+        if cursor:
+            value, record_id = decode_cursor(cursor, 2)
+            clause, clause_params = _keyset(column, descending, value, record_id)
+            where += f" AND {clause}"
+            params.extend(clause_params)
+
+        direction = "DESC" if descending else "ASC"
+        with self.db.read() as conn:
+            if fields:
+                available = set(dmt_columns(conn))
+                unknown = [field for field in fields if field not in available]
+                if unknown:
+                    raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+                selected = ", ".join(dict.fromkeys(["id", column, *fields]))
+            else:
+                selected = "*"
+
+            # Fetch one extra row to know whether another page exists
+            records = fetch_dicts(
+                conn,
+                f"SELECT {selected} FROM dmt_records {where} ORDER BY {column} {direction}, id {direction} LIMIT ?",
+                params + [limit + 1],
+            )
+
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            next_cursor = encode_cursor([last[column], last["id"]])
+
+        return get_reference_codes().decode_rows(records), next_cursor
+
+    @staticmethod
+    def _export_filter(days: Optional[int]) -> Tuple[str, List]:
+        where = "WHERE is_active = 1"
+        params = []
+        if days is not None and days > 0:
+            where += " AND created_at >= date('now', '-' || ? || ' days')"
+            params.append(days)
+        return where, params
+
+    def export_count(self, days: Optional[int] = None) -> int:
+        """Number of records iter_export(days) will yield"""
+        where, params = self._export_filter(days)
+        with self.db.read() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM dmt_records {where}", params).fetchone()[0]
+
+    def iter_export(self, days: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Stream every active record (created in the last ``days`` days, if
+        given), newest first. Not scoped by visibility: only roles allowed
+        to export may call it.
+        """
+        where, params = self._export_filter(days)
+        return get_reference_codes().iter_decoded(
+            self.db.iter_rows(f"SELECT * FROM dmt_records {where} ORDER BY created_at DESC", params),
+            Config.EXPORT_CHUNK_SIZE,
+        )
+
+    def cost_of_quality(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        group_by: str = "month",
+    ) -> List[Dict]:
+        """
+        Cost of quality per ``group_by`` (see COST_GROUPS) for active,
+        uploaded records whose DMT date falls in [date_from, date_to]
+        (ISO dates, both optional): record count, scrap and other costs,
+        their sum and rework hours. Not scoped by visibility. Raises
+        ValueError for an unknown grouping.
+        """
+        if group_by not in COST_GROUPS:
+            raise ValueError(f"Cannot group by {group_by!r}; use one of {', '.join(COST_GROUPS)}")
+
+        # Matches the partial index condition so the planner can use it
+        where = "WHERE is_active = 1 AND is_session = 0 AND date IS NOT NULL"
+        params = []
+        if date_from:
+            where += " AND date >= ?"
+            params.append(date_from)
+        if date_to:
+            where += " AND date <= ?"
+            params.append(date_to)
+
+        with self.db.read() as conn:
+            rows = fetch_dicts(
+                conn,
+                f"""
+                SELECT {COST_GROUPS[group_by]} AS "group",
+                       COUNT(*) AS records,
+                       TOTAL(material_scrap_cost) AS material_scrap_cost,
+                       TOTAL(others_cost) AS others_cost,
+                       TOTAL(material_scrap_cost) + TOTAL(others_cost) AS total_cost,
+                       TOTAL(rework_hours) AS rework_hours
+                FROM dmt_records {where}
+                GROUP BY 1
+                ORDER BY 1
+                """,
+                params,
+            )
+
+        if group_by in REFERENCE_COLUMNS:
+            names = get_reference_codes().decode_rows([{group_by: row["group"]} for row in rows])
+            for row, named in zip(rows, names):
+                row["group"] = named[group_by]
+            rows.sort(key=lambda row: (row["group"] is None, (row["group"] or "").casefold()))
+        return rows
+
+    def search(
+        self,
+        user: Dict,
+        query: str,
+        cursor: Optional[str] = None,
+        limit: int = Config.PAGE_SIZE,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Full-text search over the DMT free-text fields, best matches first (bm25).
+
+        Each record gets a ``score`` (lower is better) and an HTML-escaped
+        ``snippet`` with matches wrapped in <mark>. Returns
+        (records, next_cursor). Raises InvalidCursorError for a bad cursor.
+        """
+        match = build_fts_query(query)
+        if not match:
+            return [], None
+
+        where, params = self.visibility_clause(user)
+        where = where.replace("WHERE ", "WHERE dmt_records_fts MATCH ? AND ", 1)
+        params.insert(0, match)
+
+        if cursor:
+            where += " AND (bm25(dmt_records_fts), dmt_records.rowid) > (?, ?)"
+            params.extend(decode_cursor(cursor, 2))
+
+        with self.db.read() as conn:
+            records = fetch_dicts(
+                conn,
+                f"""
+                SELECT dmt_records.*,
+                       dmt_records.rowid AS _rowid,
+                       bm25(dmt_records_fts) AS score,
+                       snippet(dmt_records_fts, -1, ?, ?, '…', 16) AS snippet
+                FROM dmt_records_fts
+                JOIN dmt_records ON dmt_records.rowid = dmt_records_fts.rowid
+                {where}
+                ORDER BY score, _rowid
+                LIMIT ?
+                """,
+                [_HIGHLIGHT_START, _HIGHLIGHT_END] + params + [limit + 1],
+            )
+
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            next_cursor = encode_cursor([last["score"], last["_rowid"]])
+
+        for record in records:
+            del record["_rowid"]
+            record["snippet"] = (
+                html.escape(record["snippet"] or "")
+                .replace(_HIGHLIGHT_START, "<mark>")
+                .replace(_HIGHLIGHT_END, "</mark>")
+            )
+
+        return get_reference_codes().decode_rows(records), next_cursor
+
+    def history(
+        self,
+        dmt_id: str,
+        cursor: Optional[str] = None,
+        limit: int = Config.AUDIT_PAGE_SIZE,
+    ) -> Optional[Tuple[List[Dict], Optional[str]]]:
+        """
+        Audit timeline of one record, deleted or not, newest first:
+        (entries, next_cursor), or None when there is no such record.
+
+        Read through idx_audit_log_entity (and the same index on every
+        partition), one range per tier. ``changes`` is the field-level diff
+        stored at write time ({column: [old, new]}), a note, or None.
+        """
+        with self.db.read() as conn:
+            exists = conn.execute("SELECT 1 FROM dmt_records WHERE id = ?", (dmt_id,)).fetchone()
+        if not exists:
+            return None
+
+        logs, next_cursor = AuditRepository().query(
+            entity_type="dmt_records", entity_id=dmt_id, cursor=cursor, limit=limit
+        )
+        entries = []
+        for log in logs:
+            changes = log["changes"]
+            try:
+                changes = json.loads(changes) if changes else None
+            except ValueError:
+                # Free-text notes, e.g. workflow advances
+                pass
+            entries.append({
+                "id": log["id"],
+                "action": log["action"],
+                "user_id": log["user_id"],
+                "timestamp": log["timestamp"],
+                "changes": changes,
+            })
+        return entries, next_cursor
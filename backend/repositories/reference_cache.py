@@ -0,0 +1,112 @@
+"""
+In-process cache of reference data used by the DMT forms
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config import Config, EntityType
+from database import TableVersions, fetch_dicts, get_db
+
+USERS = "users"
+
+
+def _load_table(conn, table: str) -> List[Dict]:
+    if table == USERS:
+        query = "SELECT id, username, role, is_active FROM users WHERE is_active = 1 ORDER BY username"
+    elif table == EntityType.EMPLOYEES.value:
+        query = "SELECT id, name, employee_number FROM employees WHERE is_active = 1 ORDER BY name"
+    else:
+        query = f"SELECT id, name FROM {EntityType(table).value} WHERE is_active = 1 ORDER BY name"
+    return fetch_dicts(conn, query)
+
+
+class ReferenceCache:
+    """
+    Active rows of the entity tables and the user directory, per table.
+
+    Each table is loaded once and kept until it is invalidated: directly by
+    Repository and the user helpers for writes made in this process, and
+    through ``table_versions`` for writes made by any other worker.
+    ``max_age`` is only a safety net. Every table has a version string
+    derived from its content, so ETags built from it agree across workers.
+    """
+
+    def __init__(self, max_age: float = 60.0, table_versions: Optional[TableVersions] = None):
+        self.max_age = max_age
+        self.table_versions = table_versions
+        self._lock = threading.Lock()
+        # table -> (rows, version, loaded_at)
+        self._tables: Dict[str, Tuple[List[Dict], str, float]] = {}
+        # table -> invalidation counter, to drop loads that raced a write
+        self._generation: Dict[str, int] = {}
+        if table_versions is not None:
+            table_versions.subscribe(self._on_tables_changed)
+
+    def _on_tables_changed(self, tables: Set[str]):
+        for table in tables:
+            self.invalidate(table)
+
+    def _sync(self):
+        if self.table_versions is not None:
+            self.table_versions.poll()
+
+    def _fresh(self, table: str):
+        entry = self._tables.get(table)
+        if entry and time.monotonic() - entry[2] < self.max_age:
+            return entry
+        return None
+
+    def invalidate(self, table: str):
+        """Drop a table after it was written to"""
+        with self._lock:
+            self._generation[table] = self._generation.get(table, 0) + 1
+            self._tables.pop(table, None)
+
+    def _get(self, table: str, sync: bool = True) -> Tuple[List[Dict], str]:
+        if sync:
+            self._sync()
+        entry = self._fresh(table)
+        if entry:
+            return entry[0], entry[1]
+
+        with self._lock:
+            generation = self._generation.get(table, 0)
+        with get_db().read() as conn:
+            rows = _load_table(conn, table)
+        version = hashlib.sha1(
+            json.dumps(rows, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+
+        with self._lock:
+            # Only publish if no write invalidated the table while we were loading
+            if self._generation.get(table, 0) == generation:
+                self._tables[table] = (rows, version, time.monotonic())
+        return rows, version
+
+    def get(self, table: str) -> List[Dict]:
+        """Active rows of ``table`` (an EntityType value or "users"); do not mutate"""
+        return self._get(table)[0]
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[Dict[str, List[Dict]], str]:
+        """Rows for several tables plus one combined version string for ETags"""
+        self._sync()
+        data = {}
+        versions = []
+        for table in tables:
+            data[table], version = self._get(table, sync=False)
+            versions.append(f"{table}:{version}")
+        combined = hashlib.sha1("|".join(versions).encode("utf-8")).hexdigest()[:20]
+        return data, combined
+
+
+reference_cache = ReferenceCache(
+    max_age=Config.REFERENCE_CACHE_MAX_AGE,
+    table_versions=get_db().table_versions,
+)
+
+
+def get_reference_cache() -> ReferenceCache:
+    """Get the process-wide reference data cache"""
+    return reference_cache
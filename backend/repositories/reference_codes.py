@@ -0,0 +1,180 @@
+"""
+Dictionary codes for the DMT reference columns
+"""
+import threading
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from config import EntityType
+from database import TableVersions, get_db
+
+# dmt_records column -> entity table holding its values (migration 0011)
+REFERENCE_COLUMNS = {
+    "work_center": EntityType.WORKCENTERS.value,
+    "customer": EntityType.CUSTOMERS.value,
+    "part_num": EntityType.PARTNUMBERS.value,
+    "failure_code": EntityType.FAILURE_CODES.value,
+    "disposition": EntityType.DISPOSITIONS.value,
+    "car_type": EntityType.CAR_TYPES.value,
+    "inspection_item": EntityType.INSPECTION_ITEMS.value,
+    "prepared_by": EntityType.PREPARED_BY.value,
+}
+REFERENCE_TABLES = tuple(dict.fromkeys(REFERENCE_COLUMNS.values()))
+
+
+class _Dictionary:
+    """ref -> name and id / name -> ref for every row of one entity table"""
+
+    def __init__(self, rows: Iterable[Tuple[int, str, str, Any]]):
+        self.names: Dict[int, str] = {}
+        self.by_id: Dict[str, int] = {}
+        self.by_name: Dict[str, int] = {}
+        # Active rows come last so they win a name shared with inactive ones
+        for ref, entity_id, name, _ in sorted(rows, key=lambda row: (bool(row[3]), row[0])):
+            self.names[ref] = name
+            self.by_id[entity_id] = ref
+            self.by_name[(name or "").strip().casefold()] = ref
+
+    def code(self, text: str) -> Optional[int]:
+        ref = self.by_id.get(text)
+        return ref if ref is not None else self.by_name.get(text.casefold())
+
+
+class ReferenceCodes:
+    """
+    Translates the DMT reference columns between the integer codes stored
+    in dmt_records (the entity's ``ref``) and the names shown to users.
+
+    Each entity table is loaded whole, inactive rows included, so records
+    pointing at a deleted entity still show its name. A table is dropped
+    when ``table_versions`` reports a write to it (renames from any
+    worker), and reloaded when a code is missing (an entity added since).
+    """
+
+    def __init__(self, table_versions: Optional[TableVersions] = None):
+        self.table_versions = table_versions
+        self._lock = threading.Lock()
+        self._tables: Dict[str, _Dictionary] = {}
+        # table -> invalidation counter, to drop loads that raced a write
+        self._generation: Dict[str, int] = {}
+        if table_versions is not None:
+            table_versions.subscribe(self._on_tables_changed)
+
+    def _on_tables_changed(self, tables: Set[str]):
+        for table in tables & set(REFERENCE_TABLES):
+            self.invalidate(table)
+
+    def _sync(self):
+        if self.table_versions is not None:
+            self.table_versions.poll()
+
+    def invalidate(self, table: str):
+        """Drop a table after it was written to"""
+        with self._lock:
+            self._generation[table] = self._generation.get(table, 0) + 1
+            self._tables.pop(table, None)
+
+    def versions(self) -> List[int]:
+        """table_versions counters of the entity tables, for ETags of decoded rows"""
+        if self.table_versions is None:
+            return []
+        self._sync()
+        return [self.table_versions.version(table) for table in REFERENCE_TABLES]
+
+    def _load(self, table: str, conn=None, publish: bool = True) -> _Dictionary:
+        query = f"SELECT ref, id, name, is_active FROM {table}"
+        generation = self._generation.get(table, 0)
+        if conn is not None:
+            dictionary = _Dictionary(conn.execute(query))
+        else:
+            with get_db().read() as read_conn:
+                dictionary = _Dictionary(read_conn.execute(query))
+        # Never cache what an open write transaction sees: it may roll back
+        if publish and (conn is None or not conn.in_transaction):
+            with self._lock:
+                if self._generation.get(table, 0) == generation:
+                    self._tables[table] = dictionary
+        return dictionary
+
+    def _dictionary(self, table: str, conn=None) -> _Dictionary:
+        dictionary = self._tables.get(table)
+        return dictionary if dictionary is not None else self._load(table, conn)
+
+    def decode_rows(self, rows: List[Dict], conn=None) -> List[Dict]:
+        """
+        Replace the codes in ``rows`` (in place) by entity names and return
+        them. Pass ``conn`` when already holding a read connection.
+        """
+        self._sync()
+        for column, table in REFERENCE_COLUMNS.items():
+            dictionary = None
+            reloaded = False
+            for row in rows:
+                code = row.get(column)
+                if not isinstance(code, int):
+                    continue
+                if dictionary is None:
+                    dictionary = self._dictionary(table, conn)
+                name = dictionary.names.get(code)
+                if name is None and not reloaded:
+                    dictionary = self._load(table, conn)
+                    reloaded = True
+                    name = dictionary.names.get(code)
+                row[column] = name
+        return rows
+
+    def decode(self, row: Optional[Dict], conn=None) -> Optional[Dict]:
+        """decode_rows() for a single row (None passes through)"""
+        if row is not None:
+            self.decode_rows([row], conn)
+        return row
+
+    def iter_decoded(self, rows: Iterable[Dict], batch_size: int = 500) -> Iterator[Dict]:
+        """Decode a stream of rows, ``batch_size`` at a time"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield from self.decode_rows(batch)
+                batch = []
+        if batch:
+            yield from self.decode_rows(batch)
+
+    def code(self, conn, column: str, value: Any) -> Optional[int]:
+        """
+        The code to store in ``column`` for a value given as an entity id
+        or name (None when blank). Unknown values are added to the entity
+        table as inactive rows, so ``conn`` must be a write connection; the
+        insert commits or rolls back with the caller's transaction.
+        """
+        if value is None or not str(value).strip():
+            return None
+        text = str(value).strip()
+        table = REFERENCE_COLUMNS[column]
+
+        code = self._dictionary(table).code(text)
+        if code is not None:
+            return code
+        # Added since the table was loaded, possibly earlier in this
+        # transaction: look again through conn without caching the result
+        code = self._load(table, conn, publish=False).code(text)
+        if code is not None:
+            return code
+        return conn.execute(
+            f"INSERT INTO {table} (id, name, is_active) VALUES (?, ?, 0)", (str(uuid.uuid4()), text)
+        ).lastrowid
+
+    def encode(self, conn, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of ``values`` with its reference columns turned into codes (see code())"""
+        encoded = dict(values)
+        for column in REFERENCE_COLUMNS:
+            if column in encoded:
+                encoded[column] = self.code(conn, column, encoded[column])
+        return encoded
+
+
+reference_codes = ReferenceCodes(table_versions=get_db().table_versions)
+
+
+def get_reference_codes() -> ReferenceCodes:
+    """Get the process-wide reference code dictionary"""
+    return reference_codes
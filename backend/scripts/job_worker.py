@@ -0,0 +1,85 @@
+"""
+Background job worker.
+
+Runs the queued exports and imports submitted through /api/jobs. Start it
+next to the API server, from the backend directory and with the same
+environment (DATABASE_PATH, JOB_ARTIFACTS_DIR):
+
+    python scripts/job_worker.py                 # Config.JOB_WORKERS processes
+    python scripts/job_worker.py --processes 4
+    python scripts/job_worker.py --once          # drain the queue and exit
+
+Jobs survive restarts: a job whose worker dies is picked up again once its
+lease (JOB_LEASE_SECONDS) runs out.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(stop_event=None):
+    sys.path.insert(0, BACKEND_DIR)
+    from services.job_worker import JobWorker
+    import services  # noqa: F401  (registers the job handlers)
+
+    stop = threading.Event()
+    if stop_event is not None:
+        # The parent handles Ctrl+C / SIGTERM and tells every worker through
+        # stop_event, so a job in progress finishes instead of being interrupted
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        threading.Thread(target=lambda: (stop_event.wait(), stop.set()), daemon=True).start()
+    else:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    worker = JobWorker()
+    print(f"Job worker {worker.worker_id} started")
+    worker.run_forever(stop)
+    print(f"Job worker {worker.worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: JOB_WORKERS)")
+    parser.add_argument("--once", action="store_true", help="run every ready job, then exit")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from config import Config
+
+    if args.once:
+        from services.job_worker import JobWorker
+        import services  # noqa: F401
+
+        worker = JobWorker()
+        while worker.run_once():
+            pass
+        return
+
+    processes = args.processes or Config.JOB_WORKERS
+    if processes <= 1:
+        run()
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    procs = [ctx.Process(target=run, args=(stop_event,)) for _ in range(processes)]
+    for p in procs:
+        p.start()
+
+    def shutdown(*_):
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from auth.auth import hash_password
 from database.connection import get_db
+from repositories import get_reference_codes
 from config import EntityType
 import uuid
 from datetime import datetime, timedelta
@@ -446,6 +447,26 @@ def seed_dmt_records(users):
         created_date = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
 
         try:
+            # Reference columns are stored as dictionary codes (migration 0011)
+            refs = get_reference_codes().encode(conn, {
+                "work_center": random.choice(work_centers),
+                "part_num": random.choice(part_numbers),
+                "customer": random.choice(customers),
+                "inspection_item": random.choice(
+                    ["Dimensional Check", "Visual Inspection", "Hardness Test"]
+                ),
+                "prepared_by": random.choice(["QC Inspector 1", "QC Inspector 2"]),
+                "car_type": random.choice(["Corrective Action", "Preventive Action"]),
+                "disposition": random.choice(["Use As Is", "Rework", "Scrap"]),
+                "failure_code": random.choice(
+                    [
+                        "FC-001 Dimensional",
+                        "FC-002 Surface Defect",
+                        "FC-003 Material",
+                    ]
+                ),
+            })
+
             c.execute(
                 """
                 INSERT INTO dmt_records (
@@ -460,33 +481,25 @@ def seed_dmt_records(users):
                 (
                     record_id,
                     report_number,
-                    random.choice(work_centers),
-                    random.choice(part_numbers),
+                    refs["work_center"],
+                    refs["part_num"],
                     f"OP-{random.randint(10, 50)}",
                     random.choice(employees),
                     str(random.randint(10, 500)),
-                    random.choice(customers),
+                    refs["customer"],
                     f"SO-{random.randint(1000, 9999)}",
                     f"SN-{random.randint(10000, 99999)}",
-                    random.choice(
-                        ["Dimensional Check", "Visual Inspection", "Hardness Test"]
-                    ),
+                    refs["inspection_item"],
                     created_date,
-                    random.choice(["QC Inspector 1", "QC Inspector 2"]),
+                    refs["prepared_by"],
                     f"Defect found during inspection - Issue #{i + 1}",
-                    random.choice(["Corrective Action", "Preventive Action"]),
+                    refs["car_type"],
                     f"Process analysis for defect #{i + 1}",
                     f"Root cause analysis completed for issue #{i + 1}",
                     random.choice(["john_engineer", "lisa_engineer"]),
-                    random.choice(["Use As Is", "Rework", "Scrap"]),
+                    refs["disposition"],
                     random.choice(["john_engineer", "lisa_engineer"]),
-                    random.choice(
-                        [
-                            "FC-001 Dimensional",
-                            "FC-002 Surface Defect",
-                            "FC-003 Material",
-                        ]
-                    ),
+                    refs["failure_code"],
                     status,
                     created_by["username"],
                     assigned_to["username"],
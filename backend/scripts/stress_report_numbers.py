@@ -0,0 +1,162 @@
+"""
+Concurrency check for the report number allocator.
+
+Spawns several worker processes against a scratch copy of the schema. Each
+worker creates DMT records concurrently, claiming the report number inside
+the insert transaction the way the routes do, and deliberately rolls back
+some inserts. Then it checks that:
+
+- every worker exited cleanly and every insert that was not rolled back
+  committed (the unique index on report_number turns a duplicate claim
+  into an IntegrityError that stops its worker);
+- COUNT(DISTINCT report_number) = COUNT(*), with no NULL numbers (any
+  duplicates are listed);
+- report_counter is past every number handed out.
+
+It runs once per block size, by default both claim-per-insert (1) and
+hi/lo blocks (50). It prints one line per run and exits with status 1
+if any check fails, so it can gate a build. Run it from backend/ after
+changing services/report_number_allocator.py or the write path:
+
+    python scripts/stress_report_numbers.py
+    python scripts/stress_report_numbers.py --processes 16 --records 1000 --block-size 1,10,200
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from typing import List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Rollback(Exception):
+    pass
+
+
+def worker(db_path: str, block_size: int, records: int, rollback_every: int, start_event):
+    # Configure before importing the app modules: they read the environment at import
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ["REPORT_NUMBER_BLOCK_SIZE"] = str(block_size)
+    sys.path.insert(0, BACKEND_DIR)
+    from database import get_db
+    from services import get_report_number_allocator
+
+    db = get_db()
+    allocator = get_report_number_allocator()
+    start_event.wait()
+
+    for i in range(records):
+        allocator.prefetch()
+        try:
+            with db.write() as conn:
+                number = allocator.allocate(conn)
+                conn.execute(
+                    "INSERT INTO dmt_records (id, report_number, created_by) VALUES (?, ?, ?)",
+                    (str(uuid.uuid4()), number, f"pid-{os.getpid()}"),
+                )
+                if rollback_every and i % rollback_every == 0:
+                    raise _Rollback()
+        except _Rollback:
+            pass
+
+
+def run(block_size: int, args) -> List[str]:
+    """One stress run on a fresh database; returns the failed checks"""
+    workdir = tempfile.mkdtemp(prefix="report_numbers_")
+    db_path = os.path.join(workdir, "stress.db")
+
+    # Create the schema once so workers don't all race on the first migration
+    from database.migrator import migrate
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    conn.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    start_event = ctx.Event()
+    procs = [
+        ctx.Process(
+            target=worker,
+            args=(db_path, block_size, args.records, args.rollback_every, start_event),
+        )
+        for _ in range(args.processes)
+    ]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)  # let every worker finish importing
+
+    started = time.perf_counter()
+    start_event.set()
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    conn = sqlite3.connect(db_path)
+    total, distinct, nulls, highest = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT report_number), COUNT(*) - COUNT(report_number), MAX(report_number) "
+        "FROM dmt_records"
+    ).fetchone()
+    duplicates = conn.execute(
+        "SELECT report_number, COUNT(*) FROM dmt_records GROUP BY report_number HAVING COUNT(*) > 1 "
+        "ORDER BY report_number LIMIT 10"
+    ).fetchall()
+    next_number = conn.execute("SELECT next_number FROM report_counter WHERE id = 1").fetchone()[0]
+    conn.close()
+
+    per_proc = args.records - (len(range(0, args.records, args.rollback_every)) if args.rollback_every else 0)
+    expected = per_proc * args.processes
+
+    print(
+        f"block_size={block_size}: committed={total} expected={expected} distinct={distinct} "
+        f"null={nulls} next_number={next_number} in {elapsed:.2f}s"
+    )
+
+    failures = []
+    exit_codes = [p.exitcode for p in procs if p.exitcode != 0]
+    if exit_codes:
+        failures.append(f"worker exit codes {exit_codes}")
+    if total != expected:
+        failures.append(f"{total} records committed, expected {expected}")
+    if distinct != total or duplicates:
+        failures.append(f"duplicate report numbers (number, count): {duplicates}")
+    if nulls:
+        failures.append(f"{nulls} records without a report number")
+    if highest is not None and next_number <= highest:
+        failures.append(f"report_counter at {next_number}, but {highest} was handed out")
+    return [f"block_size={block_size}: {failure}" for failure in failures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--records", type=int, default=300, help="inserts attempted per process")
+    parser.add_argument(
+        "--block-size", default="1,50", help="comma-separated hi/lo block sizes to run (1 = claim per insert)"
+    )
+    parser.add_argument("--rollback-every", type=int, default=7, help="roll back every Nth insert (0 = never)")
+    args = parser.parse_args()
+
+    # Importing the app modules opens Config.DATABASE_PATH: point it at a
+    # scratch file first. Each run then migrates its own database
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="report_numbers_"), "scratch.db")
+    sys.path.insert(0, BACKEND_DIR)
+    print(f"processes={args.processes} records/process={args.records} rollback_every={args.rollback_every}")
+
+    failures = []
+    for block_size in [int(size) for size in args.block_size.split(",") if size.strip()]:
+        failures.extend(run(block_size, args))
+
+    if failures:
+        print("FAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("OK: all report numbers are unique")
+
+
+if __name__ == "__main__":
+    main()
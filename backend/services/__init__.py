@@ -3,5 +3,18 @@ Services package initialization
 """
 from .export_service import ExportService
 from .csv_import_service import CSVImportService
+from .dashboard_stats import DashboardStats, get_dashboard_stats
+from .report_number_allocator import ReportNumberAllocator, get_report_number_allocator
+from .job_queue import JobQueue, get_job_queue
+from . import jobs  # registers the job handlers
 
-__all__ = ["ExportService", "CSVImportService"]
+__all__ = [
+    "ExportService",
+    "CSVImportService",
+    "DashboardStats",
+    "get_dashboard_stats",
+    "ReportNumberAllocator",
+    "get_report_number_allocator",
+    "JobQueue",
+    "get_job_queue",
+]
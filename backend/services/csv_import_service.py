@@ -1,16 +1,77 @@
 """
 CSV Import Service for bulk entity uploads
 """
+import codecs
 import csv
-import io
-from typing import List, Dict, Tuple
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from repositories import Repository
 from config import EntityType
 
+# Bytes read from the upload per step
+CHUNK_SIZE = 64 * 1024
+# Rows written per bulk_upsert transaction
+IMPORT_BATCH_SIZE = 5000
+# Problems kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+# Skipped names kept for the report
+MAX_REPORTED_SKIPPED = 20
+
+
+def iter_chunks(f: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Read a binary file object chunk by chunk"""
+    return iter(lambda: f.read(chunk_size), b"")
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Decode UTF-8 chunks (dropping a leading BOM) into lines ending in
+    "\\n". A character or line split across chunks is stitched back
+    together; the csv module handles "\\r\\n" and quoted newlines.
+    Raises UnicodeDecodeError on invalid UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+class ImportReport:
+    """Outcome of a streamed CSV import: counts plus the first few problems"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: List[str] = []
+        self.skipped_names: List[str] = []
+
+    def error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def as_dict(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "skipped_names": self.skipped_names,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
 
 class CSVImportService:
     """Service for importing entities from CSV files"""
-    
+
     @staticmethod
     def validate_csv_headers(headers: List[str], entity: str) -> Tuple[bool, str]:
         """Validate CSV headers match expected format"""
@@ -27,88 +88,130 @@ class CSVImportService:
         return True, ""
     
     @staticmethod
-    def parse_csv(file_content: bytes, entity: str) -> Tuple[List[Dict], List[str]]:
+    def iter_items(chunks: Iterable[bytes], entity: str, report: ImportReport) -> Iterator[Dict]:
         """
-        Parse CSV file and return list of items and any errors
-        Returns: (items, errors)
+        Validated items from CSV content given as byte chunks, one at a time.
+        Rows with problems are recorded in ``report`` and left out; header,
+        encoding or CSV syntax errors end the iteration.
         """
-        items = []
-        errors = []
-        
         try:
-            # Decode file content
-            content = file_content.decode('utf-8')
-            csv_file = io.StringIO(content)
-            reader = csv.DictReader(csv_file)
-            
+            reader = csv.DictReader(iter_lines(chunks))
+
             # Validate headers
             if not reader.fieldnames:
-                return [], ["CSV file is empty or has no headers"]
-            
+                report.error("CSV file is empty or has no headers")
+                return
+
             valid, error = CSVImportService.validate_csv_headers(reader.fieldnames, entity)
             if not valid:
-                return [], [error]
-            
+                report.error(error)
+                return
+
             # Parse rows
             for idx, row in enumerate(reader, start=2):  # Start at 2 (1 is header)
                 # Skip empty rows
                 if not any(row.values()):
                     continue
-                
+
                 # Validate required fields
-                if not row.get('name', '').strip():
-                    errors.append(f"Row {idx}: Name is required")
+                if not (row.get('name') or '').strip():
+                    report.error(f"Row {idx}: Name is required")
                     continue
-                
+
                 item = {'name': row['name'].strip()}
-                
+
                 # Add employee_number for employees
                 if entity == "employees":
-                    employee_number = row.get('employee_number', '').strip()
+                    employee_number = (row.get('employee_number') or '').strip()
                     if not employee_number:
-                        errors.append(f"Row {idx}: Employee number is required")
+                        report.error(f"Row {idx}: Employee number is required")
                         continue
                     item['employee_number'] = employee_number
-                
-                items.append(item)
-        
+
+                report.rows += 1
+                yield item
+
         except UnicodeDecodeError:
-            errors.append("File encoding error. Please ensure the file is UTF-8 encoded")
+            report.error("File encoding error. Please ensure the file is UTF-8 encoded")
         except csv.Error as e:
-            errors.append(f"CSV parsing error: {str(e)}")
-        except Exception as e:
-            errors.append(f"Unexpected error: {str(e)}")
-        
-        return items, errors
-    
+            report.error(f"CSV parsing error: {str(e)}")
+
+    @staticmethod
+    def parse_csv(file_content: bytes, entity: str) -> Tuple[List[Dict], List[str]]:
+        """
+        Parse CSV file and return list of items and any errors
+        Returns: (items, errors)
+        """
+        report = ImportReport()
+        items = list(CSVImportService.iter_items([file_content], entity, report))
+        return items, report.errors
+
     @staticmethod
-    def import_items(items: List[Dict], entity: str) -> Tuple[int, int, List[str]]:
+    def import_file(
+        f: BinaryIO,
+        entity: str,
+        user_id: Optional[str] = None,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> ImportReport:
         """
-        Import items into database
-        Returns: (success_count, skip_count, errors)
+        Import a CSV upload from a seekable binary file without loading it.
+
+        A first pass validates every row; if any row has a problem nothing
+        is imported and the report lists the problems. Otherwise a second
+        pass inserts the rows in batches of ``batch_size`` (one transaction
+        each) with Repository.bulk_upsert, skipping names that already
+        exist. Re-running an interrupted import is safe. ``progress(done,
+        total)`` is called after every batch.
         """
+        report = ImportReport()
+        for _ in CSVImportService.iter_items(iter_chunks(f), entity, report):
+            pass
+        if report.error_count or not report.rows:
+            return report
+
+        f.seek(0)
         repo = Repository(EntityType(entity))
-        success_count = 0
-        skip_count = 0
-        errors = []
-        
-        for item in items:
-            try:
-                # Check if item already exists by name
-                existing_items, _ = repo.get_all(search=item['name'])
-                if any(i['name'].lower() == item['name'].lower() for i in existing_items):
-                    skip_count += 1
-                    continue
-                
-                # Create the item
-                if entity == "employees":
-                    repo.create(item['name'], employee_number=item['employee_number'])
+        batch: List[Dict] = []
+
+        def flush():
+            results = repo.bulk_upsert(batch, user_id=user_id)
+            for result in results:
+                if result["status"] == "created":
+                    report.imported += 1
                 else:
-                    repo.create(item['name'])
-                
-                success_count += 1
-            
-            except Exception as e:
-                errors.append(f"Error importing '{item['name']}': {str(e)}")
-        
-        return success_count, skip_count, errors
+                    report.skipped += 1
+                    if len(report.skipped_names) < MAX_REPORTED_SKIPPED:
+                        report.skipped_names.append(result["name"])
+            batch.clear()
+            if progress:
+                progress(report.imported + report.skipped, report.rows)
+
+        for item in CSVImportService.iter_items(iter_chunks(f), entity, ImportReport()):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        return report
+
+    @staticmethod
+    def import_items(
+        items: List[Dict], entity: str, user_id: Optional[str] = None
+    ) -> Tuple[int, int, List[str], List[Dict]]:
+        """
+        Import items into database in a single transaction.
+        Items whose name (employee number for employees) already exists are skipped.
+        Returns: (success_count, skip_count, errors, per-row results from Repository.bulk_upsert)
+        """
+        repo = Repository(EntityType(entity))
+
+        try:
+            results = repo.bulk_upsert(items, user_id=user_id)
+        except Exception as e:
+            return 0, 0, [f"Error importing items: {str(e)}"], []
+
+        success_count = sum(1 for r in results if r["status"] == "created")
+        skip_count = len(results) - success_count
+        return success_count, skip_count, [], results
@@ -0,0 +1,117 @@
+"""
+Dashboard statistics served from an in-process snapshot
+"""
+import threading
+import time
+from typing import Dict, Optional, Set
+from config import Config, EntityType
+from database import TableVersions, get_db
+
+COUNTED_TABLES = {entity.value for entity in EntityType} | {"dmt_records"}
+
+
+class DashboardStats:
+    """
+    Snapshot of the dashboard numbers.
+
+    The underlying aggregates (row_counts, dmt_stats) are maintained by
+    triggers on every write, so rebuilding the snapshot reads a handful of
+    small rows no matter how many DMT records exist. Views within
+    ``max_age`` seconds of the last rebuild are served from memory unless
+    ``table_versions`` reports a write to a counted table; only one thread
+    rebuilds at a time, the rest keep serving the old snapshot.
+    """
+
+    def __init__(self, max_age: float = 5.0, table_versions: Optional[TableVersions] = None):
+        self.max_age = max_age
+        self.table_versions = table_versions
+        self._snapshot: Optional[Dict] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        if table_versions is not None:
+            table_versions.subscribe(self._on_tables_changed)
+
+    def _on_tables_changed(self, tables: Set[str]):
+        if tables & COUNTED_TABLES:
+            self.invalidate()
+
+    def cached(self) -> Optional[Dict]:
+        """The current snapshot if it is fresh enough, else None"""
+        if self.table_versions is not None:
+            self.table_versions.poll()
+        if self._snapshot is not None and time.monotonic() - self._built_at < self.max_age:
+            return self._snapshot
+        return None
+
+    def invalidate(self):
+        """Force the next get() to rebuild"""
+        self._built_at = 0.0
+
+    def get(self) -> Dict:
+        """Fresh-enough snapshot, rebuilding it if needed (blocking; run on the DB executor)"""
+        snapshot = self.cached()
+        if snapshot is not None:
+            return snapshot
+
+        if not self._lock.acquire(blocking=self._snapshot is None):
+            # Someone else is rebuilding; a slightly stale answer is fine
+            return self._snapshot
+        try:
+            snapshot = self.cached()
+            if snapshot is None:
+                snapshot = self._build()
+                self._snapshot = snapshot
+                self._built_at = time.monotonic()
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def _build(self) -> Dict:
+        with get_db().read() as conn:
+            counts = {
+                (row["table_name"], row["bucket"]): row["n"]
+                for row in conn.execute(
+                    "SELECT table_name, bucket, n FROM row_counts "
+                    "WHERE bucket = 'active' OR (table_name = 'dmt_records' AND bucket LIKE 'status:%')"
+                )
+            }
+            stats = {row["key"]: (row["n"], row["total"]) for row in conn.execute("SELECT key, n, total FROM dmt_stats")}
+
+            # dmt_stats keys hold the failure code's dictionary code (migration 0011)
+            failure_names = {
+                str(row["ref"]): row["name"]
+                for row in conn.execute(f"SELECT ref, name FROM {EntityType.FAILURE_CODES.value}")
+            }
+
+        rework_n, rework_total = stats.get("rework_hours", (0, 0.0))
+        _, cost_total = stats.get("non_conformance_cost", (0, 0.0))
+
+        by_failure_code = []
+        for key, (n, _) in stats.items():
+            if key.startswith("failure_code:") and n > 0:
+                code = key[len("failure_code:"):]
+                by_failure_code.append({"name": failure_names.get(code, code), "value": n})
+        by_failure_code.sort(key=lambda item: item["value"], reverse=True)
+
+        return {
+            "total_dmt": counts.get(("dmt_records", "active"), 0),
+            "open_dmt": counts.get(("dmt_records", "status:open"), 0),
+            "closed_dmt": counts.get(("dmt_records", "status:closed"), 0),
+            "avg_rework_hours": round(rework_total / rework_n, 2) if rework_n else 0.0,
+            "cost_of_non_conformance": round(cost_total, 2),
+            "dmt_by_failure_code": by_failure_code,
+            "entities": {
+                entity.value: counts.get((entity.value, "active"), 0) for entity in EntityType
+            },
+        }
+
+
+dashboard_stats = DashboardStats(
+    max_age=Config.DASHBOARD_STATS_MAX_AGE,
+    table_versions=get_db().table_versions,
+)
+
+
+def get_dashboard_stats() -> DashboardStats:
+    """Get the process-wide dashboard statistics snapshot"""
+    return dashboard_stats
@@ -3,50 +3,384 @@ Export service for data export functionality
 """
 import io
 import csv
+import itertools
 import json
+import math
+import re
+import zipfile
 from datetime import datetime
-from typing import List, Dict
+from typing import AsyncIterator, Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape
 from fastapi.responses import StreamingResponse
+from database import get_db
+
+# Flush the output buffer to the client once it holds this many characters
+FLUSH_SIZE = 64 * 1024
+
+EXCLUDED_FIELDS = {"is_active"}
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Text in these columns is written as a number cell when it parses as one
+XLSX_NUMERIC_COLUMNS = {"qty", "rework_hours", "material_scrap_cost", "others_cost"}
+# Columns whose values repeat across rows; written once to the shared string table
+XLSX_SHARED_COLUMNS = {
+    "work_center", "part_num", "operation", "employee_name", "customer", "inspection_item",
+    "prepared_by", "car_type", "disposition", "engineer", "failure_code", "responsible_dept",
+    "status", "workflow_status",
+}
+# Distinct shared strings kept; later new values are written inline
+XLSX_MAX_SHARED_STRINGS = 100_000
+# Excel limits: rows per sheet (a new sheet is started after this) and characters per cell
+XLSX_MAX_ROWS = 1_048_576
+XLSX_MAX_CELL_CHARS = 32_767
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NUMBER = re.compile(r"-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        _XML_HEADER
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        _XML_HEADER
+        + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    # Style 1 (bold) is used for the header row
+    "xl/styles.xml": (
+        _XML_HEADER
+        + f'<styleSheet xmlns="{_MAIN_NS}">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        "</styleSheet>"
+    ),
+}
+
+
+def _clean(item: Dict) -> Dict:
+    return {k: v for k, v in item.items() if k not in EXCLUDED_FIELDS}
+
+
+def _column_letter(index: int) -> str:
+    """Spreadsheet column name for a 0-based index (0 -> A, 26 -> AA)"""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file that keeps what zipfile writes until it is drained"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class _XLSXWriter:
+    """
+    Writes rows as SpreadsheetML parts into a zip as they arrive. Only the
+    shared string table (bounded by XLSX_MAX_SHARED_STRINGS) is held in memory.
+    """
+
+    def __init__(self):
+        self.sink = _ZipSink()
+        self.shared: Dict[str, int] = {}
+        self.shared_refs = 0
+        self.sheets = 0
+
+    def _text(self, value) -> str:
+        text = _XML_ILLEGAL.sub("", str(value))[:XLSX_MAX_CELL_CHARS]
+        return escape(text)
+
+    def _inline(self, ref: str, value, style: str = "") -> str:
+        text = self._text(value)
+        space = ' xml:space="preserve"' if text != text.strip() else ""
+        return f'<c r="{ref}"{style} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+    def _cell(self, ref: str, column: str, value) -> str:
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            if isinstance(value, float) and not math.isfinite(value):
+                return self._inline(ref, value)
+            return f'<c r="{ref}"><v>{value!r}</v></c>'
+        if column in XLSX_NUMERIC_COLUMNS and isinstance(value, str) and _NUMBER.fullmatch(value.strip()):
+            return f'<c r="{ref}"><v>{value.strip()}</v></c>'
+        if column in XLSX_SHARED_COLUMNS:
+            text = str(value)
+            index = self.shared.get(text)
+            if index is None and len(self.shared) < XLSX_MAX_SHARED_STRINGS:
+                index = self.shared[text] = len(self.shared)
+            if index is not None:
+                self.shared_refs += 1
+                return f'<c r="{ref}" t="s"><v>{index}</v></c>'
+        return self._inline(ref, value)
+
+    def _sheet(self, zf: zipfile.ZipFile, columns: List[str], rows: Iterator[Dict]) -> Iterator[bytes]:
+        """Write one worksheet: the header plus up to XLSX_MAX_ROWS - 1 rows"""
+        self.sheets += 1
+        letters = [_column_letter(i) for i in range(len(columns))]
+        with zf.open(f"xl/worksheets/sheet{self.sheets}.xml", "w", force_zip64=True) as part:
+            output = io.StringIO()
+            output.write(
+                _XML_HEADER + f'<worksheet xmlns="{_MAIN_NS}"><sheetViews><sheetView workbookViewId="0">'
+                '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                "</sheetView></sheetViews><sheetData>"
+            )
+            if columns:
+                output.write('<row r="1">')
+                for letter, column in zip(letters, columns):
+                    output.write(self._inline(f"{letter}1", column, ' s="1"'))
+                output.write("</row>")
+
+            r = 1
+            for item in rows:
+                r += 1
+                output.write(f'<row r="{r}">')
+                for letter, column in zip(letters, columns):
+                    value = item.get(column)
+                    if value is not None and value != "":
+                        output.write(self._cell(f"{letter}{r}", column, value))
+                output.write("</row>")
+                if output.tell() >= FLUSH_SIZE:
+                    part.write(output.getvalue().encode())
+                    output.seek(0)
+                    output.truncate()
+                    data = self.sink.drain()
+                    if data:
+                        yield data
+                if r >= XLSX_MAX_ROWS:
+                    break
+            output.write("</sheetData></worksheet>")
+            part.write(output.getvalue().encode())
+
+    def iter(self, items: Iterable[Dict]) -> Iterator[bytes]:
+        items = iter(items)
+        first = next(items, None)
+        columns = [k for k in first if k not in EXCLUDED_FIELDS] if first else []
+        rows = itertools.chain([first] if first else [], items)
+
+        with zipfile.ZipFile(self.sink, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            for name, content in _XLSX_STATIC_PARTS.items():
+                zf.writestr(name, content)
+
+            while True:
+                yield from self._sheet(zf, columns, rows)
+                # Start another sheet only if the previous one filled up
+                following = next(rows, None)
+                if following is None:
+                    break
+                rows = itertools.chain([following], rows)
+
+            with zf.open("xl/sharedStrings.xml", "w") as part:
+                output = io.StringIO()
+                output.write(
+                    _XML_HEADER + f'<sst xmlns="{_MAIN_NS}" count="{self.shared_refs}" uniqueCount="{len(self.shared)}">'
+                )
+                for text in self.shared:
+                    output.write(f"<si><t>{self._text(text)}</t></si>")
+                    if output.tell() >= FLUSH_SIZE:
+                        part.write(output.getvalue().encode())
+                        output.seek(0)
+                        output.truncate()
+                output.write("</sst>")
+                part.write(output.getvalue().encode())
+
+            sheets = "".join(
+                f'<sheet name="Sheet{n}" sheetId="{n}" r:id="rId{n}"/>' for n in range(1, self.sheets + 1)
+            )
+            zf.writestr(
+                "xl/workbook.xml",
+                _XML_HEADER + f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>{sheets}</sheets></workbook>',
+            )
+            rels = "".join(
+                f'<Relationship Id="rId{n}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+                for n in range(1, self.sheets + 1)
+            )
+            zf.writestr(
+                "xl/_rels/workbook.xml.rels",
+                _XML_HEADER
+                + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + rels
+                + f'<Relationship Id="rId{self.sheets + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+                + f'<Relationship Id="rId{self.sheets + 2}" Type="{_REL_NS}/sharedStrings" Target="sharedStrings.xml"/>'
+                + "</Relationships>",
+            )
+        yield self.sink.drain()
 
 
 class ExportService:
-    """Service for exporting data in various formats"""
-    
+    """
+    Service for exporting data in various formats.
+
+    Exporters consume any iterable of row dicts (typically Database.iter_rows)
+    and yield encoded chunks, so memory stays flat however many rows
+    are exported.
+    """
+
+    MEDIA_TYPES = {
+        "csv": "text/csv",
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+        "xlsx": XLSX_MEDIA_TYPE,
+    }
+
     @staticmethod
-    def export_json(items: List[Dict], entity: str) -> StreamingResponse:
-        """Export items as JSON"""
-        clean_items = []
+    def iter_csv(items: Iterable[Dict]) -> Iterator[bytes]:
+        """CSV lines; the header comes from the first row"""
+        output = io.StringIO()
+        writer = None
         for item in items:
-            clean_item = {k: v for k, v in item.items() if k != "is_active"}
-            clean_items.append(clean_item)
-        
-        json_str = json.dumps(clean_items, indent=2, default=str)
-        return StreamingResponse(
-            io.BytesIO(json_str.encode()),
-            media_type="application/json",
-            headers={
-                "Content-Disposition": f"attachment; filename={entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            },
-        )
-    
+            item = _clean(item)
+            if writer is None:
+                writer = csv.DictWriter(output, fieldnames=list(item.keys()), extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(item)
+            if output.tell() >= FLUSH_SIZE:
+                yield output.getvalue().encode()
+                output.seek(0)
+                output.truncate()
+        if output.tell():
+            yield output.getvalue().encode()
+
     @staticmethod
-    def export_csv(items: List[Dict], entity: str) -> StreamingResponse:
-        """Export items as CSV"""
-        clean_items = []
+    def iter_json(items: Iterable[Dict]) -> Iterator[bytes]:
+        """A JSON array written one element at a time"""
+        output = io.StringIO()
+        output.write("[")
+        separator = "\n"
         for item in items:
-            clean_item = {k: v for k, v in item.items() if k != "is_active"}
-            clean_items.append(clean_item)
-        
+            output.write(separator)
+            output.write(json.dumps(_clean(item), default=str))
+            separator = ",\n"
+            if output.tell() >= FLUSH_SIZE:
+                yield output.getvalue().encode()
+                output.seek(0)
+                output.truncate()
+        output.write("\n]\n")
+        yield output.getvalue().encode()
+
+    @staticmethod
+    def iter_ndjson(items: Iterable[Dict]) -> Iterator[bytes]:
+        """One JSON object per line"""
         output = io.StringIO()
-        if clean_items:
-            writer = csv.DictWriter(output, fieldnames=clean_items[0].keys())
-            writer.writeheader()
-            writer.writerows(clean_items)
+        for item in items:
+            output.write(json.dumps(_clean(item), default=str))
+            output.write("\n")
+            if output.tell() >= FLUSH_SIZE:
+                yield output.getvalue().encode()
+                output.seek(0)
+                output.truncate()
+        if output.tell():
+            yield output.getvalue().encode()
+
+    @staticmethod
+    def iter_xlsx(items: Iterable[Dict]) -> Iterator[bytes]:
+        """
+        An Excel workbook streamed as it is zipped: the header comes from the
+        first row, cost/hours/qty are number cells and repeated reference
+        values are stored once as shared strings. Exports over Excel's row
+        limit continue on further sheets.
+        """
+        return _XLSXWriter().iter(items)
+
+    @staticmethod
+    def iter_format(items: Iterable[Dict], format: str) -> Iterator[bytes]:
+        """Encoded chunks of items as csv, json, ndjson or xlsx"""
+        return {
+            "csv": ExportService.iter_csv,
+            "json": ExportService.iter_json,
+            "ndjson": ExportService.iter_ndjson,
+            "xlsx": ExportService.iter_xlsx,
+        }[format](items)
+
+    @staticmethod
+    def filename(entity: str, format: str) -> str:
+        """Download name for an export of entity taken now"""
+        return f"{entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
 
+    @staticmethod
+    def _response(body, entity: str, format: str) -> StreamingResponse:
         return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
-            media_type="text/csv",
+            body,
+            media_type=ExportService.MEDIA_TYPES[format],
             headers={
-                "Content-Disposition": f"attachment; filename={entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+                "Content-Disposition": f"attachment; filename={ExportService.filename(entity, format)}"
             },
         )
+
+    @staticmethod
+    def stream(items: Iterable[Dict], entity: str, format: str) -> StreamingResponse:
+        """Stream items as csv, json, ndjson or xlsx (anything else falls back to json)"""
+        if format not in ExportService.MEDIA_TYPES:
+            format = "json"
+        return ExportService._response(ExportService.iter_format(items, format), entity, format)
+
+    @staticmethod
+    async def stream_rows(items: Iterable[Dict], entity: str, format: str) -> StreamingResponse:
+        """
+        stream() for rows read lazily from the database (Repository.iter_all,
+        DMTRepository.iter_export). Rows are read and encoded on the DB
+        executor one output chunk per call (see Database.iterate), not in
+        Starlette's thread pool. The first chunk is produced before the
+        response starts, so a saturated database is still a 503.
+        """
+        if format not in ExportService.MEDIA_TYPES:
+            format = "json"
+        chunks = get_db().iterate(ExportService.iter_format(items, format))
+        first = await anext(chunks, None)
+
+        async def body() -> AsyncIterator[bytes]:
+            if first is None:
+                return
+            yield first
+            async for chunk in chunks:
+                yield chunk
+
+        return ExportService._response(body(), entity, format)
+
+    @staticmethod
+    def export_json(items: Iterable[Dict], entity: str) -> StreamingResponse:
+        """Export items as JSON"""
+        return ExportService.stream(items, entity, "json")
+
+    @staticmethod
+    def export_csv(items: Iterable[Dict], entity: str) -> StreamingResponse:
+        """Export items as CSV"""
+        return ExportService.stream(items, entity, "csv")
+
+    @staticmethod
+    def export_xlsx(items: Iterable[Dict], entity: str) -> StreamingResponse:
+        """Export items as an Excel workbook"""
+        return ExportService.stream(items, entity, "xlsx")
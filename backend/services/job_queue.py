@@ -0,0 +1,310 @@
+"""
+SQLite-backed background job queue
+"""
+import glob
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from config import Config
+from database import fetch_dict, fetch_dicts, get_db
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Minimum seconds between two progress writes from the same job
+PROGRESS_INTERVAL = 1.0
+
+
+class JobError(Exception):
+    """Raise from a handler to fail its job without retrying (bad input and the like)"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once its job has been cancelled"""
+
+
+# kind -> handler(job, ctx) returning {"path", "filename", "media_type", "summary"}
+HANDLERS: Dict[str, Callable[[Dict, "JobContext"], Dict]] = {}
+
+
+def job_handler(kind: str):
+    """Register a function as the handler for jobs of ``kind``"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobContext:
+    """Progress reporting and artifact files for the job a handler is running"""
+
+    def __init__(self, queue: "JobQueue", job: Dict):
+        self.queue = queue
+        self.job = job
+        self.params = job["params"]
+        self._last_report = 0.0
+
+    def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None, force: bool = False):
+        """
+        Record progress (at most once per PROGRESS_INTERVAL unless ``force``);
+        doubles as the job's heartbeat. Raises JobCancelled when the job was
+        cancelled or handed to another worker meanwhile.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        if not self.queue.report_progress(self.job["id"], self.job["worker_id"], done, total, message):
+            raise JobCancelled(self.job["id"])
+
+    @contextmanager
+    def open_artifact(self, suffix: str) -> Iterator:
+        """
+        Binary file for the job's result. It is written under a temporary
+        name and only renamed into place if the block completes, so a
+        failed attempt never leaves a half-written artifact behind.
+        """
+        path = self.queue.artifact_path(self.job["id"], suffix)
+        partial = path + ".part"
+        try:
+            with open(partial, "wb") as f:
+                yield f
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def artifact_path(self, suffix: str) -> str:
+        return self.queue.artifact_path(self.job["id"], suffix)
+
+
+class JobQueue:
+    """
+    Durable queue of background jobs in the jobs table (migration 0009).
+
+    The API enqueues and reads jobs; worker processes (scripts/job_worker.py)
+    claim them one at a time with a single UPDATE ... RETURNING, run the
+    registered handler and store its result file under ``artifacts_dir``.
+    A failing job is retried with exponential backoff up to
+    ``max_attempts``; a job whose worker stops sending heartbeats for
+    ``lease_seconds`` is queued again.
+    """
+
+    def __init__(
+        self,
+        artifacts_dir: str,
+        max_attempts: int = 3,
+        retry_delay: float = 10.0,
+        lease_seconds: float = 300.0,
+    ):
+        self.artifacts_dir = artifacts_dir
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.db = get_db()
+
+    def artifact_path(self, job_id: str, suffix: str) -> str:
+        """Path for a file belonging to job_id (every job file starts with its id)"""
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+        return os.path.join(self.artifacts_dir, f"{job_id}{suffix}")
+
+    @staticmethod
+    def _decode(job: Optional[Dict]) -> Optional[Dict]:
+        if job is None:
+            return None
+        job["params"] = json.loads(job["params"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def new_id(self) -> str:
+        return str(uuid.uuid4())
+
+    def enqueue(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        user_id: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        job_id: Optional[str] = None,
+    ) -> Dict:
+        """Queue a job and return it"""
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self.db.write() as conn:
+            job = fetch_dict(
+                conn,
+                "INSERT INTO jobs (id, kind, params, max_attempts, created_by) VALUES (?, ?, ?, ?, ?) RETURNING *",
+                (job_id or self.new_id(), kind, json.dumps(params), max_attempts or self.max_attempts, user_id),
+            )
+        return self._decode(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.db.read() as conn:
+            return self._decode(fetch_dict(conn, "SELECT * FROM jobs WHERE id = ?", (job_id,)))
+
+    def list(self, user_id: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Newest jobs first, optionally only those created by user_id"""
+        query = "SELECT * FROM jobs"
+        params: List[Any] = []
+        if user_id is not None:
+            query += " WHERE created_by = ?"
+            params.append(user_id)
+        query += " ORDER BY created_at DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+        with self.db.read() as conn:
+            return [self._decode(job) for job in fetch_dicts(conn, query, params)]
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        Cancel a queued or running job; a running handler stops at its next
+        progress report. Returns the job, or None if it had already finished.
+        """
+        with self.db.write() as conn:
+            job = fetch_dict(
+                conn,
+                f"""
+                UPDATE jobs SET status = '{CANCELLED}', finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('{QUEUED}', '{RUNNING}')
+                RETURNING *
+                """,
+                (job_id,),
+            )
+        return self._decode(job)
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """Atomically take the oldest runnable queued job, or None"""
+        with self.db.write() as conn:
+            job = fetch_dict(
+                conn,
+                f"""
+                UPDATE jobs
+                SET status = '{RUNNING}', attempts = attempts + 1, worker_id = ?,
+                    started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP,
+                    error = NULL
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = '{QUEUED}' AND run_after <= CURRENT_TIMESTAMP
+                    ORDER BY run_after, rowid
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                (worker_id,),
+            )
+        return self._decode(job)
+
+    def report_progress(
+        self, job_id: str, worker_id: str, done: int, total: Optional[int], message: Optional[str]
+    ) -> bool:
+        """Store progress and heartbeat; False if this worker no longer owns the running job"""
+        with self.db.write() as conn:
+            c = conn.execute(
+                f"""
+                UPDATE jobs
+                SET progress_done = ?, progress_total = COALESCE(?, progress_total),
+                    message = COALESCE(?, message), heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ? AND status = '{RUNNING}'
+                """,
+                (done, total, message, job_id, worker_id),
+            )
+            return c.rowcount > 0
+
+    def succeed(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        """Mark a job done with its artifact; False if the worker had lost the job"""
+        with self.db.write() as conn:
+            c = conn.execute(
+                f"""
+                UPDATE jobs
+                SET status = '{SUCCEEDED}', finished_at = CURRENT_TIMESTAMP,
+                    progress_done = COALESCE(progress_total, progress_done),
+                    result = ?, result_path = ?, result_name = ?, media_type = ?
+                WHERE id = ? AND worker_id = ? AND status = '{RUNNING}'
+                """,
+                (
+                    json.dumps(result.get("summary") or {}),
+                    result.get("path"),
+                    result.get("filename"),
+                    result.get("media_type"),
+                    job_id,
+                    worker_id,
+                ),
+            )
+            return c.rowcount > 0
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True) -> Optional[str]:
+        """
+        Record a failed attempt. The job is queued again after
+        retry_delay * 2^(attempts - 1) seconds while attempts remain (and
+        ``retry`` is set), otherwise it fails for good. Returns the new
+        status, or None if the worker had lost the job.
+        """
+        with self.db.write() as conn:
+            row = conn.execute(
+                f"""
+                UPDATE jobs
+                SET status = CASE WHEN ? AND attempts < max_attempts THEN '{QUEUED}' ELSE '{FAILED}' END,
+                    run_after = datetime('now', '+' || (? * (1 << (attempts - 1))) || ' seconds'),
+                    finished_at = CASE WHEN ? AND attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END,
+                    error = ?
+                WHERE id = ? AND worker_id = ? AND status = '{RUNNING}'
+                RETURNING status
+                """,
+                (retry, self.retry_delay, retry, error, job_id, worker_id),
+            ).fetchone()
+        return row["status"] if row else None
+
+    def requeue_stale(self) -> int:
+        """Hand jobs whose worker stopped sending heartbeats to another worker"""
+        with self.db.write() as conn:
+            c = conn.execute(
+                f"""
+                UPDATE jobs
+                SET status = CASE WHEN attempts < max_attempts THEN '{QUEUED}' ELSE '{FAILED}' END,
+                    finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END,
+                    error = 'Worker stopped responding'
+                WHERE status = '{RUNNING}'
+                  AND heartbeat_at < datetime('now', '-' || ? || ' seconds')
+                """,
+                (int(self.lease_seconds),),
+            )
+            return c.rowcount
+
+    def purge(self, days: int) -> int:
+        """Delete jobs finished more than ``days`` ago together with their files"""
+        with self.db.write() as conn:
+            ids = [
+                row["id"]
+                for row in conn.execute(
+                    f"""
+                    DELETE FROM jobs
+                    WHERE status IN ('{SUCCEEDED}', '{FAILED}', '{CANCELLED}')
+                      AND finished_at < datetime('now', '-' || ? || ' days')
+                    RETURNING id
+                    """,
+                    (days,),
+                )
+            ]
+        for job_id in ids:
+            for path in glob.glob(os.path.join(glob.escape(self.artifacts_dir), f"{job_id}*")):
+                os.remove(path)
+        return len(ids)
+
+
+job_queue = JobQueue(
+    Config.JOB_ARTIFACTS_DIR,
+    max_attempts=Config.JOB_MAX_ATTEMPTS,
+    retry_delay=Config.JOB_RETRY_DELAY,
+    lease_seconds=Config.JOB_LEASE_SECONDS,
+)
+
+
+def get_job_queue() -> JobQueue:
+    """Get the process-wide job queue"""
+    return job_queue
@@ -0,0 +1,96 @@
+"""
+Worker loop for the background job queue
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Optional
+from config import Config
+from auth.sessions import get_session_store
+from repositories import AuditRepository, get_audit_writer
+from .job_queue import HANDLERS, JobCancelled, JobContext, JobError, JobQueue, get_job_queue
+
+# Seconds between lease checks (and audit spool recovery) / retention
+# purges (and audit log partitioning and archival, expired sessions) done
+# by each worker
+MAINTENANCE_INTERVAL = 60.0
+PURGE_INTERVAL = 3600.0
+
+
+class JobWorker:
+    """Claims jobs from a JobQueue and runs their handlers, one at a time"""
+
+    def __init__(self, queue: Optional[JobQueue] = None, poll_interval: float = Config.JOB_POLL_INTERVAL):
+        self.queue = queue or get_job_queue()
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self._next_maintenance = 0.0
+        self._next_purge = 0.0
+
+    def run_once(self) -> bool:
+        """Run one job if any is ready; True if a job was processed"""
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+
+        job_id = job["id"]
+        handler = HANDLERS.get(job["kind"])
+        if handler is None:
+            self.queue.fail(job_id, self.worker_id, f"No handler for job kind {job['kind']!r}", retry=False)
+            return True
+
+        print(f"Job {job_id} ({job['kind']}) started, attempt {job['attempts']}/{job['max_attempts']}")
+        try:
+            result = handler(job, JobContext(self.queue, job))
+        except JobCancelled:
+            print(f"Job {job_id} cancelled")
+        except JobError as e:
+            self.queue.fail(job_id, self.worker_id, str(e), retry=False)
+            print(f"Job {job_id} failed: {e}")
+        except Exception as e:
+            traceback.print_exc()
+            status = self.queue.fail(job_id, self.worker_id, f"{type(e).__name__}: {e}")
+            print(f"Job {job_id} attempt failed ({status}): {e}")
+        else:
+            if self.queue.succeed(job_id, self.worker_id, result):
+                print(f"Job {job_id} succeeded")
+        return True
+
+    def _maintenance(self):
+        now = time.monotonic()
+        if now >= self._next_maintenance:
+            self._next_maintenance = now + MAINTENANCE_INTERVAL
+            requeued = self.queue.requeue_stale()
+            if requeued:
+                print(f"Requeued {requeued} job(s) whose worker stopped responding")
+            # Audit entries spooled by a web process that died before inserting them
+            get_audit_writer().recover()
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_INTERVAL
+            purged = self.queue.purge(Config.JOB_RETENTION_DAYS)
+            if purged:
+                print(f"Purged {purged} finished job(s)")
+            moved = AuditRepository().rotate_partitions()
+            if moved:
+                print(f"Moved {moved} audit log entries into monthly partitions")
+            archived = AuditRepository().archive_partitions()
+            if archived:
+                print(f"Archived {archived} audit log entries to {Config.AUDIT_ARCHIVE_DIR}")
+            swept = get_session_store().sweep()
+            if swept:
+                print(f"Removed {swept} expired session(s)")
+
+    def run_forever(self, stop: Optional[threading.Event] = None):
+        """Process jobs until ``stop`` is set, sleeping poll_interval when idle"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self._maintenance()
+                if not self.run_once():
+                    stop.wait(self.poll_interval)
+            except Exception:
+                # Database busy or similar: keep the worker alive and try again
+                traceback.print_exc()
+                stop.wait(self.poll_interval)
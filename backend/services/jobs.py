@@ -0,0 +1,89 @@
+"""
+Background job handlers: exports and CSV imports
+"""
+import json
+import os
+from typing import Dict, Iterable, Iterator
+from config import EntityType
+from repositories import DMTRepository, Repository
+from .csv_import_service import CSVImportService
+from .export_service import ExportService
+from .job_queue import JobContext, JobError, job_handler
+
+
+def _counted(rows: Iterable[Dict], ctx: JobContext, total: int) -> Iterator[Dict]:
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        ctx.progress(done, total)
+
+
+def _write_export(ctx: JobContext, rows: Iterable[Dict], total: int, entity: str, format: str) -> Dict:
+    if format not in ExportService.MEDIA_TYPES:
+        raise JobError(f"Invalid export format: {format}")
+
+    ctx.progress(0, total, f"Exporting {total} rows", force=True)
+    suffix = f".{format}"
+    with ctx.open_artifact(suffix) as f:
+        for chunk in ExportService.iter_format(_counted(rows, ctx, total), format):
+            f.write(chunk)
+
+    return {
+        "path": ctx.artifact_path(suffix),
+        "filename": ExportService.filename(entity, format),
+        "media_type": ExportService.MEDIA_TYPES[format],
+        "summary": {"rows": total},
+    }
+
+
+@job_handler("export_dmt")
+def export_dmt(job: Dict, ctx: JobContext) -> Dict:
+    """params: format, days (optional)"""
+    days = ctx.params.get("days")
+    repo = DMTRepository()
+    return _write_export(ctx, repo.iter_export(days), repo.export_count(days), "dmt_records", ctx.params["format"])
+
+
+@job_handler("export_entities")
+def export_entities(job: Dict, ctx: JobContext) -> Dict:
+    """params: entity, format, days (optional)"""
+    entity = ctx.params["entity"]
+    days = ctx.params.get("days")
+    repo = Repository(EntityType(entity))
+    total, _ = repo.count(days=days)
+    return _write_export(ctx, repo.iter_all(days=days), total, entity, ctx.params["format"])
+
+
+@job_handler("import_csv")
+def import_csv(job: Dict, ctx: JobContext) -> Dict:
+    """
+    params: entity, upload_path (saved by the API). Re-running after a
+    failure is safe: rows that already exist are skipped.
+    """
+    entity = ctx.params["entity"]
+    upload_path = ctx.params["upload_path"]
+    if not os.path.exists(upload_path):
+        raise JobError("Uploaded file is no longer available")
+
+    ctx.progress(0, None, "Importing CSV", force=True)
+    with open(upload_path, "rb") as f:
+        report = CSVImportService.import_file(
+            f, entity, job["created_by"], progress=lambda done, total: ctx.progress(done, total)
+        )
+    if report.error_count:
+        more = f" (and {report.error_count - 5} more)" if report.error_count > 5 else ""
+        raise JobError("CSV parsing errors: " + "; ".join(report.errors[:5]) + more)
+    if not report.rows:
+        raise JobError("No valid items found in CSV")
+
+    with ctx.open_artifact(".json") as f:
+        f.write(json.dumps(report.as_dict()).encode())
+    os.remove(upload_path)
+
+    return {
+        "path": ctx.artifact_path(".json"),
+        "filename": f"{entity}_import_results.json",
+        "media_type": "application/json",
+        "summary": {"imported": report.imported, "skipped": report.skipped},
+    }
@@ -0,0 +1,96 @@
+"""
+Report number allocation for DMT records
+"""
+import os
+import threading
+from config import Config
+from database import get_db
+
+
+class ReportNumberAllocator:
+    """
+    Hands out unique DMT report numbers from the report_counter row.
+
+    allocate(conn) must be called inside the transaction that inserts the
+    record: it claims the number with a single UPDATE ... RETURNING, so the
+    claim commits or rolls back together with the insert and two writers
+    can never receive the same number.
+
+    With ``block_size`` > 1 (hi/lo), each worker process reserves a block
+    of numbers at a time in its own committed transaction (prefetch) and
+    then serves them from memory without touching the counter. Numbers are
+    still unique across processes; a block left unused when a worker
+    exits, or a number whose insert fails, becomes a gap.
+    """
+
+    def __init__(self, block_size: int = 1):
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._next = 0
+        self._limit = 0
+
+    def _check_fork(self):
+        # A forked worker must not reuse the parent's block
+        if os.getpid() != self._pid:
+            self._reset()
+
+    @staticmethod
+    def reserve(conn, count: int = 1) -> int:
+        """Atomically claim ``count`` consecutive numbers and return the first"""
+        row = conn.execute(
+            "UPDATE report_counter SET next_number = next_number + ? WHERE id = 1 "
+            "RETURNING next_number - ?",
+            (count, count),
+        ).fetchone()
+        if row is None:
+            raise RuntimeError("report_counter is not initialized")
+        return row[0]
+
+    @property
+    def needs_refill(self) -> bool:
+        """True when hi/lo mode is on and the local block is used up"""
+        if self.block_size == 1:
+            return False
+        with self._lock:
+            self._check_fork()
+            return self._next >= self._limit
+
+    def prefetch(self):
+        """
+        Reserve a new block if the local one is used up (hi/lo mode only).
+        Runs its own write transaction, so call it before opening the
+        transaction that inserts the record.
+        """
+        if not self.needs_refill:
+            return
+        with self._refill_lock:
+            if not self.needs_refill:
+                return
+            with get_db().write() as conn:
+                start = self.reserve(conn, self.block_size)
+            with self._lock:
+                self._next, self._limit = start, start + self.block_size
+
+    def allocate(self, conn) -> int:
+        """Next report number; call inside the record's insert transaction"""
+        if self.block_size > 1:
+            with self._lock:
+                self._check_fork()
+                if self._next < self._limit:
+                    number = self._next
+                    self._next += 1
+                    return number
+        return self.reserve(conn)
+
+
+report_numbers = ReportNumberAllocator(Config.REPORT_NUMBER_BLOCK_SIZE)
+
+
+def get_report_number_allocator() -> ReportNumberAllocator:
+    """Get the process-wide report number allocator"""
+    return report_numbers
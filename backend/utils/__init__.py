@@ -2,5 +2,14 @@
 Utilities package initialization
 """
 from .helpers import get_entity_info
+from .pagination import InvalidCursorError, encode_cursor, decode_cursor, clamp_limit
+from .json_response import FastJSONResponse
 
-__all__ = ["get_entity_info"]
+__all__ = [
+    "get_entity_info",
+    "InvalidCursorError",
+    "encode_cursor",
+    "decode_cursor",
+    "clamp_limit",
+    "FastJSONResponse",
+]
@@ -0,0 +1,33 @@
+"""
+Fast JSON responses
+"""
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes, with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by orjson.
+
+    Returning a Response object (instead of a dict) also skips FastAPI's
+    jsonable_encoder pass, which walks every value of every row in Python
+    and is the most expensive step for large listings. Only use it for
+    payloads that are already plain JSON types, such as rows from
+    database.rows.fetch_dicts.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,36 @@
+"""
+Opaque cursors for keyset pagination
+"""
+import base64
+import binascii
+import json
+from typing import Any, List, Optional
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Pack the sort key of the last row on a page into an opaque token"""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Unpack a token produced by encode_cursor holding ``size`` key values"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursorError("Invalid pagination cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError("Invalid pagination cursor")
+    return values
+
+
+def clamp_limit(limit: Optional[int], default: int, maximum: int) -> int:
+    """Page size requested by the client, bounded to [1, maximum]"""
+    if not limit:
+        return default
+    return max(1, min(int(limit), maximum))
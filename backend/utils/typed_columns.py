@@ -0,0 +1,95 @@
+"""
+Typed DMT columns: which dmt_records columns hold numbers and ISO dates
+(migration 0010), and how form or API input is converted for them
+"""
+import math
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Union
+
+INTEGER_COLUMNS = ("qty",)
+REAL_COLUMNS = ("rework_hours", "material_scrap_cost", "others_cost")
+DATE_COLUMNS = ("date", "disposition_date")
+TYPED_COLUMNS = INTEGER_COLUMNS + REAL_COLUMNS + DATE_COLUMNS
+
+# "1,250.50": commas only as thousands separators, so "1,5" is rejected
+# rather than read as fifteen
+_THOUSANDS = re.compile(r"\d{1,3}(,\d{3})+(\.\d*)?")
+
+
+def parse_number(value: Any, integer: bool = False) -> Optional[Union[int, float]]:
+    """
+    A non-negative number from user input ("12", "1,250.50", "$30", 4.5);
+    None when blank. Raises ValueError for anything else.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{value!r} is not a number")
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        text = str(value).strip().lstrip("$").strip()
+        if not text:
+            return None
+        if _THOUSANDS.fullmatch(text):
+            text = text.replace(",", "")
+        try:
+            number = float(text)
+        except ValueError:
+            raise ValueError(f"{value!r} is not a number") from None
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"{value!r} is not a valid amount")
+    if integer:
+        if not number.is_integer():
+            raise ValueError(f"{value!r} is not a whole number")
+        return int(number)
+    return number
+
+
+def parse_date(value: Any) -> Optional[str]:
+    """
+    An ISO date (YYYY-MM-DD) from a date, a datetime or an ISO date or
+    datetime string; None when blank. Raises ValueError otherwise.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        if len(text) > 10 and text[10] in "T ":
+            return datetime.fromisoformat(text).date().isoformat()
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise ValueError(f"{value!r} is not a valid date (use YYYY-MM-DD)") from None
+
+
+def to_column_value(column: str, value: Any) -> Any:
+    """The value to store in a dmt_records column; untyped columns pass through"""
+    if column in INTEGER_COLUMNS:
+        return parse_number(value, integer=True)
+    if column in REAL_COLUMNS:
+        return parse_number(value)
+    if column in DATE_COLUMNS:
+        return parse_date(value)
+    return value
+
+
+def typed_dmt_values(values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of ``values`` with its typed columns converted. Raises ValueError
+    naming the first column that does not hold a valid value.
+    """
+    typed = dict(values)
+    for column in TYPED_COLUMNS:
+        if column in typed:
+            try:
+                typed[column] = to_column_value(column, typed[column])
+            except ValueError as e:
+                raise ValueError(f"Invalid {column.replace('_', ' ')}: {e}") from None
+    return typed